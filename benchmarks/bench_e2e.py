@@ -0,0 +1,162 @@
+# benchmarks/bench_e2e.py
+"""
+Benchmark end-to-end offline: corpus PDF sintético -> build_faiss -> build_rag()
+con LLM local determinista, reproducido contra `answer_fn` y contra la app FastAPI
+(/buscar) a una concurrencia objetivo.
+
+Uso:
+    python -m benchmarks.bench_e2e --docs 50 --paginas 8 --preguntas 200 --concurrencia 8 \
+        --llm-latency-ms 150 --json resultados.json [--baseline anterior.json]
+"""
+import os, sys, json, asyncio, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (
+    preparar_workspace, generar_corpus, generar_preguntas, registrar_documentos, crear_usuario_bench,
+    instalar_fake_llm, resumen_latencias, peak_rss_mb, Cronometro, log,
+)
+
+
+def _medir(fn, pregunta):
+    with Cronometro() as c:
+        fn(pregunta)
+    return c.s
+
+
+def bench_answer_fn(answer_fn, preguntas, concurrencia: int) -> dict:
+    with Cronometro() as wall, ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        lat = list(pool.map(lambda q: _medir(answer_fn, q), preguntas))
+    return resumen_latencias(lat, wall.s)
+
+
+async def _bench_http_async(app, preguntas, concurrencia: int, headers: dict):
+    import httpx
+
+    sem = asyncio.Semaphore(concurrencia)
+    lat, errores = [], 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def una(q):
+            nonlocal errores
+            async with sem:
+                with Cronometro() as c:
+                    r = await client.get("/buscar", params={"pregunta": q}, headers=headers)
+                if r.status_code != 200:
+                    errores += 1
+                lat.append(c.s)
+
+        with Cronometro() as wall:
+            await asyncio.gather(*(una(q) for q in preguntas))
+    out = resumen_latencias(lat, wall.s)
+    out["errores"] = errores
+    return out
+
+
+def bench_http(app, preguntas, concurrencia: int, headers: dict) -> dict:
+    return asyncio.run(_bench_http_async(app, preguntas, concurrencia, headers))
+
+
+def comparar(actual: dict, baseline: dict, tolerancia: float) -> list[str]:
+    """Devuelve las regresiones (p95 más alto o throughput más bajo que la tolerancia)."""
+    regresiones = []
+    for etapa in ("answer_fn", "http"):
+        a, b = actual.get(etapa) or {}, baseline.get(etapa) or {}
+        if not a or not b:
+            continue
+        if b.get("p95_ms") and a["p95_ms"] > b["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{etapa}: p95 {b['p95_ms']} -> {a['p95_ms']} ms")
+        if b.get("throughput_qps") and a["throughput_qps"] < b["throughput_qps"] * (1 - tolerancia):
+            regresiones.append(f"{etapa}: throughput {b['throughput_qps']} -> {a['throughput_qps']} qps")
+    ib, ia = baseline.get("indexado_s"), actual.get("indexado_s")
+    if ib and ia and ia > ib * (1 + tolerancia):
+        regresiones.append(f"indexado: {ib} -> {ia} s")
+    return regresiones
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=20, help="cantidad de PDFs sintéticos")
+    ap.add_argument("--paginas", type=int, default=5, help="páginas por PDF")
+    ap.add_argument("--preguntas", type=int, default=100)
+    ap.add_argument("--concurrencia", type=int, default=4)
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0, help="latencia fija del LLM stub")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workspace", default=None, help="directorio de trabajo (por defecto, uno temporal)")
+    ap.add_argument("--sin-http", action="store_true", help="omitir la pasada por FastAPI")
+    ap.add_argument("--json", dest="json_out", default=None, help="guardar resultados en JSON")
+    ap.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar")
+    ap.add_argument("--tolerancia", type=float, default=0.15, help="margen antes de marcar regresión")
+    args = ap.parse_args(argv)
+    # las rutas de salida se resuelven antes del chdir al workspace
+    args.json_out = os.path.abspath(args.json_out) if args.json_out else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    ws = preparar_workspace(args.workspace)
+    log(f"[bench] workspace: {ws}")
+
+    nombres = generar_corpus("uploads", n_docs=args.docs, paginas=args.paginas, seed=args.seed)
+    registrar_documentos(nombres)
+
+    from vectorstore_langchain import build_faiss, current_index_dir, INDEX_DIR, MANIFEST_FILE
+    with Cronometro() as t_idx:
+        shards = build_faiss(INDEX_DIR)
+    n_chunks = sum(vs.index.ntotal for vs in shards.values())
+    log(f"[bench] indexado: {len(nombres)} PDFs, {n_chunks} chunks en {t_idx.s:.2f}s")
+    with open(os.path.join(current_index_dir(INDEX_DIR), MANIFEST_FILE), "r", encoding="utf-8") as f:
+        ingesta = json.load(f).get("ingesta", {})
+    for c, st in ingesta.items():
+        log(f"[bench] ingesta {c}: " + ", ".join(
+            f"{k} {v['items_por_s']}/s" for k, v in st.items() if isinstance(v, dict) and "items_por_s" in v))
+        if "dedup_resultado" in st:
+            log(f"[bench] dedup {c}: {st['dedup_resultado']}")
+    rss_idx = peak_rss_mb()
+
+    fake = instalar_fake_llm(args.llm_latency_ms)
+    from rag_chain import build_rag
+    with Cronometro() as t_rag:
+        answer_fn = build_rag()
+
+    preguntas = generar_preguntas(args.preguntas, seed=args.seed)
+    answer_fn(preguntas[0])  # warm-up (carga perezosa de modelos)
+
+    resultados = {
+        "config": vars(args) | {"workspace": ws},
+        "chunks": n_chunks,
+        "indexado_s": round(t_idx.s, 3),
+        "ingesta": ingesta,
+        "build_rag_s": round(t_rag.s, 3),
+        "rss_pico_indexado_mb": rss_idx,
+    }
+
+    resultados["answer_fn"] = bench_answer_fn(answer_fn, preguntas, args.concurrencia)
+    log(f"[bench] answer_fn: {resultados['answer_fn']}")
+
+    if not args.sin_http:
+        import main as app_main  # construye su propio answer con el stub ya instalado
+        resultados["http"] = bench_http(app_main.app, preguntas, args.concurrencia, crear_usuario_bench())
+        log(f"[bench] http /buscar: {resultados['http']}")
+
+    resultados["llm_calls"] = fake.calls
+    from llm_routing import router
+    resultados["llm_rutas"] = router.metricas()["caminos"]
+    resultados["rss_pico_mb"] = peak_rss_mb()
+    log(f"[bench] RSS pico: {resultados['rss_pico_mb']} MB")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(resultados, base, args.tolerancia)
+        for r in regresiones:
+            log(f"[REGRESION] {r}")
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
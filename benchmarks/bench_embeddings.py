@@ -0,0 +1,112 @@
+# benchmarks/bench_embeddings.py
+"""
+Paridad y latencia de los backends de embeddings (embeddings_setup.make_embeddings)
+contra el modelo fp32 de referencia:
+
+- paridad: coseno entre el vector fp32 y el del backend para cada texto, más el
+  solapamiento del top-k recuperado por cada pregunta sobre los mismos pasajes;
+- latencia: embed_query de a una pregunta (camino crítico del chat) y
+  throughput de embed_documents (indexado).
+
+Uso:
+    python -m benchmarks.bench_embeddings --backends int8 onnx --threads 4 \
+        --pasajes 500 --preguntas 200 [--min-coseno 0.99] [--json out.json]
+"""
+import os, sys, json, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.harness import generar_pasajes, generar_preguntas, resumen_latencias, peak_rss_mb, Cronometro, log
+
+
+def _medir(emb, pasajes, preguntas) -> tuple[np.ndarray, np.ndarray, dict]:
+    emb.embed_query(preguntas[0])  # warm-up (sesión ONNX / caches de torch)
+    lat, q_vecs = [], []
+    with Cronometro() as wall_q:
+        for q in preguntas:
+            with Cronometro() as c:
+                q_vecs.append(emb.embed_query(q))
+            lat.append(c.s)
+    with Cronometro() as wall_d:
+        d_vecs = emb.embed_documents(pasajes)
+    medidas = {
+        "embed_query": resumen_latencias(lat, wall_q.s),
+        "embed_documents_s": round(wall_d.s, 3),
+        "pasajes_por_s": round(len(pasajes) / wall_d.s, 1) if wall_d.s else None,
+    }
+    return np.asarray(q_vecs, dtype=np.float32), np.asarray(d_vecs, dtype=np.float32), medidas
+
+
+def _coseno_filas(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    na = np.linalg.norm(a, axis=1)
+    nb = np.linalg.norm(b, axis=1)
+    return (a * b).sum(axis=1) / np.maximum(na * nb, 1e-12)
+
+
+def _top_k(q: np.ndarray, d: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(q @ d.T), axis=1)[:, :k]
+
+
+def paridad(ref_q, ref_d, q, d, k: int) -> dict:
+    cos = np.concatenate([_coseno_filas(ref_q, q), _coseno_filas(ref_d, d)])
+    top_ref, top = _top_k(ref_q, ref_d, k), _top_k(q, d, k)
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top_ref, top)])
+    return {
+        "coseno_medio": round(float(cos.mean()), 5),
+        "coseno_p01": round(float(np.percentile(cos, 1)), 5),
+        "coseno_min": round(float(cos.min()), 5),
+        f"overlap_top{k}": round(float(overlap), 4),
+        "top1_igual": round(float(np.mean(top_ref[:, 0] == top[:, 0])), 4),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backends", nargs="+", default=["int8", "onnx"], help="backends a comparar contra torch fp32")
+    ap.add_argument("--threads", type=int, default=0, help="hilos de inferencia (0 = por defecto)")
+    ap.add_argument("--pasajes", type=int, default=300)
+    ap.add_argument("--preguntas", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--min-coseno", type=float, default=0.99, help="coseno p01 mínimo aceptable")
+    ap.add_argument("--json", dest="json_out", default=None)
+    args = ap.parse_args(argv)
+
+    from embeddings_setup import make_embeddings, HF_MODEL
+
+    pasajes = generar_pasajes(args.pasajes, seed=args.seed)
+    preguntas = generar_preguntas(args.preguntas, seed=args.seed)
+
+    log(f"[bench] referencia: {HF_MODEL} torch fp32, threads={args.threads}")
+    ref = make_embeddings("torch", args.threads)
+    ref_q, ref_d, medidas_ref = _medir(ref, pasajes, preguntas)
+    del ref
+    resultados = {"config": vars(args) | {"modelo": HF_MODEL}, "torch": medidas_ref}
+    log(f"[bench] torch: {medidas_ref}")
+
+    fallas = []
+    for backend in args.backends:
+        emb = make_embeddings(backend, args.threads)
+        q, d, medidas = _medir(emb, pasajes, preguntas)
+        del emb
+        medidas["paridad"] = paridad(ref_q, ref_d, q, d, args.k)
+        p50_ref = medidas_ref["embed_query"]["p50_ms"]
+        medidas["speedup_query_p50"] = round(p50_ref / medidas["embed_query"]["p50_ms"], 2)
+        resultados[backend] = medidas
+        log(f"[bench] {backend}: {medidas}")
+        if medidas["paridad"]["coseno_p01"] < args.min_coseno:
+            fallas.append(f"{backend}: coseno p01 {medidas['paridad']['coseno_p01']} < {args.min_coseno}")
+
+    resultados["rss_pico_mb"] = peak_rss_mb()
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    for f_ in fallas:
+        log(f"[PARIDAD] {f_}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# benchmarks/bench_grafo.py
+"""
+Benchmark del índice de entidades del grafo (knowledge_graph.EntityIndex):
+grafo sintético de N nodos -> compilación del autómata -> detección de entidades
++ expansión por `relaciones` sobre preguntas con y sin entidades.
+
+Uso:
+    python -m benchmarks.bench_grafo --nodos 50000 --relaciones 4 --preguntas 20000 [--json out.json]
+"""
+import os, sys, json, random, argparse, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.harness import generar_preguntas, peak_rss_mb, Cronometro, log
+from knowledge_graph import EntityIndex
+
+_SILABAS = ["ca", "ser", "vi", "dor", "red", "clau", "ac", "ce", "so", "tor", "mi", "nal",
+            "co", "rre", "pro", "gra", "ma", "ter", "fi", "lo", "ban", "da", "ges", "tion"]
+
+
+def generar_grafo(n_nodos: int, relaciones: int, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    palabras = list({"".join(rng.choice(_SILABAS) for _ in range(rng.randint(2, 4))) for _ in range(n_nodos)})
+    nombres = set()
+    while len(nombres) < n_nodos:
+        nombres.add(" ".join(rng.choice(palabras) for _ in range(rng.randint(1, 3))).capitalize())
+    nombres = sorted(nombres)
+    return {
+        n: {"relaciones": rng.sample(nombres, relaciones), "descripcion": f"Nodo sintético {n}"}
+        for n in nombres
+    }
+
+
+def generar_consultas(grafo: dict, n: int, seed: int = 7) -> list[str]:
+    """Mitad preguntas del harness (sin entidades sintéticas), mitad con 1-2 nombres del grafo."""
+    rng = random.Random(seed)
+    base = generar_preguntas(n, seed=seed)
+    nombres = list(grafo)
+    out = []
+    for i, q in enumerate(base):
+        if i % 2:
+            ents = " y ".join(rng.sample(nombres, rng.randint(1, 2)))
+            q = f"¿Cómo se relaciona {ents} con el acceso? {q}"
+        out.append(q)
+    return out
+
+
+def _percentiles_us(lat_ns: list[int]) -> dict:
+    arr = np.asarray(lat_ns, dtype=np.float64) / 1e3
+    return {
+        "p50_us": round(float(np.percentile(arr, 50)), 2),
+        "p95_us": round(float(np.percentile(arr, 95)), 2),
+        "p99_us": round(float(np.percentile(arr, 99)), 2),
+        "mean_us": round(float(arr.mean()), 2),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodos", type=int, default=50000)
+    ap.add_argument("--relaciones", type=int, default=4, help="relaciones por nodo")
+    ap.add_argument("--preguntas", type=int, default=20000)
+    ap.add_argument("--max-terms", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", dest="json_out", default=None)
+    args = ap.parse_args(argv)
+
+    grafo = generar_grafo(args.nodos, args.relaciones, seed=args.seed)
+    with Cronometro() as t_build:
+        idx = EntityIndex(grafo)
+    log(f"[bench] grafo: {idx.n_nodos} nodos, {len(idx)} entidades, compilado en {t_build.s:.2f}s")
+
+    consultas = generar_consultas(grafo, args.preguntas, seed=args.seed)
+    for q in consultas[:100]:  # warm-up
+        idx.relacionados(q, max_terms=args.max_terms)
+
+    lat_match, lat_exp, con_entidades = [], [], 0
+    for q in consultas:
+        t0 = time.perf_counter_ns()
+        ents = idx.entidades(q)
+        t1 = time.perf_counter_ns()
+        idx.relacionados(q, max_terms=args.max_terms)
+        t2 = time.perf_counter_ns()
+        lat_match.append(t1 - t0)
+        lat_exp.append(t2 - t1)
+        con_entidades += bool(ents)
+
+    resultados = {
+        "config": vars(args),
+        "entidades": len(idx),
+        "estados": len(idx._goto),
+        "compilacion_s": round(t_build.s, 3),
+        "consultas_con_entidades": con_entidades,
+        "deteccion": _percentiles_us(lat_match),
+        "deteccion_y_expansion": _percentiles_us(lat_exp),
+        "rss_pico_mb": peak_rss_mb(),
+    }
+    log(f"[bench] detección: {resultados['deteccion']}")
+    log(f"[bench] detección + expansión: {resultados['deteccion_y_expansion']}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# benchmarks/bench_inferencia.py
+"""
+Modelos en cada hilo vs. servicio de inferencia compartido (inference_worker.py)
+con micro-lotes: latencia y throughput de embed_query y del rerank a una
+concurrencia dada, más el tamaño medio de lote que logró el servicio.
+
+Uso:
+    python -m benchmarks.bench_inferencia --concurrencia 16 --consultas 400 \
+        --ventana-ms 5 [--json out.json]
+"""
+import os, sys, json, time, argparse, secrets, tempfile, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import generar_pasajes, generar_preguntas, resumen_latencias, Cronometro, log
+
+
+def _correr(fn, items, concurrencia: int) -> dict:
+    def una(x):
+        with Cronometro() as c:
+            fn(x)
+        return c.s
+    fn(items[0])  # warm-up
+    with Cronometro() as wall, ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        lat = list(pool.map(una, items))
+    return resumen_latencias(lat, wall.s)
+
+
+def _medir(emb, cross, preguntas, pasajes, concurrencia: int) -> dict:
+    pares = [[(q, p) for p in pasajes[i % len(pasajes):][:16]] for i, q in enumerate(preguntas)]
+    return {
+        "embed_query": _correr(emb.embed_query, preguntas, concurrencia),
+        "rerank_16": _correr(cross.predict, pares, concurrencia),
+    }
+
+
+def _esperar_socket(cliente_cls, address: str, timeout_s: float = 300.0):
+    limite = time.monotonic() + timeout_s
+    while True:
+        try:
+            return cliente_cls(address)
+        except Exception:
+            if time.monotonic() > limite:
+                raise
+            time.sleep(0.5)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrencia", type=int, default=16)
+    ap.add_argument("--consultas", type=int, default=400)
+    ap.add_argument("--ventana-ms", type=float, default=5.0)
+    ap.add_argument("--lote-max", type=int, default=64)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--sin-local", action="store_true", help="medir sólo el servicio")
+    ap.add_argument("--json", dest="json_out", default=None)
+    args = ap.parse_args(argv)
+
+    import inference_worker as iw
+    preguntas = generar_preguntas(args.consultas, seed=args.seed)
+    pasajes = generar_pasajes(64, seed=args.seed)
+    resultados = {"config": vars(args)}
+
+    if not args.sin_local:
+        os.environ["INFERENCE_SOCKET"] = ""
+        from embeddings_setup import make_embeddings
+        from sentence_transformers import CrossEncoder
+        resultados["local"] = _medir(make_embeddings(), CrossEncoder(iw.RERANK_MODEL), preguntas, pasajes,
+                                     args.concurrencia)
+        log(f"[bench] local: {resultados['local']}")
+
+    # mkdtemp ya es privado (0700); la clave es de esta corrida
+    address = iw.DEFAULT_SOCKET if sys.platform == "win32" else os.path.join(tempfile.mkdtemp(), "inf.sock")
+    clave = os.getenv("INFERENCE_AUTHKEY") or secrets.token_hex(32)
+    proc = subprocess.Popen([sys.executable, "-m", "inference_worker", "--socket", address,
+                             "--ventana-ms", str(args.ventana_ms), "--lote-max", str(args.lote_max)],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            env={**os.environ, "INFERENCE_AUTHKEY": clave})
+    try:
+        cliente = _esperar_socket(lambda a: iw.InferenceClient(a, authkey=clave.encode("utf-8")), address)
+        resultados["servicio"] = _medir(iw.RemoteEmbeddings(cliente), iw.RemoteCrossEncoder(cliente),
+                                        preguntas, pasajes, args.concurrencia)
+        resultados["servicio"]["lotes"] = cliente.stats()
+        log(f"[bench] servicio: {resultados['servicio']}")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    if "local" in resultados:
+        for k in ("embed_query", "rerank_16"):
+            loc, srv = resultados["local"][k]["throughput_qps"], resultados["servicio"][k]["throughput_qps"]
+            if loc and srv:
+                log(f"[bench] {k}: throughput x{srv / loc:.2f} con el servicio")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# benchmarks/bench_retrieval.py
+"""
+Barrido de parámetros de recuperación (calidad vs. latencia) sobre un conjunto
+etiquetado pregunta -> (source, page).
+
+Para cada combinación arma `build_pro_retriever` (k de FAISS y de BM25, pesos y
+fusión del híbrido, top-k al rerank, top_n del cross-encoder) y corre la misma
+recuperación que el chat (`rag_chain.recuperar_contexto`: expansión, PRF y gates
+con PRF_TERMS / CHUNK_MIN_SIM / OOD_MIN_SIM), sin generación y con MultiQuery
+apagado (o con paráfrasis deterministas del LLM stub si se pide `--multiquery`).
+Informa recall@k, MRR, latencia por consulta y cuántas preguntas cortan los gates,
+y marca la configuración más barata que cumple `--min-recall`.
+
+Etiquetas (JSON o JSONL), `page` opcional (sin page: cualquier página del archivo):
+    {"pregunta": "¿Cómo me conecto a la VPN?", "relevantes": [{"source": "vpn.pdf", "page": 3}]}
+`relevantes` vacío = pregunta fuera de dominio (lo correcto es que un gate la corte).
+
+Uso:
+    # corpus sintético con etiquetas generadas
+    python -m benchmarks.bench_retrieval --docs 20 --preguntas 100 --k-dense 6 12 24 --fusion rrf score
+    # índice real
+    python -m benchmarks.bench_retrieval --indice indices --etiquetas etiquetas.jsonl \
+        --rerank-top-n 0 4 8 --chunk-min-sim 0.3 0.35 --min-recall 0.8 --json barrido.json
+"""
+import os, sys, json, argparse, itertools
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.harness import (
+    preparar_workspace, generar_corpus, generar_etiquetadas, registrar_documentos,
+    instalar_fake_llm, resumen_latencias, Cronometro, log,
+)
+
+# parámetros del retriever (se reconstruye por combinación) / del pipeline (variables de entorno)
+_RETRIEVER = ("k_dense", "k_sparse", "pesos", "fusion", "top_k", "rerank_top_n")
+_PIPELINE = {"prf_terms": "PRF_TERMS", "chunk_min_sim": "CHUNK_MIN_SIM", "ood_min_sim": "OOD_MIN_SIM"}
+
+
+def cargar_etiquetas(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        texto = f.read().strip()
+    if texto.startswith("["):
+        return json.loads(texto)
+    return [json.loads(ln) for ln in texto.splitlines() if ln.strip()]
+
+
+def _acierta(d, rel: dict) -> bool:
+    from dedup import origenes
+    return any(
+        o.get("source") == rel["source"] and (rel.get("page") is None or o.get("page") == rel["page"])
+        for o in origenes(d)
+    )
+
+
+def metricas_consulta(docs, relevantes: List[dict], ks: List[int]) -> dict:
+    """recall@k (fracción de fuentes relevantes vistas en el top-k) y reciprocal rank."""
+    primer = [next((i for i, d in enumerate(docs) if _acierta(d, r)), None) for r in relevantes]
+    rr = 1.0 / (1 + min((p for p in primer if p is not None), default=np.inf))
+    out = {f"recall@{k}": sum(p is not None and p < k for p in primer) / len(relevantes) for k in ks}
+    out["rr"] = rr
+    return out
+
+
+def evaluar(retriever, feats, etiquetadas: List[dict], ks: List[int], multiquery: bool) -> dict:
+    from rag_chain import recuperar_contexto
+
+    lat, filas = [], []
+    rechazos = ood = ood_rechazadas = 0
+    for item in etiquetadas:
+        q = item["pregunta"]
+        with Cronometro() as c:
+            docs, motivo = recuperar_contexto(
+                q, lambda consulta: retriever.invoke(consulta, multiquery=multiquery, referencia=q), feats
+            )
+        lat.append(c.s)
+        relevantes = item.get("relevantes") or []
+        if not relevantes:
+            ood += 1
+            ood_rechazadas += motivo is not None
+            continue
+        if motivo is not None:
+            rechazos += 1
+            docs = []  # el gate cortó: para el usuario no hubo contexto
+        filas.append(metricas_consulta(docs, relevantes, ks))
+
+    out = {k: round(float(np.mean([f[k] for f in filas])), 4) if filas else None for k in [f"recall@{k}" for k in ks]}
+    out["mrr"] = round(float(np.mean([f["rr"] for f in filas])), 4) if filas else None
+    out["latencia"] = resumen_latencias(lat, sum(lat))
+    out["rechazos_en_dominio"] = rechazos
+    out["ood_rechazadas"] = f"{ood_rechazadas}/{ood}"
+    return out
+
+
+def _grilla(args) -> List[Dict]:
+    ejes = {
+        "k_dense": args.k_dense, "k_sparse": args.k_sparse, "pesos": args.pesos, "fusion": args.fusion,
+        "top_k": args.top_k, "rerank_top_n": args.rerank_top_n,
+        "prf_terms": args.prf_terms, "chunk_min_sim": args.chunk_min_sim, "ood_min_sim": args.ood_min_sim,
+    }
+    combos = [dict(zip(ejes, vals)) for vals in itertools.product(*ejes.values())]
+    # agrupadas por retriever: cada uno se construye una sola vez
+    return sorted(combos, key=lambda c: [str(c[k]) for k in _RETRIEVER])
+
+
+def _etiqueta(c: dict) -> str:
+    return (f"kd={c['k_dense']} ks={c['k_sparse']} w={c['pesos']} {c['fusion']} top={c['top_k']} "
+            f"rr={c['rerank_top_n']} prf={c['prf_terms']} sim={c['chunk_min_sim']} ood={c['ood_min_sim']}")
+
+
+def tabla(filas: List[dict], ks: List[int]) -> str:
+    cols = [f"recall@{k}" for k in ks] + ["mrr", "p50_ms", "p95_ms", "rechazos", "ood"]
+    lineas = [" | ".join(["config".ljust(78)] + [c.rjust(9) for c in cols])]
+    for f in filas:
+        vals = [f[f"recall@{k}"] for k in ks] + [
+            f["mrr"], f["latencia"].get("p50_ms"), f["latencia"].get("p95_ms"),
+            f["rechazos_en_dominio"], f["ood_rechazadas"],
+        ]
+        lineas.append(" | ".join([f["config"].ljust(78)] + [str(v).rjust(9) for v in vals]))
+    return "\n".join(lineas)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--indice", default=None, help="índice existente (raíz con CURRENT o una versión)")
+    ap.add_argument("--etiquetas", default=None, help="JSON/JSONL pregunta -> relevantes")
+    ap.add_argument("--docs", type=int, default=20, help="PDFs sintéticos (sin --indice)")
+    ap.add_argument("--paginas", type=int, default=5)
+    ap.add_argument("--preguntas", type=int, default=100, help="preguntas sintéticas (sin --etiquetas)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workspace", default=None)
+    ap.add_argument("--k-dense", type=int, nargs="+", default=[12])
+    ap.add_argument("--k-sparse", type=int, nargs="+", default=[4])
+    ap.add_argument("--pesos", nargs="+", default=["0.85:0.5"], help="w_dense:w_sparse")
+    ap.add_argument("--fusion", nargs="+", default=["rrf"], choices=["rrf", "score"])
+    ap.add_argument("--top-k", type=int, nargs="+", default=[16], help="candidatos que pasan al rerank")
+    ap.add_argument("--rerank-top-n", type=int, nargs="+", default=[8], help="0 = sin rerank")
+    ap.add_argument("--prf-terms", type=int, nargs="+", default=[6])
+    ap.add_argument("--chunk-min-sim", type=float, nargs="+", default=[0.35])
+    ap.add_argument("--ood-min-sim", type=float, nargs="+", default=[0.22])
+    ap.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 8], help="cortes de recall@k")
+    ap.add_argument("--multiquery", action="store_true", help="paráfrasis del LLM stub en lugar de una sola búsqueda")
+    ap.add_argument("--min-recall", type=float, default=None, help="recall mínimo para elegir configuración")
+    ap.add_argument("--k-objetivo", type=int, default=5, help="k del recall que usa --min-recall")
+    ap.add_argument("--json", dest="json_out", default=None)
+    args = ap.parse_args(argv)
+    # las rutas se resuelven antes del chdir al workspace
+    args.json_out = os.path.abspath(args.json_out) if args.json_out else None
+    args.etiquetas = os.path.abspath(args.etiquetas) if args.etiquetas else None
+    args.indice = os.path.abspath(args.indice) if args.indice else None
+    if args.k_objetivo not in args.ks:
+        args.ks = sorted(set(args.ks) | {args.k_objetivo})
+
+    if args.indice is None:
+        ws = preparar_workspace(args.workspace)
+        log(f"[bench] workspace: {ws}")
+        nombres = generar_corpus("uploads", n_docs=args.docs, paginas=args.paginas, seed=args.seed)
+        registrar_documentos(nombres)
+        from vectorstore_langchain import build_faiss, INDEX_DIR
+        build_faiss(INDEX_DIR)
+        etiquetadas = (cargar_etiquetas(args.etiquetas) if args.etiquetas
+                       else generar_etiquetadas(nombres, args.preguntas, seed=args.seed))
+    else:
+        if not args.etiquetas:
+            ap.error("--indice requiere --etiquetas")
+        etiquetadas = cargar_etiquetas(args.etiquetas)
+
+    fake = instalar_fake_llm(0)
+    import rag_chain
+    from hybrid_search import HybridParams
+    from lexical_features import load_chunk_features
+    from retrievers import build_pro_retriever
+    from vectorstore_langchain import INDEX_DIR, LEXICON_FILE, current_index_dir, shard_dirs
+
+    raiz = args.indice or INDEX_DIR
+    index_dir = current_index_dir(raiz) if os.path.exists(os.path.join(raiz, "CURRENT")) else raiz
+    rag_chain._VOCAB = rag_chain._load_vocab(os.path.join(index_dir, LEXICON_FILE))
+    feats = load_chunk_features(list(shard_dirs(index_dir).values()), stopwords=rag_chain._STOP)
+    log(f"[bench] índice: {index_dir}, {len(etiquetadas)} preguntas etiquetadas")
+
+    filas, retriever, clave_actual = [], None, None
+    entorno_previo = {env: os.environ.get(env) for env in _PIPELINE.values()}
+    try:
+        for combo in _grilla(args):
+            clave = tuple(combo[k] for k in _RETRIEVER)
+            if clave != clave_actual:
+                w_dense, w_sparse = (float(x) for x in combo["pesos"].split(":"))
+                params = HybridParams(k_dense=combo["k_dense"], k_sparse=combo["k_sparse"], w_dense=w_dense,
+                                      w_sparse=w_sparse, fusion=combo["fusion"], top_k=combo["top_k"])
+                retriever = build_pro_retriever(faiss_dir=index_dir, llm=fake, params=params,
+                                                rerank_top_n=combo["rerank_top_n"])
+                clave_actual = clave
+            for arg, env in _PIPELINE.items():
+                os.environ[env] = str(combo[arg])
+            evaluar(retriever, feats, etiquetadas[:1], args.ks, args.multiquery)  # warm-up
+            fila = {"config": _etiqueta(combo), "params": combo}
+            fila.update(evaluar(retriever, feats, etiquetadas, args.ks, args.multiquery))
+            filas.append(fila)
+            log(f"[bench] {fila['config']}: recall@{args.k_objetivo}={fila[f'recall@{args.k_objetivo}']} "
+                f"mrr={fila['mrr']} p50={fila['latencia'].get('p50_ms')}ms")
+    finally:
+        for env, val in entorno_previo.items():
+            if val is None:
+                os.environ.pop(env, None)
+            else:
+                os.environ[env] = val
+
+    filas.sort(key=lambda f: f["latencia"].get("p50_ms") or 0.0)
+    log("\n" + tabla(filas, args.ks))
+
+    elegida: Optional[dict] = None
+    if args.min_recall is not None:
+        clave_recall = f"recall@{args.k_objetivo}"
+        elegida = next((f for f in filas if (f[clave_recall] or 0.0) >= args.min_recall), None)
+        if elegida:
+            log(f"\n[bench] más barata con {clave_recall} >= {args.min_recall}: {elegida['config']}")
+        else:
+            log(f"\n[bench] ninguna configuración llega a {clave_recall} >= {args.min_recall}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "resultados": filas, "elegida": elegida},
+                      f, ensure_ascii=False, indent=2)
+    return 0 if args.min_recall is None or elegida else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+# benchmarks/harness.py
+"""
+Piezas comunes de los benchmarks offline: corpus PDF sintético en español,
+base SQLite descartable en lugar de MySQL, LLM local determinista y
+utilidades de medición (percentiles, RSS pico).
+
+El orden importa: `preparar_workspace()` tiene que correr ANTES de importar
+cualquier módulo del backend (database, utils, vectorstore_langchain, ...),
+porque esos módulos toman `engine`/`SessionLocal` y rutas relativas al importarse.
+"""
+import os, sys, time, random, tempfile, threading
+from typing import List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# ------------------------ Corpus sintético ------------------------
+_TEMAS = [
+    ("VPN", "conectarse a la VPN corporativa", ["cliente VPN", "certificado", "token", "servidor remoto"]),
+    ("Correo", "configurar el correo corporativo", ["Outlook", "buzón", "firma", "reenvío automático"]),
+    ("Impresoras", "instalar una impresora de red", ["cola de impresión", "controlador", "dirección IP", "tóner"]),
+    ("Contraseñas", "restablecer la contraseña del dominio", ["autenticación en dos pasos", "vencimiento", "bloqueo de cuenta", "política de claves"]),
+    ("WiFi", "conectarse a la red inalámbrica", ["SSID", "red de invitados", "portal cautivo", "certificado de red"]),
+    ("Carpetas", "acceder a carpetas compartidas", ["unidad de red", "permisos", "ruta UNC", "cuota de disco"]),
+    ("Teletrabajo", "trabajar de forma remota", ["escritorio remoto", "horario", "equipo autorizado", "soporte remoto"]),
+    ("Backup", "realizar copias de seguridad", ["respaldo diario", "restauración", "retención", "disco externo"]),
+    ("Antivirus", "mantener actualizado el antivirus", ["cuarentena", "análisis completo", "firmas", "amenaza detectada"]),
+    ("Telefonía", "configurar el interno telefónico", ["softphone", "desvío de llamadas", "buzón de voz", "auriculares"]),
+]
+
+_VERBOS = ["Abrí", "Seleccioná", "Ingresá", "Verificá", "Confirmá", "Descargá", "Reiniciá", "Completá"]
+
+_RELLENO = [
+    "Ante cualquier duda comunicate con la Mesa de Ayuda al interno 4357.",
+    "Este procedimiento aplica a todos los equipos administrados por Sistemas.",
+    "No compartas tus credenciales con terceros bajo ninguna circunstancia.",
+    "Guardá una copia de la configuración antes de realizar cambios.",
+    "Si el problema persiste, registrá un ticket indicando el código de error.",
+]
+
+_FUERA_DE_DOMINIO = [
+    "¿Cuál es la capital de Australia?",
+    "¿Quién ganó el mundial de fútbol de 1986?",
+    "Dame una receta de empanadas salteñas",
+    "¿Cuántos planetas tiene el sistema solar?",
+]
+
+
+def _texto_pagina(rng: random.Random, tema: str, objetivo: str, claves: List[str], n_pasos: int) -> str:
+    lineas = [f"{tema}: cómo {objetivo}", ""]
+    for i in range(1, n_pasos + 1):
+        clave = rng.choice(claves)
+        lineas.append(f"{i}. {rng.choice(_VERBOS)} la opción de {clave} y seguí las indicaciones en pantalla.")
+    lineas.append("")
+    lineas.extend(rng.sample(_RELLENO, k=2))
+    return "\n".join(lineas)
+
+
+def generar_corpus(out_dir: str, n_docs: int = 20, paginas: int = 5, seed: int = 42) -> List[str]:
+    """Genera `n_docs` PDFs de `paginas` páginas cada uno en `out_dir`. Devuelve los nombres de archivo."""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    nombres = []
+    for i in range(n_docs):
+        tema, objetivo, claves = _TEMAS[i % len(_TEMAS)]
+        nombre = f"manual_{tema.lower()}_{i:04d}.pdf"
+        pdf = fitz.open()
+        for _ in range(paginas):
+            page = pdf.new_page()
+            texto = _texto_pagina(rng, tema, objetivo, claves, n_pasos=rng.randint(6, 14))
+            page.insert_textbox(fitz.Rect(50, 50, 545, 792), texto, fontsize=10, fontname="helv")
+        pdf.save(os.path.join(out_dir, nombre))
+        pdf.close()
+        nombres.append(nombre)
+    return nombres
+
+
+def generar_pasajes(n: int, seed: int = 42) -> List[str]:
+    """Textos del mismo estilo que las páginas del corpus, sin pasar por PDF."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        tema, objetivo, claves = _TEMAS[i % len(_TEMAS)]
+        out.append(_texto_pagina(rng, tema, objetivo, claves, n_pasos=rng.randint(4, 10)))
+    return out
+
+
+def generar_preguntas(n: int, seed: int = 7, ood_ratio: float = 0.15) -> List[str]:
+    """Preguntas sobre los temas del corpus más una fracción fuera de dominio (ejercita los gates)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if rng.random() < ood_ratio:
+            out.append(rng.choice(_FUERA_DE_DOMINIO))
+            continue
+        tema, objetivo, claves = rng.choice(_TEMAS)
+        plantilla = rng.choice([
+            "¿Cómo puedo {obj}?",
+            "Necesito {obj}, ¿qué pasos sigo?",
+            "¿Qué hago con el {clave} para {obj}?",
+            "Tengo problemas con {clave} en {tema}",
+        ])
+        out.append(plantilla.format(obj=objetivo, clave=rng.choice(claves), tema=tema))
+    return out
+
+
+def generar_etiquetadas(nombres: List[str], n: int, seed: int = 7, ood_ratio: float = 0.15) -> List[dict]:
+    """
+    Preguntas con sus fuentes relevantes sobre el corpus de `generar_corpus(nombres)`:
+    todos los PDFs del mismo tema (a nivel archivo: las páginas del sintético son
+    intercambiables). Las fuera de dominio van con `relevantes` vacío.
+    """
+    rng = random.Random(seed)
+    por_tema = {}
+    for i, nombre in enumerate(nombres):
+        por_tema.setdefault(_TEMAS[i % len(_TEMAS)][0], []).append(nombre)
+    out = []
+    for _ in range(n):
+        if rng.random() < ood_ratio:
+            out.append({"pregunta": rng.choice(_FUERA_DE_DOMINIO), "relevantes": []})
+            continue
+        tema, objetivo, claves = rng.choice([t for t in _TEMAS if t[0] in por_tema])
+        plantilla = rng.choice([
+            "¿Cómo puedo {obj}?",
+            "Necesito {obj}, ¿qué pasos sigo?",
+            "¿Qué hago con el {clave} para {obj}?",
+            "Tengo problemas con {clave} en {tema}",
+        ])
+        out.append({
+            "pregunta": plantilla.format(obj=objetivo, clave=rng.choice(claves), tema=tema),
+            "relevantes": [{"source": nombre} for nombre in por_tema[tema]],
+        })
+    return out
+
+
+# ------------------------ Workspace aislado ------------------------
+def preparar_workspace(base_dir: Optional[str] = None) -> str:
+    """
+    Crea un directorio de trabajo con uploads/ e indices/ propios, hace chdir y
+    reemplaza el engine MySQL por SQLite. Debe llamarse antes de importar el backend.
+    """
+    ws = base_dir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(ws, exist_ok=True)
+    os.chdir(ws)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import database
+
+    database.engine = create_engine(
+        f"sqlite:///{os.path.join(ws, 'bench.db')}",
+        connect_args={"check_same_thread": False},
+    )
+    database.SessionLocal = sessionmaker(
+        bind=database.engine, autocommit=False, autoflush=False, expire_on_commit=False
+    )
+
+    import models
+    models.Base.metadata.create_all(bind=database.engine)
+    return ws
+
+
+def registrar_documentos(nombres: List[str]) -> None:
+    """Inserta las filas de `documentos` que `to_documents()` usa para encontrar los PDFs."""
+    from datetime import datetime
+    import database
+    from models import Documento
+
+    with database.SessionLocal() as db:
+        for n in nombres:
+            db.add(Documento(nombre_archivo=n, fecha_subida=datetime.utcnow(), texto_limpio=""))
+        db.commit()
+
+
+def crear_usuario_bench() -> dict:
+    """Usuario sin restricción de colecciones y el header Authorization para pegarle a la API."""
+    import database
+    from auth import crear_token
+    from models import Usuario
+
+    with database.SessionLocal() as db:
+        # id explícito: en SQLite el BIGINT del modelo no es autoincremental
+        db.add(Usuario(id=1, username="bench", password_hash="-", activo=True))
+        db.commit()
+    return {"Authorization": f"Bearer {crear_token(sub='1')}"}
+
+
+# ------------------------ LLM determinista ------------------------
+def _crear_fake_llm_cls():
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class FakeChatModel(BaseChatModel):
+        """
+        Stub local: responde de forma determinista según el prompt recibido
+        (MultiQuery, generación con contexto o follow-up sobre texto base).
+        """
+        latency_s: float = 0.0
+        calls: int = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-bench"
+
+        def _responder(self, prompt: str) -> str:
+            if "Original question:" in prompt:
+                q = prompt.split("Original question:", 1)[1].strip()
+                return "\n".join([q, f"¿Cuál es el procedimiento para {q}?", f"Pasos a seguir: {q}"])
+            for marca in ("Información relevante:\n", "Texto base:\n"):
+                if marca in prompt:
+                    ctx = prompt.split(marca, 1)[1]
+                    ctx = ctx.split("\n\n", 1)[0].strip()
+                    return ctx[:400] or "Sin datos."
+            return "Respuesta de prueba."
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            self.calls += 1
+            if self.latency_s > 0:
+                time.sleep(self.latency_s)
+            prompt = "\n".join(str(m.content) for m in messages)
+            msg = AIMessage(content=self._responder(prompt))
+            return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    return FakeChatModel
+
+
+def instalar_fake_llm(latency_ms: float = 0.0):
+    """
+    Reemplaza los puntos donde el backend crea clientes ChatOpenAI por un único
+    stub local. Devuelve la instancia para poder leer `calls`.
+    """
+    import rag_chain, retrievers
+
+    fake = _crear_fake_llm_cls()(latency_s=latency_ms / 1000.0)
+    rag_chain._make_llm = lambda model_name=None: fake
+    rag_chain._make_light_llm = lambda *a, **kw: fake
+    retrievers.ChatOpenAI = lambda *a, **kw: fake
+    # sin MySQL: las consultas no resueltas sólo se cuentan
+    rag_chain.registrar_consulta_no_resuelta = lambda q: None
+    return fake
+
+
+# ------------------------ Métricas ------------------------
+def peak_rss_mb() -> Optional[float]:
+    """RSS pico del proceso en MB (None si la plataforma no expone `resource`)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS, bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def resumen_latencias(lat_s: List[float], wall_s: float) -> dict:
+    arr = np.asarray(lat_s, dtype=float) * 1000.0
+    if arr.size == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "n": int(arr.size),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(arr.mean()), 2),
+        "throughput_qps": round(arr.size / wall_s, 3) if wall_s > 0 else None,
+    }
+
+
+class Cronometro:
+    """Context manager mínimo: `with Cronometro() as c: ...; c.s`."""
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.s = time.perf_counter() - self._t0
+        return False
+
+
+_print_lock = threading.Lock()
+
+def log(msg: str) -> None:
+    with _print_lock:
+        print(msg, flush=True)
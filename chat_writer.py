@@ -0,0 +1,256 @@
+# chat_writer.py
+"""
+Write-behind de los mensajes del asistente.
+
+El request encola la respuesta y devuelve; un hilo de fondo la inserta en lotes
+multi-fila. El orden por conversación se mantiene así: cada mensaje lleva la fecha
+del momento en que se generó, y antes de que un turno nuevo de esa conversación
+escriba algo, `sincronizar(conv_id)` espera el lote en vuelo y escribe lo que siga
+pendiente (casi siempre no queda nada).
+
+La cola es del proceso: con varios workers, el turno siguiente puede caer en otro
+que no ve lo pendiente. Por eso el write-behind sólo corre con un worker
+(WEB_CONCURRENCY <= 1, o CHAT_WRITE_BEHIND=1 explícito); si no, cada respuesta se
+escribe en el request.
+
+Si la DB falla, el lote vuelve al frente de la cola y se reintenta con backoff;
+lo que siga pendiente al apagar se vuelca a CHAT_WRITE_SPILL y se reencola al
+arrancar. Sólo se descartan mensajes de conversaciones que ya no existen.
+"""
+import os, json, time, atexit, threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+import database
+from models import Mensaje
+
+CHAT_WRITE_BATCH = int(os.getenv("CHAT_WRITE_BATCH", "100"))
+CHAT_WRITE_FLUSH_SEC = float(os.getenv("CHAT_WRITE_FLUSH_SEC", "0.2"))
+CHAT_WRITE_QUEUE_MAX = int(os.getenv("CHAT_WRITE_QUEUE_MAX", "10000"))  # con la cola llena se escribe en línea
+CHAT_WRITE_RETRIES = 3
+CHAT_WRITE_BACKOFF_MAX_S = float(os.getenv("CHAT_WRITE_BACKOFF_MAX_S", "30"))
+CHAT_WRITE_SPILL = os.getenv("CHAT_WRITE_SPILL", "chat_pendientes.jsonl")
+# auto: write-behind sólo con un worker (uvicorn toma WEB_CONCURRENCY como --workers)
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "auto").lower()
+_ESPERA_MAX_S = 10.0  # tope de espera a un lote en vuelo
+
+
+def fila_mensaje(conv_id: int, rol: str, contenido: str) -> Dict:
+    # la fecha es la de la respuesta, no la del INSERT: el orden no depende de cuándo se escriba
+    return {"conversacion_id": conv_id, "rol": rol, "contenido": contenido, "fecha": datetime.utcnow()}
+
+
+def _write_behind_por_defecto() -> bool:
+    if CHAT_WRITE_BEHIND != "auto":
+        return CHAT_WRITE_BEHIND not in ("0", "false", "no")
+    return int(os.getenv("WEB_CONCURRENCY") or "1") <= 1
+
+
+class MessageWriter:
+    def __init__(self, batch_size: int = CHAT_WRITE_BATCH, flush_sec: float = CHAT_WRITE_FLUSH_SEC,
+                 maxsize: int = CHAT_WRITE_QUEUE_MAX, diferido: bool | None = None):
+        self.diferido = _write_behind_por_defecto() if diferido is None else diferido
+        self.batch_size = max(1, batch_size)
+        self.flush_sec = flush_sec
+        self.maxsize = max(1, maxsize)
+        self._cond = threading.Condition()
+        self._cola: List[Dict] = []           # FIFO global; el orden por conversación es el de encolado
+        self._en_vuelo: Counter = Counter()   # conv_id -> filas del lote que se está insertando
+        self._stop = False
+        self._thread: threading.Thread | None = None
+        self.escritos = 0
+        self.en_linea = 0
+        self.reencolados = 0
+        self.volcados = 0
+        self.perdidos = 0  # sólo filas de conversaciones borradas
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop = False
+            self._recuperar_volcados()
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+
+    def encolar(self, conv_id: int, rol: str, contenido: str) -> None:
+        """Encola la respuesta; sin write-behind la escribe ya (RuntimeError si la DB no la toma)."""
+        fila = fila_mensaje(conv_id, rol, contenido)
+        if not self.diferido:
+            if self._escribir([fila]):
+                raise RuntimeError("No se pudo guardar la respuesta del asistente")
+            self.en_linea += 1
+            return
+        if not (self._thread and self._thread.is_alive()):
+            self.start()
+        with self._cond:
+            if len(self._cola) < self.maxsize:
+                self._cola.append(fila)
+                self._cond.notify_all()
+                return
+        # cola llena: mejor pagar la latencia que perder el mensaje
+        pendientes = self._tomar(conv_id)[0] + [fila]
+        self._reencolar(self._escribir(pendientes))
+        self.en_linea += len(pendientes)
+
+    def _tomar(self, conv_id: int) -> Tuple[List[Dict], bool]:
+        """Espera el lote en vuelo de `conv_id` y saca de la cola sus filas pendientes (en orden)."""
+        with self._cond:
+            espero = bool(self._en_vuelo[conv_id])
+            self._cond.wait_for(lambda: not self._en_vuelo[conv_id], timeout=_ESPERA_MAX_S)
+            propias = [f for f in self._cola if f["conversacion_id"] == conv_id]
+            if propias:
+                self._cola = [f for f in self._cola if f["conversacion_id"] != conv_id]
+            return propias, espero
+
+    def sincronizar(self, conv_id: int) -> bool:
+        """
+        Escribe ya lo pendiente de `conv_id` (antes de un turno nuevo o de listar sus
+        mensajes). True si hubo escrituras de esa conversación: una transacción abierta
+        antes (REPEATABLE READ) no las ve y conviene cerrarla.
+        """
+        pendientes, espero = self._tomar(conv_id)
+        if pendientes:
+            fallidas = self._escribir(pendientes)
+            if fallidas:
+                self._reencolar(fallidas)
+                raise RuntimeError(f"No se pudieron escribir los mensajes pendientes de la conversación {conv_id}")
+        return espero or bool(pendientes)
+
+    def descartar(self, conv_id: int) -> None:
+        """La conversación se borra: lo pendiente ya no tiene dónde escribirse."""
+        self._tomar(conv_id)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        t = self._thread
+        if t and t.is_alive():
+            t.join(timeout)
+        if not (t and t.is_alive()):
+            self._volcar()  # sin hilo que escriba: lo pendiente queda en disco
+
+    def resumen(self) -> dict:
+        with self._cond:
+            return {"write_behind": self.diferido, "pendientes": len(self._cola), "escritos": self.escritos,
+                    "en_linea": self.en_linea, "reencolados": self.reencolados, "volcados": self.volcados,
+                    "perdidos": self.perdidos}
+
+    @staticmethod
+    def _insertar(filas: List[Dict]) -> None:
+        with database.SessionLocal() as db:
+            db.execute(insert(Mensaje), filas)  # INSERT multi-fila
+            db.commit()
+
+    def _escribir(self, filas: List[Dict]) -> List[Dict]:
+        """Inserta `filas` (reintenta errores transitorios). Devuelve las que no se pudieron escribir."""
+        for intento in range(1, CHAT_WRITE_RETRIES + 1):
+            try:
+                self._insertar(filas)
+                with self._cond:
+                    self.escritos += len(filas)
+                return []
+            except IntegrityError:
+                return self._escribir_de_a_una(filas)
+            except Exception as e:
+                print(f"[ERROR] chat_writer ({len(filas)} mensajes, intento {intento}): {type(e).__name__}: {e}")
+                if intento < CHAT_WRITE_RETRIES:
+                    time.sleep(0.2 * intento)
+        return filas
+
+    def _escribir_de_a_una(self, filas: List[Dict]) -> List[Dict]:
+        """Lote con alguna conversación ya borrada: se escriben las demás y sólo esas filas se descartan."""
+        for i, f in enumerate(filas):
+            try:
+                self._insertar([f])
+            except IntegrityError as e:
+                print(f"[WARN] chat_writer: conversación {f['conversacion_id']} sin destino, se descarta el mensaje: {e}")
+                with self._cond:
+                    self.perdidos += 1
+                continue
+            except Exception as e:
+                print(f"[ERROR] chat_writer: {type(e).__name__}: {e}")
+                return filas[i:]
+            with self._cond:
+                self.escritos += 1
+        return []
+
+    def _reencolar(self, filas: List[Dict]) -> None:
+        """Vuelven al frente de la cola, en orden: el historial no se descarta por un corte de la DB."""
+        if not filas:
+            return
+        with self._cond:
+            self._cola[:0] = filas
+            self.reencolados += len(filas)
+            self._cond.notify_all()
+
+    # ---------- volcado a disco al apagar ----------
+    def _volcar(self) -> None:
+        with self._cond:
+            filas, self._cola = self._cola, []
+            self.volcados += len(filas)
+        if not filas:
+            return
+        with open(CHAT_WRITE_SPILL, "a", encoding="utf-8") as f:
+            for fila in filas:
+                f.write(json.dumps({**fila, "fecha": fila["fecha"].isoformat()}, ensure_ascii=False) + "\n")
+        print(f"[WARN] chat_writer: {len(filas)} mensajes sin escribir volcados a {CHAT_WRITE_SPILL}")
+
+    def _recuperar_volcados(self) -> None:
+        """Reencola lo que volcó un apagado anterior (el rename lo reclama un solo proceso)."""
+        propio = f"{CHAT_WRITE_SPILL}.{os.getpid()}"
+        try:
+            os.replace(CHAT_WRITE_SPILL, propio)
+        except FileNotFoundError:
+            return
+        with open(propio, "r", encoding="utf-8") as f:
+            filas = [json.loads(linea) for linea in f if linea.strip()]
+        for fila in filas:
+            fila["fecha"] = datetime.fromisoformat(fila["fecha"])
+        self._cola[:0] = filas
+        os.remove(propio)
+        print(f"[INFO] chat_writer: {len(filas)} mensajes recuperados de {CHAT_WRITE_SPILL}")
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._cola or self._stop)
+                if backoff and not self._stop:
+                    # la DB viene fallando: se espera antes de reintentar (stop corta la espera)
+                    self._cond.wait_for(lambda: self._stop, timeout=backoff)
+                if not self._cola and self._stop:
+                    return
+                if len(self._cola) < self.batch_size and not self._stop:
+                    # junta lo que llegue en la ventana antes de ir a la DB
+                    self._cond.wait_for(lambda: len(self._cola) >= self.batch_size or self._stop,
+                                        timeout=self.flush_sec)
+                lote, self._cola = self._cola[:self.batch_size], self._cola[self.batch_size:]
+                for f in lote:
+                    self._en_vuelo[f["conversacion_id"]] += 1
+            fallidas = lote
+            try:
+                fallidas = self._escribir(lote)
+            finally:
+                with self._cond:
+                    if fallidas:
+                        self._cola[:0] = fallidas  # antes de soltar el lote: sincronizar las ve en la cola
+                        self.reencolados += len(fallidas)
+                    for f in lote:
+                        self._en_vuelo[f["conversacion_id"]] -= 1
+                    self._en_vuelo += Counter()  # quita los ceros
+                    self._cond.notify_all()
+            backoff = min(max(2 * backoff, 1.0), CHAT_WRITE_BACKOFF_MAX_S) if fallidas else 0.0
+            if fallidas and self._stop:
+                self._volcar()
+                return
+
+
+mensajes_writer = MessageWriter()
+
+atexit.register(mensajes_writer.stop)
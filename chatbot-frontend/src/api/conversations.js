@@ -11,8 +11,11 @@ export function listarConversaciones() {
   return api.get("/conversaciones").then((r) => r.data);
 }
 
-export function obtenerConversacion(convId) {
-  return api.get(`/conversaciones/${convId}`).then((r) => r.data);
+// devuelve { mensajes, siguiente_cursor }: con `cursor` trae la página anterior (más antigua)
+export function obtenerConversacion(convId, cursor = null) {
+  return api
+    .get(`/conversaciones/${convId}`, { params: cursor ? { cursor } : {} })
+    .then((r) => r.data);
 }
 
 export function agregarMensaje(convId, { rol, contenido }) {
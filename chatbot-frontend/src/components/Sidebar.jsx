@@ -6,6 +6,7 @@ import "../styles/Sidebar.css";
 function Sidebar({ onSelectConversation, selectedId }) {
   const [conversaciones, setConversaciones] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [cursor, setCursor] = useState(null); // próxima página (más antiguas)
   const navigate = useNavigate();
 
   const fetchConversaciones = useCallback(async () => {
@@ -13,6 +14,7 @@ function Sidebar({ onSelectConversation, selectedId }) {
     try {
       const res = await api.get("/conversaciones"); // lista solo las del usuario
       setConversaciones(res.data || []);
+      setCursor(res.headers["x-siguiente-cursor"] || null);
     } catch (err) {
       console.error("Error al obtener conversaciones:", err);
       if (err?.response?.status === 401) {
@@ -32,6 +34,17 @@ function Sidebar({ onSelectConversation, selectedId }) {
     return () => window.removeEventListener("reload-convs", reload);
   }, [fetchConversaciones]);
 
+  const cargarMas = async () => {
+    if (!cursor) return;
+    try {
+      const res = await api.get("/conversaciones", { params: { cursor } });
+      setConversaciones((prev) => [...prev, ...(res.data || [])]);
+      setCursor(res.headers["x-siguiente-cursor"] || null);
+    } catch (err) {
+      console.error("Error al obtener más conversaciones:", err);
+    }
+  };
+
   const handleNueva = async () => {
     try {
       // backend aceptará body opcional; envío {} para explicitar POST
@@ -78,6 +91,11 @@ function Sidebar({ onSelectConversation, selectedId }) {
               {conv.titulo || `Conv ${conv.id}`}
             </li>
           ))}
+          {cursor && (
+            <li className="conv-item conv-more" onClick={cargarMas}>
+              Cargar más…
+            </li>
+          )}
         </ul>
       )}
     </div>
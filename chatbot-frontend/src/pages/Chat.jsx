@@ -1,6 +1,7 @@
 import { useEffect, useRef, useState } from "react";
 import { Link } from "react-router-dom";
 import api from "../api/axios";
+import { obtenerConversacion } from "../api/conversations";
 import Sidebar from "../components/Sidebar";
 import { useAuth } from "../context/AuthContext";
 import "../styles/Chat.css";
@@ -9,7 +10,9 @@ function Chat() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState("");
   const [sending, setSending] = useState(false);
+  const [msgCursor, setMsgCursor] = useState(null); // mensajes más antiguos por cargar
   const messagesEndRef = useRef(null);
+  const skipScrollRef = useRef(false); // al anteponer mensajes viejos no bajamos al final
   const [chatId, setChatId] = useState(() => {
     const saved = localStorage.getItem("activeConvId");
     return saved ? Number(saved) : null;
@@ -21,23 +24,41 @@ function Chat() {
   };
 
   useEffect(() => {
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
+  const toMessages = (mensajes) =>
+    (mensajes || []).map((m) => ({ role: m.rol, content: m.contenido }));
+
   // cargar mensajes de una conversación seleccionada (desde Sidebar)
   const handleSelectConversation = async (id) => {
     setChatId(id);
     localStorage.setItem("activeConvId", String(id));
     try {
-      const res = await api.get(`/conversaciones/${id}`);
-      const msgs = (res.data.mensajes || []).map((m) => ({
-        role: m.rol,
-        content: m.contenido,
-      }));
-      setMessages(msgs);
+      const data = await obtenerConversacion(id);
+      setMessages(toMessages(data.mensajes));
+      setMsgCursor(data.siguiente_cursor || null);
     } catch (err) {
       console.error("Error al cargar mensajes:", err);
       setMessages([]);
+      setMsgCursor(null);
+    }
+  };
+
+  // página anterior (más antigua) de la conversación activa
+  const cargarAnteriores = async () => {
+    if (!chatId || !msgCursor) return;
+    try {
+      const data = await obtenerConversacion(chatId, msgCursor);
+      skipScrollRef.current = true;
+      setMessages((prev) => [...toMessages(data.mensajes), ...prev]);
+      setMsgCursor(data.siguiente_cursor || null);
+    } catch (err) {
+      console.error("Error al cargar mensajes anteriores:", err);
     }
   };
 
@@ -48,6 +69,7 @@ function Chat() {
     setChatId(data.id);
     localStorage.setItem("activeConvId", String(data.id));
     setMessages([]);
+    setMsgCursor(null);
     return data.id;
   };
 
@@ -124,6 +146,11 @@ function Chat() {
         </div>
 
         <div className="chat-box">
+          {msgCursor && (
+            <button className="load-older" onClick={cargarAnteriores}>
+              Cargar mensajes anteriores
+            </button>
+          )}
           {messages.map((msg, index) => (
             <div key={index} className={`message ${msg.role}`}>
               <div style={{ whiteSpace: "pre-wrap" }}>{msg.content}</div>
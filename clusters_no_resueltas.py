@@ -0,0 +1,324 @@
+# clusters_no_resueltas.py
+"""
+Agrupa las consultas no resueltas por tema para el Help Desk: qué documentos faltan.
+
+  1. Lee `consultas_no_resueltas` y junta las preguntas idénticas (normalizadas).
+  2. Embebe las únicas con `dense.embed_documents` en lotes grandes. Los vectores se
+     guardan en un .npz por hash de la pregunta (y modelo): una corrida nueva sólo
+     embebe lo que no vio antes.
+  3. K-means esférico mini-batch en NumPy (coseno; cada pregunta pesa lo que se repite),
+     vectorizado por bloques: escala a 100k+ preguntas sin cargar una matriz n×n.
+  4. Clusters ordenados por cantidad de consultas, con las preguntas más cercanas al
+     centroide como representativas y los términos que los distinguen.
+
+    python -m clusters_no_resueltas [--k 0] [--top 50] [--desde 2026-01-01] [--json out.json]
+
+El reporte queda en CLUSTER_REPORTE; /admin/no-resueltas/clusters lo devuelve y puede relanzar el job.
+"""
+import os, re, sys, json, time, hashlib, argparse, threading, unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+CLUSTER_CACHE = os.getenv("CLUSTER_CACHE", os.path.join("cache", "no_resueltas_emb.npz"))
+CLUSTER_REPORTE = os.getenv("CLUSTER_REPORTE", os.path.join("cache", "no_resueltas_clusters.json"))
+CLUSTER_EMBED_BATCH = int(os.getenv("CLUSTER_EMBED_BATCH", "256"))
+CLUSTER_K = int(os.getenv("CLUSTER_K", "0"))              # 0 = automático (~sqrt(n/2))
+CLUSTER_MAX_K = int(os.getenv("CLUSTER_MAX_K", "400"))
+CLUSTER_ITER = int(os.getenv("CLUSTER_ITER", "100"))      # mini-batches
+CLUSTER_BATCH = int(os.getenv("CLUSTER_BATCH", "2048"))   # preguntas por mini-batch
+CLUSTER_REPRESENTATIVAS = 5
+_BLOQUE = 8192          # filas por bloque al asignar (memoria acotada: bloque × k)
+_MUESTRA_INIT = 20000   # k-means++ sobre una muestra
+
+_WORD = re.compile(r"[a-z0-9ñ]{4,}")
+
+
+def _norm(s: str) -> str:
+    s = unicodedata.normalize("NFD", (s or "").lower())
+    s = "".join(c for c in s if unicodedata.category(c) != "Mn")
+    return " ".join(re.sub(r"[^\w\s]", " ", s).split())
+
+
+def _hash(q_norm: str) -> str:
+    return hashlib.sha1(q_norm.encode("utf-8")).hexdigest()[:16]
+
+
+# ------------------------ Datos ------------------------
+def leer_no_resueltas(desde: Optional[datetime] = None) -> List[Tuple[str, datetime]]:
+    import database
+    sql = "SELECT pregunta, fecha FROM consultas_no_resueltas"
+    params = {}
+    if desde is not None:
+        sql += " WHERE fecha >= :desde"
+        params["desde"] = desde
+    with database.engine.connect() as conn:
+        return [(p, f) for p, f in conn.execute(text(sql), params) if p and p.strip()]
+
+
+def agrupar_identicas(filas: Sequence[Tuple[str, Optional[datetime]]]):
+    """(textos únicos, hashes, repeticiones, última fecha) juntando preguntas iguales salvo tildes/puntuación."""
+    pos: Dict[str, int] = {}
+    textos, hashes, conteo, ultima = [], [], [], []
+    for pregunta, fecha in filas:
+        h = _hash(_norm(pregunta))
+        i = pos.get(h)
+        if i is None:
+            pos[h] = len(textos)
+            textos.append(pregunta.strip())
+            hashes.append(h)
+            conteo.append(1)
+            ultima.append(fecha)
+        else:
+            conteo[i] += 1
+            if fecha is not None and (ultima[i] is None or fecha > ultima[i]):
+                ultima[i] = fecha
+    return textos, hashes, np.asarray(conteo, dtype=np.float32), ultima
+
+
+# ------------------------ Embeddings con cache ------------------------
+class CacheEmbeddings:
+    """Vectores por hash de pregunta en un .npz; se invalida entero si cambia el modelo."""
+
+    def __init__(self, path: str = CLUSTER_CACHE, modelo: str = ""):
+        self.path, self.modelo = path, modelo
+        self.hashes: List[str] = []
+        self.vecs: Optional[np.ndarray] = None
+        if os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as z:
+                    if str(z["modelo"]) == modelo:
+                        self.hashes = [str(h) for h in z["hashes"]]
+                        self.vecs = z["vecs"].astype(np.float32)
+            except Exception as e:
+                print(f"[WARN] cache de embeddings {path}: {type(e).__name__}: {e}; se recalcula.")
+                self.hashes, self.vecs = [], None
+
+    def vectores(self, textos: Sequence[str], hashes: Sequence[str], emb,
+                 batch: int = CLUSTER_EMBED_BATCH) -> Tuple[np.ndarray, int]:
+        """Matriz (n×d) alineada con `textos` y cuántos hubo que embeber."""
+        pos = {h: i for i, h in enumerate(self.hashes)}
+        faltan = [i for i, h in enumerate(hashes) if h not in pos]
+        nuevos = []
+        for j in range(0, len(faltan), max(1, batch)):
+            lote = [textos[i] for i in faltan[j:j + batch]]
+            nuevos.append(np.asarray(emb.embed_documents(lote), dtype=np.float32))
+        if nuevos:
+            nuevos = np.vstack(nuevos)
+            base = len(self.hashes)
+            self.hashes.extend(hashes[i] for i in faltan)
+            self.vecs = nuevos if self.vecs is None else np.vstack([self.vecs, nuevos])
+            pos.update({hashes[i]: base + k for k, i in enumerate(faltan)})
+            self._guardar()
+        if not hashes:
+            return np.zeros((0, 0), dtype=np.float32), 0
+        return self.vecs[[pos[h] for h in hashes]], len(faltan)
+
+    def _guardar(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, modelo=np.array(self.modelo), hashes=np.array(self.hashes), vecs=self.vecs)
+        os.replace(tmp, self.path)  # atómico: un job cortado no deja el cache a medias
+
+
+# ------------------------ K-means esférico mini-batch ------------------------
+def _normalizar(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return m / n
+
+
+def asignar(X: np.ndarray, C: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Centroide más cercano (coseno) y su similitud, por bloques."""
+    etiquetas = np.empty(len(X), dtype=np.int64)
+    sims = np.empty(len(X), dtype=np.float32)
+    for i in range(0, len(X), _BLOQUE):
+        s = X[i:i + _BLOQUE] @ C.T
+        etiquetas[i:i + _BLOQUE] = s.argmax(axis=1)
+        sims[i:i + _BLOQUE] = s[np.arange(len(s)), etiquetas[i:i + _BLOQUE]]
+    return etiquetas, sims
+
+
+def _kmeanspp(X: np.ndarray, pesos: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Semillas k-means++ (distancia coseno) sobre una muestra ponderada."""
+    p = pesos / pesos.sum()
+    muestra = rng.choice(len(X), size=min(len(X), _MUESTRA_INIT), replace=False, p=p) \
+        if len(X) > _MUESTRA_INIT else np.arange(len(X))
+    S, w = X[muestra], pesos[muestra]
+    elegidos = [int(rng.choice(len(S), p=w / w.sum()))]
+    dist = np.maximum(1.0 - S @ S[elegidos[0]], 0.0)
+    for _ in range(1, k):
+        d = dist * w
+        tot = d.sum()
+        if tot <= 0:
+            break  # quedan sólo duplicados de las semillas
+        elegidos.append(int(rng.choice(len(S), p=d / tot)))
+        dist = np.minimum(dist, np.maximum(1.0 - S @ S[elegidos[-1]], 0.0))
+    return S[elegidos].copy()
+
+
+def kmeans_esferico(X: np.ndarray, k: int, pesos: Optional[np.ndarray] = None, iteraciones: int = CLUSTER_ITER,
+                    batch: int = CLUSTER_BATCH, seed: int = 42) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mini-batch k-means (Sculley, 2010) sobre vectores normalizados; cada centroide se
+    vuelve a normalizar tras cada paso. Devuelve (centroides, etiquetas, similitud).
+    """
+    X = _normalizar(np.asarray(X, dtype=np.float32))
+    pesos = np.ones(len(X), dtype=np.float32) if pesos is None else np.asarray(pesos, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(X)))
+    C = _kmeanspp(X, pesos, k, rng)
+    k = len(C)
+    vistos = np.zeros(k, dtype=np.float64)  # peso acumulado por centroide (tasa de aprendizaje 1/v)
+    for _ in range(iteraciones if len(X) > k else 0):
+        idx = rng.integers(0, len(X), size=min(batch, len(X)))
+        Xb, wb = X[idx], pesos[idx]
+        lab = (Xb @ C.T).argmax(axis=1)
+        suma = np.zeros_like(C)
+        np.add.at(suma, lab, Xb * wb[:, None])
+        n = np.bincount(lab, weights=wb, minlength=k)
+        vistos += n
+        act = n > 0
+        C[act] += (suma[act] - n[act, None] * C[act]) / vistos[act, None].astype(np.float32)
+        C = _normalizar(C)
+    etiquetas, sims = asignar(X, C)
+    return C, etiquetas, sims
+
+
+def k_automatico(n: int) -> int:
+    return int(min(CLUSTER_MAX_K, max(2, round(np.sqrt(n / 2)))))
+
+
+# ------------------------ Reporte ------------------------
+def _terminos(textos: Sequence[str], etiquetas: np.ndarray, conteo: np.ndarray, top: int = 5) -> Dict[int, List[str]]:
+    """Términos frecuentes en el cluster y raros fuera de él (frecuencia relativa vs. global)."""
+    por_cluster: Dict[int, Counter] = defaultdict(Counter)
+    global_ = Counter()
+    for t, lab, w in zip(textos, etiquetas.tolist(), conteo.tolist()):
+        toks = set(_WORD.findall(_norm(t)))
+        for tok in toks:
+            por_cluster[lab][tok] += w
+            global_[tok] += w
+    total = float(conteo.sum()) or 1.0
+    out = {}
+    for lab, c in por_cluster.items():
+        tam = float(conteo[etiquetas == lab].sum()) or 1.0
+        puntaje = {tok: (n / tam) * np.log1p(n) / (global_[tok] / total) for tok, n in c.items() if n >= 2 or tam < 2}
+        out[lab] = [tok for tok, _ in sorted(puntaje.items(), key=lambda x: x[1], reverse=True)[:top]]
+    return out
+
+
+def agrupar_no_resueltas(filas: Optional[Sequence[Tuple[str, Optional[datetime]]]] = None, k: Optional[int] = None,
+                         top: int = 50, desde: Optional[datetime] = None, emb=None,
+                         cache_path: str = CLUSTER_CACHE) -> dict:
+    """Reporte de clusters (ordenados por cantidad de consultas). `filas` por defecto: la tabla."""
+    t0 = time.perf_counter()
+    filas = leer_no_resueltas(desde) if filas is None else filas
+    textos, hashes, conteo, ultima = agrupar_identicas(filas)
+    reporte = {"generado": datetime.utcnow().isoformat(timespec="seconds"), "consultas": len(filas),
+               "unicas": len(textos), "k": 0, "embebidas_nuevas": 0, "clusters": []}
+    if not textos:
+        return reporte
+    if emb is None:
+        from embeddings_setup import dense as emb, HF_MODEL as modelo
+    else:
+        modelo = getattr(emb, "model_name", type(emb).__name__)
+    t1 = time.perf_counter()
+    X, nuevas = CacheEmbeddings(cache_path, modelo).vectores(textos, hashes, emb)
+    t2 = time.perf_counter()
+    k = k or CLUSTER_K or k_automatico(len(textos))
+    C, etiquetas, sims = kmeans_esferico(X, k, pesos=conteo)
+    t3 = time.perf_counter()
+
+    terminos = _terminos(textos, etiquetas, conteo)
+    clusters = []
+    for lab in np.unique(etiquetas):
+        miembros = np.flatnonzero(etiquetas == lab)
+        w = conteo[miembros]
+        # representativas: las más cercanas al centroide; a igual distancia, las más repetidas
+        orden = miembros[np.lexsort((-w, -sims[miembros]))][:CLUSTER_REPRESENTATIVAS]
+        fechas = [ultima[i] for i in miembros if ultima[i] is not None]
+        clusters.append({
+            "consultas": int(w.sum()),
+            "unicas": int(len(miembros)),
+            "cohesion": round(float(np.average(sims[miembros], weights=w)), 3),
+            "terminos": terminos.get(int(lab), []),
+            "representativas": [{"pregunta": textos[i], "veces": int(conteo[i])} for i in orden],
+            "ultima": max(fechas).isoformat(timespec="seconds") if fechas else None,
+        })
+    clusters.sort(key=lambda c: (c["consultas"], c["cohesion"]), reverse=True)
+    for i, c in enumerate(clusters):
+        c["id"] = i
+    reporte.update({
+        "k": int(len(C)),
+        "embebidas_nuevas": nuevas,
+        "clusters": clusters[:top] if top else clusters,
+        "tiempos_s": {"lectura": round(t1 - t0, 3), "embeddings": round(t2 - t1, 3), "kmeans": round(t3 - t2, 3),
+                      "total": round(time.perf_counter() - t0, 3)},
+    })
+    return reporte
+
+
+# ------------------------ Job ------------------------
+_job_lock = threading.Lock()
+
+
+def guardar_reporte(reporte: dict, path: str = CLUSTER_REPORTE) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def leer_reporte(path: str = CLUSTER_REPORTE) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def job_en_curso() -> bool:
+    return _job_lock.locked()
+
+
+def correr_job(k: Optional[int] = None, top: int = 0, desde: Optional[datetime] = None) -> Optional[dict]:
+    """Recalcula y guarda el reporte; None si ya hay un job corriendo en este proceso."""
+    if not _job_lock.acquire(blocking=False):
+        return None
+    try:
+        reporte = agrupar_no_resueltas(k=k, top=top, desde=desde)
+        guardar_reporte(reporte)
+        return reporte
+    except Exception as e:
+        print(f"[ERROR] clusters_no_resueltas: {type(e).__name__}: {e}")
+        raise
+    finally:
+        _job_lock.release()
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--k", type=int, default=CLUSTER_K, help="clusters (0 = automático)")
+    ap.add_argument("--top", type=int, default=50, help="clusters a mostrar")
+    ap.add_argument("--desde", type=datetime.fromisoformat, default=None, help="sólo consultas desde esa fecha")
+    ap.add_argument("--json", dest="json_out", default=None, help="además del reporte en CLUSTER_REPORTE")
+    args = ap.parse_args(argv)
+
+    reporte = correr_job(k=args.k or None, desde=args.desde)
+    print(f"[INFO] {reporte['consultas']} consultas, {reporte['unicas']} únicas, {reporte['k']} clusters "
+          f"({reporte['embebidas_nuevas']} embebidas ahora) -> {CLUSTER_REPORTE}")
+    for c in reporte["clusters"][:args.top]:
+        print(f"{c['consultas']:>6}  {c['cohesion']:.2f}  {', '.join(c['terminos'])}  |  "
+              f"{c['representativas'][0]['pregunta'][:90]}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
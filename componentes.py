@@ -0,0 +1,60 @@
+# componentes.py
+"""
+Registro de componentes caros por proceso: clientes del LLM y modelos (cross-encoder).
+
+Viven lo que vive el worker, no lo que vive una versión del índice: `build_rag()`
+tras un reindexado vuelve a leer FAISS/BM25/léxico, pero reusa estos objetos en
+lugar de cargar otra copia del modelo mientras la anterior espera al GC.
+
+La clave incluye la fábrica y su configuración (modelo, tokens, timeout...): si
+cambia alguna (p.ej. un benchmark reemplaza `rag_chain._make_llm`), es otro componente.
+"""
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class RegistroComponentes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[Hashable, Any] = {}
+        self._creando: Dict[Hashable, threading.Lock] = {}  # un lock por clave: cargar un modelo no frena a los demás
+        self.creados: Counter = Counter()
+        self.reusados: Counter = Counter()
+
+    def obtener(self, tipo: str, clave: Hashable, fabrica: Callable[[], T]) -> T:
+        """El componente (`tipo`, `clave`); si no existe, lo crea UNA vez con `fabrica()`."""
+        k = (tipo, clave)
+        with self._lock:
+            if k in self._items:
+                self.reusados[tipo] += 1
+                return self._items[k]
+            lock = self._creando.setdefault(k, threading.Lock())
+        with lock:
+            with self._lock:
+                if k in self._items:  # otro hilo lo creó mientras esperábamos
+                    self.reusados[tipo] += 1
+                    return self._items[k]
+            obj = fabrica()
+            with self._lock:
+                self._items[k] = obj
+                self._creando.pop(k, None)
+                self.creados[tipo] += 1
+            return obj
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "vivos": dict(Counter(tipo for tipo, _ in self._items)),
+                "creados": dict(self.creados),
+                "reusados": dict(self.reusados),
+            }
+
+
+componentes = RegistroComponentes()
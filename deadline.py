@@ -0,0 +1,132 @@
+# deadline.py
+"""
+Presupuesto de latencia por consulta (SLA de la respuesta del chat).
+
+Un `Deadline` se crea al llegar la consulta y viaja por rag_chain y retrievers.
+Antes de cada etapa opcional se pregunta si el tiempo que queda alcanza para
+pagarla sin comerse la reserva de la generación:
+
+  multiquery   paráfrasis con el LLM            -> se omite (una sola búsqueda)
+  prf          segunda recuperación con PRF     -> se omite (queda la primera)
+  rerank       cross-encoder sobre los candidatos -> pool más chico, o se omite
+  generacion   GEN_MAX_TOKENS                   -> menos tokens de salida
+
+Lo omitido o degradado queda en `meta()`, que viaja con la respuesta. La duración
+de cada etapa se estima con una EWMA por proceso (`tiempos`).
+
+Es opt-in: sin RAG_SLA_S no hay presupuesto y ninguna etapa se omite ni se recorta
+sólo porque la EWMA diga que suele tardar.
+"""
+import os, time, threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+RAG_SLA_S = float(os.getenv("RAG_SLA_S", "0"))                   # 0 (por defecto) = sin presupuesto
+RAG_RESERVA_GEN_S = float(os.getenv("RAG_RESERVA_GEN_S", "2"))   # estimación inicial de la generación
+GEN_MIN_TOKENS = int(os.getenv("GEN_MIN_TOKENS", "200"))         # piso al recortar GEN_MAX_TOKENS
+_EWMA_ALPHA = 0.2
+# estimaciones hasta tener mediciones propias (s; rerank por candidato)
+_INICIALES = {"multiquery": 1.5, "rerank": 0.02, "generacion": RAG_RESERVA_GEN_S}
+
+
+class TiemposEtapas:
+    """EWMA de la duración de cada etapa (por unidad: el rerank se mide por candidato)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ewma_s: Dict[str, float] = {}
+        self.omitidas: Counter = Counter()
+        self.degradadas: Counter = Counter()
+
+    def registrar(self, etapa: str, dur_s: float, n: int = 1) -> None:
+        x = dur_s / max(1, n)
+        with self._lock:
+            prev = self.ewma_s.get(etapa)
+            self.ewma_s[etapa] = x if prev is None else (1 - _EWMA_ALPHA) * prev + _EWMA_ALPHA * x
+
+    @contextmanager
+    def medir(self, etapa: str, n: int = 1):
+        t0 = time.perf_counter()
+        yield
+        self.registrar(etapa, time.perf_counter() - t0, n)
+
+    def contar(self, etapa: str, omitida: bool) -> None:
+        with self._lock:
+            (self.omitidas if omitida else self.degradadas)[etapa] += 1
+
+    def estimar(self, etapa: str, n: int = 1) -> float:
+        with self._lock:
+            return self.ewma_s.get(etapa, _INICIALES.get(etapa, 0.0)) * n
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "sla_s": RAG_SLA_S,
+                "ewma_s": {k: round(v, 4) for k, v in self.ewma_s.items()},
+                "omitidas": dict(self.omitidas),
+                "degradadas": dict(self.degradadas),
+            }
+
+
+# una instancia por proceso: sobrevive a las recargas del índice
+tiempos = TiemposEtapas()
+
+
+class Deadline:
+    def __init__(self, presupuesto_s: float = RAG_SLA_S):
+        self.presupuesto_s = presupuesto_s
+        self.inicio = time.monotonic()
+        self.omitidas: List[str] = []
+        self.degradadas: Dict[str, str] = {}
+
+    @property
+    def activo(self) -> bool:
+        return self.presupuesto_s > 0
+
+    def restante(self) -> float:
+        if not self.activo:
+            return float("inf")
+        return self.presupuesto_s - (time.monotonic() - self.inicio)
+
+    def reserva_generacion(self) -> float:
+        return tiempos.estimar("generacion")
+
+    def alcanza(self, costo_s: float) -> bool:
+        """¿Entra una etapa de `costo_s` sin tocar la reserva de la generación?"""
+        return self.restante() - self.reserva_generacion() >= costo_s
+
+    def disponible(self) -> float:
+        """Tiempo para etapas opcionales (lo que queda menos la reserva de la generación)."""
+        return max(0.0, self.restante() - self.reserva_generacion())
+
+    def omitir(self, etapa: str) -> None:
+        if etapa not in self.omitidas:
+            self.omitidas.append(etapa)
+        tiempos.contar(etapa, omitida=True)
+
+    def degradar(self, etapa: str, detalle: str) -> None:
+        self.degradadas[etapa] = detalle
+        tiempos.contar(etapa, omitida=False)
+
+    def meta(self) -> dict:
+        return {
+            "presupuesto_s": self.presupuesto_s if self.activo else None,
+            "transcurrido_s": round(time.monotonic() - self.inicio, 3),
+            "omitidas": list(self.omitidas),
+            "degradadas": dict(self.degradadas),
+        }
+
+
+def tokens_para(deadline: Optional[Deadline], max_tokens: int) -> int:
+    """
+    GEN_MAX_TOKENS recortado en proporción si lo que queda no alcanza para la generación estimada.
+    Sin presupuesto activo devuelve `max_tokens` tal cual: la EWMA sola nunca recorta.
+    """
+    if deadline is None or not deadline.activo:
+        return max_tokens
+    estimado = deadline.reserva_generacion()
+    restante = deadline.restante()
+    if estimado <= 0 or restante >= estimado:
+        return max_tokens
+    return max(min(GEN_MIN_TOKENS, max_tokens), int(max_tokens * max(restante, 0.0) / estimado))
@@ -0,0 +1,140 @@
+# dedup.py
+"""
+Deduplicación de chunks casi idénticos al indexar (MinHash + LSH por bandas).
+
+Los manuales repiten el mismo texto (avisos legales, bloques de contacto, pasos de
+VPN) en muchos PDFs: cada grupo de chunks casi iguales queda como UNA entrada en
+FAISS/BM25 y su metadata `origenes` conserva todos los (source, page) de donde vino,
+para que las citas sigan listando cada origen.
+"""
+import os, re, zlib, unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+DEDUP_ENABLED = os.getenv("DEDUP", "1") != "0"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # Jaccard estimado para fusionar
+DEDUP_PERM = int(os.getenv("DEDUP_PERM", "64"))                # permutaciones de la firma
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))              # bandas LSH (filas = PERM / BANDS)
+DEDUP_MIN_TOKENS = 5   # por debajo, sólo se fusionan copias exactas
+_SHINGLE = 3
+
+_WORD = re.compile(r"[a-z0-9ñ]+")
+_PRIME = np.uint64((1 << 61) - 1)
+
+
+def _norm(s: str) -> str:
+    s = (s or "").lower()
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def origenes(d: Document) -> List[dict]:
+    """Todos los (doc_id, source, page) que representa un chunk (uno solo si no fue fusionado)."""
+    meta = d.metadata or {}
+    return meta.get("origenes") or [{"doc_id": meta.get("doc_id"), "source": meta.get("source"), "page": meta.get("page")}]
+
+
+class MinHashDeduper:
+    """
+    Filtro en streaming: `filtrar(chunks)` devuelve sólo los representantes nuevos y
+    anota a qué representante se fusionó cada duplicado; `fusionar(vs, docs)` vuelca
+    esos orígenes en la metadata de los representantes ya indexados.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_PERM,
+                 bands: int = DEDUP_BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("DEDUP_PERM debe ser múltiplo de DEDUP_BANDS")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.bands, self.rows = bands, num_perm // bands
+        # h_i(x) = (a_i * x + b_i) mod (2^61 - 1), con x de 32 bits: a_i * x no desborda uint64
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._exactos: Dict[int, str] = {}            # hash del texto -> chunk_id representante
+        self._buckets: Dict[tuple, List[str]] = {}    # (banda, firma parcial) -> representantes
+        self._firmas: Dict[str, np.ndarray] = {}
+        self.fusiones: Dict[str, List[dict]] = {}     # representante -> orígenes fusionados
+        self.entrada = 0
+        self.duplicados = 0
+
+    def _firma(self, tokens: List[str]) -> np.ndarray:
+        k = min(_SHINGLE, len(tokens))
+        shingles = {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _representante(self, d: Document) -> Optional[str]:
+        """chunk_id del representante casi idéntico ya visto, o None si `d` es nuevo (y pasa a serlo)."""
+        cid = d.metadata["chunk_id"]
+        norm = _norm(d.page_content)
+        h = hash(norm)
+        rep = self._exactos.get(h)
+        if rep is not None:
+            return rep
+        self._exactos[h] = cid
+        tokens = _WORD.findall(norm)
+        if len(tokens) < DEDUP_MIN_TOKENS:
+            return None
+        firma = self._firma(tokens)
+        claves = [(b, firma[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+        mejor, mejor_j = None, self.threshold
+        vistos = set()
+        for clave in claves:
+            for cand in self._buckets.get(clave, ()):
+                if cand in vistos:
+                    continue
+                vistos.add(cand)
+                j = float(np.mean(self._firmas[cand] == firma))
+                if j >= mejor_j:
+                    mejor, mejor_j = cand, j
+        if mejor is not None:
+            self._exactos[h] = mejor
+            return mejor
+        self._firmas[cid] = firma
+        for clave in claves:
+            self._buckets.setdefault(clave, []).append(cid)
+        return None
+
+    def filtrar(self, chunks: List[Document]) -> List[Document]:
+        nuevos = []
+        for d in chunks:
+            self.entrada += 1
+            if not d.metadata.get("chunk_id"):
+                nuevos.append(d)
+                continue
+            rep = self._representante(d)
+            if rep is None:
+                nuevos.append(d)
+            else:
+                self.duplicados += 1
+                self.fusiones.setdefault(rep, []).extend(origenes(d))
+        return nuevos
+
+    def fusionar(self, vs, docs: List[Document]) -> None:
+        """Agrega `origenes` a los representantes, tanto en `docs` como en el docstore de FAISS."""
+        if not self.fusiones or vs is None:
+            return
+        por_id: Dict[str, List[Document]] = {}
+        for d in list(docs) + list(vs.docstore._dict.values()):
+            cid = d.metadata.get("chunk_id")
+            if cid in self.fusiones:
+                por_id.setdefault(cid, []).append(d)
+        for cid, extra in self.fusiones.items():
+            for d in {id(x): x for x in por_id.get(cid, [])}.values():
+                vistos, todos = set(), []
+                for o in origenes(d) + extra:
+                    key = (o.get("doc_id"), o.get("page"))
+                    if key not in vistos:
+                        vistos.add(key)
+                        todos.append(o)
+                d.metadata["origenes"] = todos
+
+    def resumen(self) -> dict:
+        return {
+            "chunks_entrada": self.entrada,
+            "duplicados_eliminados": self.duplicados,
+            "porcentaje": round(100.0 * self.duplicados / self.entrada, 2) if self.entrada else 0.0,
+            "representantes_con_fusion": len(self.fusiones),
+        }
@@ -4,13 +4,77 @@ load_dotenv()
 
 HF_MODEL = os.getenv("HF_EMBEDDING_MODEL", "intfloat/multilingual-e5-base")
 
+# Backend del modelo de embeddings (misma interfaz embed_query/embed_documents):
+#   torch -> fp32 (por defecto) | int8 -> quantize_dynamic de las Linear | onnx -> ONNX Runtime
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))   # 0 = lo que decida la librería
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "")     # p.ej. onnx/model_qint8_avx512_vnni.onnx
+BACKENDS = ("torch", "int8", "onnx")
+# servicio de inferencia compartido (inference_worker.py); vacío = modelo en este proceso
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+
 try:
     from langchain_huggingface import HuggingFaceEmbeddings as HFEmbeddings
 except Exception:
     from langchain_community.embeddings import HuggingFaceEmbeddings as HFEmbeddings
 
-dense = HFEmbeddings(
-    model_name=HF_MODEL,
-    encode_kwargs={"normalize_embeddings": True},  # coseno via dot-product
-    model_kwargs={"device": "cpu"}                 # usa "cuda" si tenés GPU
-)
+
+def _model_kwargs(backend: str, threads: int) -> dict:
+    kwargs = {"device": "cpu"}  # usa "cuda" si tenés GPU
+    if backend == "onnx":
+        import onnxruntime as ort
+        inner = {"provider": "CPUExecutionProvider"}
+        if EMBED_ONNX_FILE:
+            inner["file_name"] = EMBED_ONNX_FILE
+        if threads > 0:
+            so = ort.SessionOptions()
+            so.intra_op_num_threads = threads
+            so.inter_op_num_threads = 1
+            inner["session_options"] = so
+        kwargs.update(backend="onnx", model_kwargs=inner)
+    return kwargs
+
+
+def _sentence_transformer(emb):
+    # langchain_huggingface guarda el modelo en `_client`; langchain_community, en `client`
+    return getattr(emb, "_client", None) or getattr(emb, "client", None)
+
+
+def make_embeddings(backend: str = EMBED_BACKEND, threads: int = EMBED_THREADS, model_name: str = HF_MODEL):
+    """Embeddings normalizados (coseno via dot-product) con el backend pedido."""
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBED_BACKEND inválido: {backend!r} (opciones: {', '.join(BACKENDS)})")
+    if threads > 0 and backend != "onnx":
+        import torch
+        torch.set_num_threads(threads)
+    try:
+        emb = HFEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"normalize_embeddings": True},
+            model_kwargs=_model_kwargs(backend, threads),
+        )
+    except ImportError as e:
+        if backend != "onnx":
+            raise
+        # falta onnxruntime/optimum: seguimos con torch en lugar de no levantar
+        print(f"[WARN] Backend onnx no disponible ({e}); se usa torch.")
+        return make_embeddings("torch", threads, model_name)
+    if backend == "int8":
+        import torch
+        torch.quantization.quantize_dynamic(
+            _sentence_transformer(emb), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return emb
+
+
+def _dense():
+    if INFERENCE_SOCKET:
+        from inference_worker import RemoteEmbeddings, cliente_compartido, ERRORES_CONEXION
+        try:
+            return RemoteEmbeddings(cliente_compartido(INFERENCE_SOCKET))
+        except ERRORES_CONEXION as e:
+            print(f"[WARN] inference_worker no disponible en {INFERENCE_SOCKET} ({e}); se carga el modelo local.")
+    return make_embeddings()
+
+
+dense = _dense()
@@ -0,0 +1,165 @@
+# hybrid_search.py
+"""
+Búsqueda híbrida nativa (FAISS + BM25 en NumPy) sobre un shard.
+
+Reemplaza EnsembleRetriever + MultiQueryRetriever: las variantes de la consulta se
+embeben en una sola llamada, FAISS las busca en un único `search` por lote, BM25
+las puntúa contra un índice invertido precalculado y la fusión de todas las
+variantes (RRF ponderado o combinación de scores normalizados) es una pasada
+vectorizada. Cada resultado es (Document, score) y la copia del Document lleva en
+`metadata["sim"]` el coseno con la pregunta de referencia, para que los gates no
+vuelvan a embeber cada chunk.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+FUSIONES = ("rrf", "score")
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+@dataclass
+class HybridParams:
+    """
+    fusion="rrf":   sum_variantes( w / (c + rango) ) por cada lista (dense y sparse)
+    fusion="score": max_variantes( w_dense * coseno + w_sparse * bm25 / max_bm25 )
+    """
+    k_dense: int = field(default_factory=lambda: _env_int("HYBRID_K_DENSE", 12))    # candidatos FAISS por variante
+    k_sparse: int = field(default_factory=lambda: _env_int("HYBRID_K_SPARSE", 4))   # candidatos BM25 por variante
+    w_dense: float = field(default_factory=lambda: _env_float("HYBRID_W_DENSE", 0.85))
+    w_sparse: float = field(default_factory=lambda: _env_float("HYBRID_W_SPARSE", 0.5))
+    fusion: str = field(default_factory=lambda: os.getenv("HYBRID_FUSION", "rrf").lower())
+    rrf_c: int = 60
+    top_k: int = field(default_factory=lambda: _env_int("SHARD_TOP_K", 16))         # candidatos que pasan al rerank
+
+    def __post_init__(self):
+        if self.fusion not in FUSIONES:
+            raise ValueError(f"HYBRID_FUSION inválido: {self.fusion!r} (opciones: {', '.join(FUSIONES)})")
+
+
+def normalizar(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.maximum(n, 1e-12)
+
+
+def _clave(d: Document) -> str:
+    return d.metadata.get("chunk_id") or d.page_content
+
+
+def _indice_invertido(vec, pos_de_doc: np.ndarray) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pesos BM25Okapi (idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)), idénticos a rank_bm25)
+    precalculados por (término, chunk) y ordenados por término, estilo CSR.
+    """
+    vocab = {t: i for i, t in enumerate(vec.idf)}
+    terminos, docs, tfs, largos = [], [], [], []
+    for j, freqs in enumerate(vec.doc_freqs):
+        p = pos_de_doc[j]
+        if p < 0:
+            continue
+        for t, f in freqs.items():
+            terminos.append(vocab[t]); docs.append(p); tfs.append(f); largos.append(vec.doc_len[j])
+    terminos = np.asarray(terminos, dtype=np.int64)
+    tf = np.asarray(tfs, dtype=np.float32)
+    norm = vec.k1 * (1 - vec.b + vec.b * np.asarray(largos, dtype=np.float32) / vec.avgdl)
+    idf = np.fromiter(vec.idf.values(), dtype=np.float32, count=len(vocab))
+    pesos = idf[terminos] * tf * (vec.k1 + 1) / (tf + norm)
+    orden = np.argsort(terminos, kind="stable")
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terminos, minlength=len(vocab)), out=indptr[1:])
+    return vocab, indptr, np.asarray(docs, dtype=np.int64)[orden], pesos[orden].astype(np.float32)
+
+
+class HybridShard:
+    """FAISS + BM25 de UN shard, direccionados por la posición del chunk en FAISS."""
+
+    def __init__(self, faiss_vs, bm25):
+        self.index = faiss_vs.index
+        ids = faiss_vs.index_to_docstore_id
+        self.docs: List[Document] = [faiss_vs.docstore.search(ids[i]) for i in range(self.index.ntotal)]
+        pos = {_clave(d): i for i, d in enumerate(self.docs)}
+        self.pos_chunk = {d.metadata["chunk_id"]: i for i, d in enumerate(self.docs) if d.metadata.get("chunk_id")}
+        pos_de_doc = np.array([pos.get(_clave(d), -1) for d in bm25.docs], dtype=np.int64)
+        self._tokenizar = bm25.preprocess_func
+        self.vocab, self.indptr, self.postings, self.pesos = _indice_invertido(bm25.vectorizer, pos_de_doc)
+
+    @property
+    def n(self) -> int:
+        return len(self.docs)
+
+    def bm25(self, variantes: Sequence[str]) -> np.ndarray:
+        """Scores BM25 (variantes x chunks): un solo bincount sobre los postings de todas las variantes."""
+        m, n = len(variantes), self.n
+        idx, w = [], []
+        for v, texto in enumerate(variantes):
+            for t in self._tokenizar(texto):  # repetidos suman, como en rank_bm25
+                i = self.vocab.get(t)
+                if i is not None:
+                    a, b = self.indptr[i], self.indptr[i + 1]
+                    idx.append(self.postings[a:b] + v * n)
+                    w.append(self.pesos[a:b])
+        if not idx:
+            return np.zeros((m, n))
+        return np.bincount(np.concatenate(idx), weights=np.concatenate(w), minlength=m * n).reshape(m, n)
+
+    def vector(self, chunk_id: str) -> Optional[np.ndarray]:
+        """Embedding guardado en FAISS del chunk (None si no está en este shard)."""
+        p = self.pos_chunk.get(chunk_id)
+        return None if p is None else self._vectores(np.array([p], dtype=np.int64))[0]
+
+    def _vectores(self, pos: np.ndarray) -> np.ndarray:
+        try:
+            return self.index.reconstruct_batch(pos)
+        except (AttributeError, RuntimeError):
+            return np.vstack([self.index.reconstruct(int(i)) for i in pos])
+
+    def buscar(self, variantes: Sequence[str], q_vecs: np.ndarray, ref_vec: np.ndarray,
+               params: HybridParams) -> List[Tuple[Document, float]]:
+        """`q_vecs`: embeddings normalizados de `variantes` (una fila por variante)."""
+        if not self.n:
+            return []
+        m = len(variantes)
+        k_d = min(params.k_dense, self.n)
+        _, dense_top = self.index.search(np.ascontiguousarray(q_vecs, dtype=np.float32), k_d)
+
+        scores = self.bm25(variantes)
+        k_s = min(params.k_sparse, self.n)
+        sparse_top = np.argpartition(-scores, k_s - 1, axis=1)[:, :k_s]
+        orden = np.argsort(-np.take_along_axis(scores, sparse_top, axis=1), axis=1, kind="stable")
+        sparse_top = np.take_along_axis(sparse_top, orden, axis=1)
+        sparse_ok = np.take_along_axis(scores, sparse_top, axis=1) > 0  # sin términos en común no es candidato
+        dense_ok = dense_top >= 0
+
+        cand = np.unique(np.concatenate([dense_top[dense_ok], sparse_top[sparse_ok]]))
+        if not len(cand):
+            return []
+        x = normalizar(np.asarray(self._vectores(cand), dtype=np.float32))
+
+        if params.fusion == "rrf":
+            fused = np.zeros(len(cand))
+            for top, ok, w in ((dense_top, dense_ok, params.w_dense), (sparse_top, sparse_ok, params.w_sparse)):
+                rango = np.broadcast_to(np.arange(top.shape[1]), top.shape)[ok]
+                np.add.at(fused, np.searchsorted(cand, top[ok]), w / (params.rrf_c + rango + 1))
+        else:
+            cos = q_vecs[:m] @ x.T
+            tope = scores.max(axis=1, keepdims=True)
+            sparse_n = scores[:, cand] / np.where(tope > 0, tope, 1.0)
+            fused = (params.w_dense * cos + params.w_sparse * sparse_n).max(axis=0)
+
+        sims = x @ ref_vec
+        out = []
+        for i in np.argsort(-fused, kind="stable")[:params.top_k]:
+            d = self.docs[cand[i]]
+            meta = {**d.metadata, "sim": float(sims[i]), "score": float(fused[i])}
+            out.append((Document(page_content=d.page_content, metadata=meta, id=d.id), float(fused[i])))
+        return out
@@ -0,0 +1,286 @@
+# inference_worker.py
+"""
+Servicio local de inferencia (embeddings + cross-encoder) compartido por los workers
+de uvicorn, en un proceso aparte y por socket Unix (named pipe en Windows).
+
+Los modelos se cargan una sola vez en este proceso. Las llamadas concurrentes de
+todos los clientes se juntan en micro-lotes: lo que llega dentro de
+INFER_BATCH_WINDOW_MS (o hasta INFER_MAX_BATCH textos) se resuelve con UNA llamada
+al modelo por tipo, en lugar de muchos hilos compitiendo por torch.
+
+    INFERENCE_AUTHKEY=<secreto> python -m inference_worker [--socket RUTA]
+
+Los workers lo usan si tienen INFERENCE_SOCKET apuntando al mismo socket; si no
+pueden conectarse al arrancar, cargan los modelos localmente (con un WARN).
+
+El protocolo es pickle: INFERENCE_AUTHKEY es obligatoria (servicio y workers se
+niegan a arrancar sin ella) y el socket vive en un directorio privado (0700), así
+otro usuario local no puede ocupar la ruta ni pasar el handshake.
+"""
+import os, sys, time, queue, argparse, tempfile, threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_FAMILY = "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+
+
+def _socket_por_defecto() -> str:
+    if sys.platform == "win32":
+        return r"\\.\pipe\rag-inferencia"
+    base = os.getenv("XDG_RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"rag-{os.getuid()}")
+    return os.path.join(base, "rag-inferencia", "inferencia.sock")
+
+
+DEFAULT_SOCKET = _socket_por_defecto()
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")   # vacío = modelos en el propio worker
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY", "").encode("utf-8")  # sin valor por defecto: es el secreto
+INFER_BATCH_WINDOW_MS = float(os.getenv("INFER_BATCH_WINDOW_MS", "5"))
+INFER_MAX_BATCH = int(os.getenv("INFER_MAX_BATCH", "64"))  # textos (o pares) por llamada al modelo
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# lo que puede fallar al conectarse: servicio caído, socket inexistente, authkey distinta
+ERRORES_CONEXION = (OSError, EOFError, AuthenticationError)
+
+
+def _exigir_authkey(authkey: bytes) -> bytes:
+    """RuntimeError si falta la clave: con una pública cualquiera podría mandar pickles."""
+    if not authkey:
+        raise RuntimeError("INFERENCE_AUTHKEY es obligatoria con el servicio de inferencia "
+                           "(p.ej. `python -c 'import secrets; print(secrets.token_hex(32))'`)")
+    return authkey
+
+
+def _directorio_privado(address: str) -> None:
+    """Crea (0700) el directorio del socket; RuntimeError si es de otro usuario o lo pueden escribir otros."""
+    d = os.path.dirname(os.path.abspath(address))
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    st = os.stat(d)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"el directorio del socket ({d}) tiene que ser de este usuario y con permisos 0700")
+
+
+# ------------------------ Cliente ------------------------
+class InferenceClient:
+    """
+    Un `Connection` no es thread-safe: cada llamada toma una conexión libre del pool
+    (o abre otra), así los hilos del worker no se serializan entre sí.
+    """
+
+    def __init__(self, address: str = INFERENCE_SOCKET or DEFAULT_SOCKET, authkey: bytes = INFERENCE_AUTHKEY):
+        self.address, self.authkey = address, _exigir_authkey(authkey)
+        self._libres: queue.LifoQueue = queue.LifoQueue()
+        self._libres.put(self._nueva())  # falla acá (OSError) si el servicio no está levantado
+
+    def _nueva(self):
+        return Client(self.address, family=_FAMILY, authkey=self.authkey)
+
+    def _llamar(self, *msg):
+        for intento in (1, 2):
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                conn = self._nueva()
+            try:
+                conn.send(msg)
+                estado, valor = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                if intento == 2:
+                    raise
+                continue  # el servicio se reinició: reintenta con una conexión nueva
+            self._libres.put(conn)
+            if estado == "error":
+                raise RuntimeError(f"inference_worker: {valor}")
+            return valor
+
+    def embed(self, textos: Sequence[str]) -> np.ndarray:
+        return self._llamar("embed", list(textos))
+
+    def rerank(self, pares: Sequence[Tuple[str, str]]) -> np.ndarray:
+        return self._llamar("rerank", [tuple(p) for p in pares])
+
+    def stats(self) -> dict:
+        return self._llamar("stats", None)
+
+
+class RemoteEmbeddings(Embeddings):
+    """Misma interfaz que HuggingFaceEmbeddings (vectores normalizados) sobre el servicio."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(texts).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed([text])[0].tolist()
+
+
+class RemoteCrossEncoder:
+    """Sustituto de sentence_transformers.CrossEncoder para CrossEncoderReranker."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def predict(self, pairs, **_) -> np.ndarray:
+        return self.client.rerank(pairs) if len(pairs) else np.zeros(0, dtype=np.float32)
+
+
+_clientes: dict = {}
+_clientes_lock = threading.Lock()
+
+def cliente_compartido(address: str = INFERENCE_SOCKET) -> InferenceClient:
+    """Un cliente por proceso y dirección (embeddings y reranker comparten el pool)."""
+    with _clientes_lock:
+        if address not in _clientes:
+            _clientes[address] = InferenceClient(address)
+        return _clientes[address]
+
+
+# ------------------------ Servicio ------------------------
+class InferenceServer:
+    def __init__(self, address: str, embeddings, cross_encoder, window_ms: float = INFER_BATCH_WINDOW_MS,
+                 max_batch: int = INFER_MAX_BATCH, authkey: bytes = INFERENCE_AUTHKEY):
+        self.address, self.authkey = address, authkey
+        self.embeddings, self.cross_encoder = embeddings, cross_encoder
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._q: queue.Queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.lotes = {"embed": 0, "rerank": 0}
+        self.items = {"embed": 0, "rerank": 0}
+        self.pedidos = {"embed": 0, "rerank": 0}
+
+    def serve_forever(self) -> None:
+        _exigir_authkey(self.authkey)
+        if _FAMILY == "AF_UNIX":
+            _directorio_privado(self.address)
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # socket huérfano de una corrida anterior
+        listener = Listener(self.address, family=_FAMILY, authkey=self.authkey)
+        if _FAMILY == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        threading.Thread(target=self._batcher, name="infer-batcher", daemon=True).start()
+        print(f"[INFO] inference_worker escuchando en {self.address} "
+              f"(ventana {self.window_s * 1000:.1f} ms, lote máx. {self.max_batch})", flush=True)
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # handshake fallido (authkey), cliente que se cayó...
+                    print(f"[WARN] inference_worker accept: {type(e).__name__}: {e}")
+                    continue
+                threading.Thread(target=self._atender, args=(conn,), name="infer-conn", daemon=True).start()
+        finally:
+            listener.close()
+
+    def _atender(self, conn) -> None:
+        """Lee pedidos de un cliente; el batcher responde por la misma conexión."""
+        with conn:
+            while True:
+                try:
+                    tipo, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if tipo == "stats":
+                    conn.send(("ok", self.resumen()))
+                    continue
+                if tipo not in self.lotes:
+                    conn.send(("error", f"pedido desconocido: {tipo!r}"))
+                    continue
+                listo = threading.Event()
+                pedido = {"tipo": tipo, "payload": payload, "listo": listo}
+                self._q.put(pedido)
+                listo.wait()
+                try:
+                    conn.send(pedido["respuesta"])
+                except (EOFError, OSError):
+                    return
+
+    def _batcher(self) -> None:
+        while True:
+            pedidos = [self._q.get()]
+            n = len(pedidos[0]["payload"])
+            limite = time.monotonic() + self.window_s
+            while n < self.max_batch:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    p = self._q.get(timeout=restante)
+                except queue.Empty:
+                    break
+                pedidos.append(p)
+                n += len(p["payload"])
+            for tipo in ("embed", "rerank"):
+                grupo = [p for p in pedidos if p["tipo"] == tipo]
+                if grupo:
+                    self._resolver(tipo, grupo)
+
+    def _resolver(self, tipo: str, grupo: List[dict]) -> None:
+        """UNA llamada al modelo para todo el grupo; el resultado se reparte por pedido."""
+        todos = [x for p in grupo for x in p["payload"]]
+        try:
+            if tipo == "embed":
+                salida = np.asarray(self.embeddings.embed_documents(todos), dtype=np.float32)
+            else:
+                salida = np.asarray(self.cross_encoder.predict(todos), dtype=np.float32)
+            i = 0
+            for p in grupo:
+                k = len(p["payload"])
+                p["respuesta"] = ("ok", salida[i:i + k])
+                i += k
+        except Exception as e:
+            print(f"[ERROR] inference_worker {tipo} ({len(todos)} items): {type(e).__name__}: {e}")
+            for p in grupo:
+                p["respuesta"] = ("error", f"{type(e).__name__}: {e}")
+        with self._stats_lock:
+            self.lotes[tipo] += 1
+            self.items[tipo] += len(todos)
+            self.pedidos[tipo] += len(grupo)
+        for p in grupo:
+            p["listo"].set()
+
+    def resumen(self) -> dict:
+        with self._stats_lock:
+            return {
+                tipo: {
+                    "pedidos": self.pedidos[tipo],
+                    "lotes": self.lotes[tipo],
+                    "items_por_lote": round(self.items[tipo] / self.lotes[tipo], 2) if self.lotes[tipo] else None,
+                }
+                for tipo in self.lotes
+            }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--socket", default=INFERENCE_SOCKET or DEFAULT_SOCKET)
+    ap.add_argument("--ventana-ms", type=float, default=INFER_BATCH_WINDOW_MS)
+    ap.add_argument("--lote-max", type=int, default=INFER_MAX_BATCH)
+    args = ap.parse_args(argv)
+    try:
+        # antes de cargar los modelos: sin clave o sin directorio privado no se arranca
+        _exigir_authkey(INFERENCE_AUTHKEY)
+        if _FAMILY == "AF_UNIX":
+            _directorio_privado(args.socket)
+    except RuntimeError as e:
+        print(f"[ERROR] inference_worker: {e}", file=sys.stderr)
+        return 2
+
+    # este proceso ES el servicio: embeddings_setup tiene que cargar el modelo local
+    os.environ["INFERENCE_SOCKET"] = ""
+    from embeddings_setup import dense
+    from sentence_transformers import CrossEncoder
+
+    server = InferenceServer(args.socket, dense, CrossEncoder(RERANK_MODEL),
+                             window_ms=args.ventana_ms, max_batch=args.lote_max)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
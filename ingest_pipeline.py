@@ -0,0 +1,181 @@
+# ingest_pipeline.py
+"""
+Ingesta en streaming con memoria acotada: página -> chunks -> lote de embeddings
+-> FAISS.add. Cada etapa corre en su hilo y se comunica por colas acotadas, así que
+el pico de memoria transitoria lo fijan EMBED_BATCH e INGEST_QUEUE y no el tamaño
+del corpus. Lo que sí crece con el shard es el propio FAISS (vectores + docstore).
+Devuelve también cuánto procesó y cuánto tardó cada etapa.
+"""
+import os, time, queue, threading
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))    # chunks por llamada al modelo
+INGEST_QUEUE = int(os.getenv("INGEST_QUEUE", "16"))  # páginas en vuelo entre lectura y chunking
+
+_FIN = object()
+
+
+class _Cancelado(Exception):
+    """Otra etapa falló: las demás cortan sin esperar a la cola."""
+
+
+class _Etapa:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.items = 0
+        self.ocupado_s = 0.0  # tiempo trabajando (sin contar esperas en colas)
+
+    def resumen(self) -> dict:
+        return {
+            "items": self.items,
+            "ocupado_s": round(self.ocupado_s, 3),
+            "items_por_s": round(self.items / self.ocupado_s, 1) if self.ocupado_s else None,
+        }
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise _Cancelado()
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Cancelado()
+
+
+def _hilo(nombre: str, objetivo: Callable[[], None], q_out: queue.Queue,
+          stop: threading.Event, errores: list) -> threading.Thread:
+    def run():
+        try:
+            objetivo()
+            _put(q_out, _FIN, stop)
+        except _Cancelado:
+            pass
+        except BaseException as e:
+            errores.append(e)
+            stop.set()
+    t = threading.Thread(target=run, name=f"ingesta-{nombre}", daemon=True)
+    t.start()
+    return t
+
+
+def ingestar(
+    paginas: Iterable[Any],
+    partir: Callable[[Any], List[Document]],
+    embeddings,
+    batch_size: int = EMBED_BATCH,
+    queue_size: int = INGEST_QUEUE,
+    dedup=None,
+    por_lote: Optional[Callable[[List[Document]], None]] = None,
+) -> Tuple[Optional[FAISS], dict]:
+    """
+    Consume `paginas` (iterable perezoso), las parte con `partir(pagina) -> [Document]`,
+    embebe de a `batch_size` chunks y los agrega a un FAISS que crece por lotes.
+    `dedup` (p.ej. dedup.MinHashDeduper): descarta casi-duplicados ANTES de embeberlos.
+    `por_lote(chunks)`: se llama con cada lote ya indexado (léxico, features...).
+    Devuelve (FAISS o None si no hubo chunks, stats por etapa). Los chunks indexados
+    quedan en el docstore del FAISS; no se arma otra lista con todos.
+    """
+    batch_size = max(1, int(batch_size))
+    stop = threading.Event()
+    errores: list = []
+    q_paginas: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    q_lotes: queue.Queue = queue.Queue(maxsize=2)  # un lote embebiéndose + uno listo
+    e_pag, e_chunk, e_emb, e_add = _Etapa("paginas"), _Etapa("chunks"), _Etapa("embeddings"), _Etapa("indexado")
+    e_dedup, e_lote = _Etapa("dedup"), _Etapa("por_lote")
+
+    def leer():
+        it = iter(paginas)
+        while True:
+            t0 = time.perf_counter()
+            pag = next(it, _FIN)
+            e_pag.ocupado_s += time.perf_counter() - t0
+            if pag is _FIN:
+                return
+            e_pag.items += 1
+            _put(q_paginas, pag, stop)
+
+    def trocear():
+        lote: List[Document] = []
+        while True:
+            pag = _get(q_paginas, stop)
+            if pag is _FIN:
+                break
+            t0 = time.perf_counter()
+            chunks = partir(pag)
+            t1 = time.perf_counter()
+            e_chunk.ocupado_s += t1 - t0
+            e_chunk.items += len(chunks)
+            if dedup is not None:
+                e_dedup.items += len(chunks)
+                chunks = dedup.filtrar(chunks)
+                e_dedup.ocupado_s += time.perf_counter() - t1
+            lote.extend(chunks)
+            while len(lote) >= batch_size:
+                _put(q_lotes, lote[:batch_size], stop)
+                lote = lote[batch_size:]
+        if lote:
+            _put(q_lotes, lote, stop)
+
+    t_inicio = time.perf_counter()
+    hilos = [
+        _hilo("paginas", leer, q_paginas, stop, errores),
+        _hilo("chunks", trocear, q_lotes, stop, errores),
+    ]
+    vs: Optional[FAISS] = None
+    try:
+        while True:
+            lote = _get(q_lotes, stop)
+            if lote is _FIN:
+                break
+            textos = [d.page_content for d in lote]
+            t0 = time.perf_counter()
+            vecs = embeddings.embed_documents(textos)
+            t1 = time.perf_counter()
+            pares = list(zip(textos, vecs))
+            metas = [d.metadata for d in lote]
+            if vs is None:
+                vs = FAISS.from_embeddings(pares, embeddings, metadatas=metas)
+            else:
+                vs.add_embeddings(pares, metadatas=metas)
+            t2 = time.perf_counter()
+            e_emb.items += len(lote); e_emb.ocupado_s += t1 - t0
+            e_add.items += len(lote); e_add.ocupado_s += t2 - t1
+            if por_lote is not None:
+                por_lote(lote)
+                e_lote.items += len(lote); e_lote.ocupado_s += time.perf_counter() - t2
+    except _Cancelado:
+        pass
+    finally:
+        stop.set()
+        for t in hilos:
+            t.join()
+    if errores:
+        raise errores[0]
+    if dedup is not None:
+        dedup.fusionar(vs, [])
+
+    wall = time.perf_counter() - t_inicio
+    etapas = [e_pag, e_chunk, *([e_dedup] if dedup is not None else []), e_emb, e_add,
+              *([e_lote] if por_lote is not None else [])]
+    stats = {e.nombre: e.resumen() for e in etapas}
+    if dedup is not None:
+        stats["dedup_resultado"] = dedup.resumen()
+    stats.update({
+        "lote": batch_size,
+        "wall_s": round(wall, 3),
+        "chunks_por_s": round(e_add.items / wall, 1) if wall else None,
+    })
+    return vs, stats
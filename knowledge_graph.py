@@ -1,9 +1,178 @@
-import json  # Para trabajar con archivos JSON
+import os, re, json, time, threading, unicodedata  # Para trabajar con archivos JSON
+from collections import deque
+from typing import Dict, List, Optional
+
+GRAPH_FILE = os.getenv("KNOWLEDGE_GRAPH_PATH", "knowledge_graph.json")
+GRAPH_POLL_SEC = float(os.getenv("GRAPH_POLL_SEC", "5"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _norm(s: str) -> str:
+    s = (s or "").lower()
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def _tokens(s: str) -> List[str]:
+    return _TOKEN.findall(_norm(s))
+
 
 # Función que carga el archivo de grafo en memoria
-def cargar_grafo_conocimiento(ruta_json='knowledge_graph.json'):
-    with open(ruta_json, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def cargar_grafo_conocimiento(ruta_json=GRAPH_FILE):
+    try:
+        with open(ruta_json, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"[WARN] No se encontró el grafo de conocimiento: {ruta_json}")
+        return {}
+
+
+# ------------------------ Índice de entidades ------------------------
+class EntityIndex:
+    """
+    Autómata Aho-Corasick sobre los tokens normalizados de los nombres del grafo
+    (nodos y destinos de `relaciones`). Encuentra todas las entidades de una pregunta
+    en una sola pasada lineal, siempre en límites de palabra.
+    """
+
+    def __init__(self, grafo: dict):
+        self.nombres: List[str] = []
+        self.vecinos: List[List[int]] = []
+        ids: Dict[str, int] = {}
+
+        def _id(nombre: str) -> int:
+            key = " ".join(_tokens(nombre))
+            i = ids.get(key)
+            if i is None:
+                i = ids[key] = len(self.nombres)
+                self.nombres.append(nombre)
+                self.vecinos.append([])
+            return i
+
+        # adyacencia simétrica: un destino sin nodo propio también expande a quien lo cita
+        for nombre, data in (grafo or {}).items():
+            a = _id(nombre)
+            for rel in (data or {}).get("relaciones", []) or []:
+                b = _id(rel)
+                if b != a:
+                    self.vecinos[a].append(b)
+                    self.vecinos[b].append(a)
+        self.vecinos = [list(dict.fromkeys(v)) for v in self.vecinos]
+        self.n_nodos = len(grafo or {})
+
+        goto: List[Dict[str, int]] = [{}]
+        out: List[tuple] = [()]
+        for key, i in ids.items():
+            if not key:
+                continue
+            s = 0
+            for t in key.split(" "):
+                nxt = goto[s].get(t)
+                if nxt is None:
+                    nxt = goto[s][t] = len(goto)
+                    goto.append({})
+                    out.append(())
+                s = nxt
+            out[s] = out[s] + (i,)
+
+        # enlaces de fallo por BFS; cada estado hereda las salidas de su sufijo
+        fail = [0] * len(goto)
+        cola = deque(goto[0].values())
+        while cola:
+            r = cola.popleft()
+            for t, s in goto[r].items():
+                cola.append(s)
+                f = fail[r]
+                while f and t not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(t, 0) if r else 0
+                out[s] = out[s] + out[fail[s]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def __len__(self) -> int:
+        return len(self.nombres)
+
+    def entidades(self, texto: str) -> List[int]:
+        """Ids de las entidades presentes en `texto`, en orden de aparición y sin repetir."""
+        goto, fail, out = self._goto, self._fail, self._out
+        s, vistos = 0, {}
+        for t in _tokens(texto):
+            while s and t not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(t, 0)
+            for i in out[s]:
+                vistos[i] = None
+        return list(vistos)
+
+    def buscar(self, texto: str) -> List[str]:
+        return [self.nombres[i] for i in self.entidades(texto)]
+
+    def relacionados(self, texto: str, max_terms: int = 4) -> List[str]:
+        """Nombres vecinos de las entidades de `texto` que no aparecen ya en él."""
+        if max_terms <= 0:
+            return []
+        encontrados = self.entidades(texto)
+        ya = set(encontrados)
+        res: List[str] = []
+        for i in encontrados:
+            for j in self.vecinos[i]:
+                if j not in ya:
+                    ya.add(j)
+                    res.append(self.nombres[j])
+                    if len(res) >= max_terms:
+                        return res
+        return res
+
+
+# ------------------------ Recarga en caliente ------------------------
+_lock = threading.Lock()
+_index: Optional[EntityIndex] = None
+_mtime: Optional[float] = None
+_last_check = 0.0
+
+
+def _file_mtime(ruta: str) -> Optional[float]:
+    try:
+        return os.stat(ruta).st_mtime
+    except OSError:
+        return None
+
+
+def recargar_grafo(ruta_json: str = GRAPH_FILE) -> EntityIndex:
+    """Relee el JSON y reemplaza el índice de forma atómica (las consultas en curso siguen con el anterior)."""
+    global _index, _mtime, grafo_conocimiento
+    with _lock:
+        mtime = _file_mtime(ruta_json)
+        grafo = cargar_grafo_conocimiento(ruta_json)
+        idx = EntityIndex(grafo)
+        grafo_conocimiento, _index, _mtime = grafo, idx, mtime
+    return idx
+
+
+def get_entity_index(ruta_json: str = GRAPH_FILE) -> EntityIndex:
+    """Índice actual; cada GRAPH_POLL_SEC revisa el mtime del JSON y recompila si cambió."""
+    global _last_check, _index
+    now = time.monotonic()
+    if _index is not None and now - _last_check < GRAPH_POLL_SEC:
+        return _index
+    _last_check = now
+    mtime = _file_mtime(ruta_json)
+    if _index is None and mtime == _mtime and ruta_json == GRAPH_FILE:
+        # primer uso: se compila el grafo ya cargado al importar
+        with _lock:
+            if _index is None:
+                _index = EntityIndex(grafo_conocimiento)
+        return _index
+    if _index is None or mtime != _mtime:
+        return recargar_grafo(ruta_json)
+    return _index
+
+
+def expandir_con_grafo(pregunta: str, max_terms: int = 4) -> List[str]:
+    """Términos relacionados (según `relaciones`) con las entidades de la pregunta."""
+    return get_entity_index().relacionados(pregunta, max_terms=max_terms)
+
 
 # Carga el grafo al iniciar el backend
+_mtime = _file_mtime(GRAPH_FILE)
 grafo_conocimiento = cargar_grafo_conocimiento()
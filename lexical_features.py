@@ -0,0 +1,192 @@
+# lexical_features.py
+"""
+Features léxicos por chunk precalculados al indexar: texto normalizado (sin tildes,
+minúsculas) y vector disperso término-id/frecuencia contra el léxico del corpus.
+
+En cada consulta, el chequeo de anclas y el PRF pasan a ser operaciones de
+conjuntos y vectores dispersos (RM3 con IDF real) sin normalizar ni tokenizar
+los chunks recuperados.
+"""
+import os, re, json, tempfile, unicodedata
+from collections import Counter
+from typing import List, Optional, Iterable
+
+import numpy as np
+from langchain_core.documents import Document
+
+FEATURES_FILE = "chunk_features.json"
+
+# mismo criterio que el léxico (vectorstore_langchain): tokens >=3 sobre texto normalizado
+_WORD = re.compile(r"[a-záéíóúüñ0-9]{3,}", re.IGNORECASE)
+
+
+def _norm(s: str) -> str:
+    s = (s or "").lower()
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def chunk_key(d: Document) -> Optional[str]:
+    return (d.metadata or {}).get("chunk_id")
+
+
+# -------------------- Construcción (index time) --------------------
+class AcumuladorFeatures:
+    """
+    Conteos del léxico + features de un shard, armados lote a lote durante la ingesta.
+    Cada chunk se vuelca (texto normalizado + frecuencias) a un archivo temporal: el
+    vocabulario recién se conoce al final y ahí se escriben los features, sin tener
+    en memoria todos los chunks normalizados a la vez.
+    """
+
+    def __init__(self):
+        self.conteos: Counter = Counter()  # ocurrencias por término en el shard (léxico)
+        self.n_chunks = 0
+        self._spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    def agregar(self, docs: Iterable[Document]) -> None:
+        for d in docs:
+            norm = _norm(d.page_content)
+            cnt = Counter(_WORD.findall(norm))
+            self.conteos.update(cnt)
+            cid = chunk_key(d)
+            if cid is None:
+                continue
+            self._spool.write(json.dumps([cid, norm, cnt], ensure_ascii=False) + "\n")
+            self.n_chunks += 1
+
+    def _filas(self, term_id: dict):
+        self._spool.seek(0)
+        for linea in self._spool:
+            cid, norm, cnt = json.loads(linea)
+            ids = sorted(term_id[t] for t in cnt if t in term_id)
+            yield cid, norm, ids, cnt
+
+    def escribir(self, vocab: List[str], out_path: str) -> None:
+        """Persiste, por chunk_id, [texto_normalizado, term_ids, frecuencias] + df por término."""
+        term_id = {t: i for i, t in enumerate(vocab)}
+        df = np.zeros(len(vocab), dtype=np.int64)
+        for _, _, ids, _ in self._filas(term_id):
+            df[ids] += 1
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            # mismo JSON que antes, escrito chunk a chunk
+            f.write('{"vocab": ' + json.dumps(vocab, ensure_ascii=False))
+            f.write(f', "df": {json.dumps(df.tolist())}, "n_chunks": {self.n_chunks}, "chunks": {{')
+            for i, (cid, norm, ids, cnt) in enumerate(self._filas(term_id)):
+                fila = [norm, ids, [cnt[vocab[j]] for j in ids]]
+                f.write((", " if i else "") + json.dumps(cid, ensure_ascii=False) + ": "
+                        + json.dumps(fila, ensure_ascii=False))
+            f.write("}}")
+        self._spool.close()
+
+
+def build_chunk_features(docs: List[Document], vocab: List[str], out_path: str) -> None:
+    """Persiste, por chunk_id, [texto_normalizado, term_ids, frecuencias] + df por término."""
+    acc = AcumuladorFeatures()
+    acc.agregar(docs)
+    acc.escribir(vocab, out_path)
+
+
+# -------------------- Consulta (request time) --------------------
+class ChunkFeatures:
+    def __init__(self, vocab: List[str], df: List[int], n_chunks: int, chunks: dict, stopwords: Iterable[str] = ()):
+        self.vocab = vocab
+        self.term_id = {t: i for i, t in enumerate(vocab)}
+        n = max(int(n_chunks), 1)
+        df_arr = np.asarray(df, dtype=np.float64)
+        # IDF estilo BM25 (siempre positivo)
+        self.idf = np.log(1.0 + (n - df_arr + 0.5) / (df_arr + 0.5))
+        stop = set(stopwords)
+        # candidatos a términos de expansión: >=4 letras y no stopword
+        self.prf_mask = np.array([len(t) >= 4 and t not in stop for t in vocab], dtype=bool)
+        self.norm: dict[str, str] = {}
+        self.vec: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for cid, (norm, ids, tfs) in chunks.items():
+            self.norm[cid] = norm
+            self.vec[cid] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.vec)
+
+    def has(self, docs: List[Document]) -> bool:
+        return bool(docs) and all(chunk_key(d) in self.vec for d in docs)
+
+    def has_anchor_terms(self, q_tokens: List[str], docs: List[Document]) -> bool:
+        """`q_tokens` ya normalizados. Primero por term-id; si no, substring en el texto normalizado guardado."""
+        if not q_tokens:
+            return True
+        cids = [chunk_key(d) for d in docs]
+        ctx_ids = set()
+        for cid in cids:
+            ctx_ids.update(self.vec[cid][0].tolist())
+        pending = []
+        for t in q_tokens:
+            tid = self.term_id.get(t)
+            if tid is not None and tid in ctx_ids:
+                return True
+            pending.append(t)
+        # preserva la semántica anterior (substring: 'mail' en 'email')
+        return any(t in self.norm[cid] for cid in cids for t in pending)
+
+    def prf_terms(self, docs: List[Document], exclude: Iterable[str] = (), max_terms: int = 6) -> List[str]:
+        """
+        RM3: sum_d P(w|D) * P(D|Q) con P(D|Q) decreciente por ranking, ponderado por IDF.
+        """
+        if not docs or max_terms <= 0:
+            return []
+        weights = np.zeros(len(self.vocab), dtype=np.float64)
+        prior = 1.0 / np.arange(1, len(docs) + 1)
+        prior /= prior.sum()
+        for p, d in zip(prior, docs):
+            ids, tfs = self.vec[chunk_key(d)]
+            total = tfs.sum()
+            if total > 0:
+                np.add.at(weights, ids, p * tfs / total)
+        weights *= self.idf
+        weights[~self.prf_mask] = 0.0
+        for t in exclude:
+            tid = self.term_id.get(t)
+            if tid is not None:
+                weights[tid] = 0.0
+        nz = int(np.count_nonzero(weights))
+        if nz == 0:
+            return []
+        k = min(max_terms, nz)
+        top = np.argpartition(-weights, k - 1)[:k]
+        top = top[np.argsort(-weights[top])]
+        return [self.vocab[i] for i in top]
+
+
+def load_chunk_features(dir_paths, stopwords: Iterable[str] = ()) -> Optional[ChunkFeatures]:
+    """
+    Carga los features de uno o varios shards. Con varios, unifica vocabularios
+    (remapea term-ids) y suma df/n_chunks para que el IDF sea el del corpus completo.
+    """
+    if isinstance(dir_paths, str):
+        dir_paths = [dir_paths]
+    vocab: List[str] = []
+    term_id: dict[str, int] = {}
+    df: List[int] = []
+    n_chunks = 0
+    chunks: dict = {}
+    for dp in dir_paths:
+        try:
+            with open(os.path.join(dp, FEATURES_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            continue  # shard sin features: sus chunks usan el camino por strings
+        remap = []
+        for t, d in zip(data["vocab"], data["df"]):
+            gid = term_id.get(t)
+            if gid is None:
+                gid = term_id[t] = len(vocab)
+                vocab.append(t)
+                df.append(0)
+            df[gid] += d
+            remap.append(gid)
+        n_chunks += data["n_chunks"]
+        for cid, (norm, ids, tfs) in data["chunks"].items():
+            chunks[cid] = [norm, [remap[i] for i in ids], tfs]
+    if not chunks:
+        return None
+    return ChunkFeatures(vocab, df, n_chunks, chunks, stopwords=stopwords)
@@ -0,0 +1,98 @@
+# llm_routing.py
+"""
+Ruteo adaptativo de llamadas al LLM. Lleva las consultas en vuelo y la latencia
+upstream de la generación (EWMA) y, según la carga, define un nivel de degradación:
+
+  0  normal
+  1  sobrecarga: se omite MultiQuery (una sola búsqueda por pasada)
+  2  sobrecarga severa: además la generación principal usa el modelo liviano
+
+También cuenta, por ruta (generacion / multiquery / historial), qué camino tomó
+cada llamada, timeouts, errores y latencia, para exponerlo en un endpoint de admin.
+"""
+import os, time, threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "16"))      # consultas simultáneas "normales"
+LLM_LATENCY_SLO_S = float(os.getenv("LLM_LATENCY_SLO_S", "8"))   # latencia de generación tolerada
+LLM_TIMEOUT_GEN = float(os.getenv("LLM_TIMEOUT_GEN", "45"))      # timeout de la generación principal
+LLM_TIMEOUT_AUX = float(os.getenv("LLM_TIMEOUT_AUX", "10"))      # MultiQuery y follow-ups
+_EWMA_ALPHA = 0.2
+
+
+def es_timeout(e: BaseException) -> bool:
+    """openai.APITimeoutError, httpx.TimeoutException, TimeoutError..."""
+    return isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower()
+
+
+class LLMRouter:
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT, latency_slo_s: float = LLM_LATENCY_SLO_S):
+        self.max_inflight = max(1, int(max_inflight))
+        self.latency_slo_s = float(latency_slo_s)
+        self._lock = threading.Lock()
+        self.en_vuelo = 0
+        self.ewma_s: Dict[str, float] = {}
+        self.caminos: Dict[str, Counter] = defaultdict(Counter)
+        self.timeouts: Counter = Counter()
+        self.errores: Counter = Counter()
+        self.niveles: Counter = Counter()
+
+    def nivel(self) -> int:
+        carga = self.en_vuelo / self.max_inflight
+        lat = self.ewma_s.get("generacion", 0.0) / self.latency_slo_s if self.latency_slo_s > 0 else 0.0
+        x = max(carga, lat)
+        return 0 if x <= 1.0 else (1 if x <= 2.0 else 2)
+
+    @contextmanager
+    def solicitud(self):
+        """Cuenta la consulta como en vuelo y entrega el nivel de degradación que le toca."""
+        with self._lock:
+            self.en_vuelo += 1
+            nivel = self.nivel()
+            self.niveles[nivel] += 1
+        try:
+            yield nivel
+        finally:
+            with self._lock:
+                self.en_vuelo -= 1
+
+    def registrar(self, ruta: str, camino: str, dur_s: float | None = None) -> None:
+        with self._lock:
+            self.caminos[ruta][camino] += 1
+            if dur_s is not None:
+                prev = self.ewma_s.get(ruta)
+                self.ewma_s[ruta] = dur_s if prev is None else (1 - _EWMA_ALPHA) * prev + _EWMA_ALPHA * dur_s
+
+    def invocar(self, ruta: str, camino: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta `fn` midiendo latencia; un timeout también alimenta la EWMA (es latencia upstream)."""
+        t0 = time.perf_counter()
+        try:
+            out = fn(*args, **kwargs)
+        except Exception as e:
+            dur = time.perf_counter() - t0
+            with self._lock:
+                (self.timeouts if es_timeout(e) else self.errores)[ruta] += 1
+            self.registrar(ruta, "timeout" if es_timeout(e) else "error", dur if es_timeout(e) else None)
+            raise
+        self.registrar(ruta, camino, time.perf_counter() - t0)
+        return out
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "en_vuelo": self.en_vuelo,
+                "nivel_actual": self.nivel(),
+                "max_en_vuelo": self.max_inflight,
+                "latencia_slo_s": self.latency_slo_s,
+                "ewma_s": {k: round(v, 3) for k, v in self.ewma_s.items()},
+                "caminos": {k: dict(v) for k, v in self.caminos.items()},
+                "niveles": {str(k): v for k, v in sorted(self.niveles.items())},
+                "timeouts": dict(self.timeouts),
+                "errores": dict(self.errores),
+            }
+
+
+# un router por proceso: sobrevive a las recargas del índice
+router = LLMRouter()
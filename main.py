@@ -1,25 +1,42 @@
-from fastapi import FastAPI, File, UploadFile, Depends, status, HTTPException, Path
+from fastapi import FastAPI, File, Form, UploadFile, Depends, status, HTTPException, Path, Query, Response
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, or_, and_
 import shutil
 import os
 import re
+import base64
+import zipfile
+import time
+import threading
 from datetime import datetime
 from pydantic import BaseModel
 from sqlalchemy.exc import IntegrityError
 
 from database import SessionLocal, engine
-from models import Base, Documento, Conversacion, Mensaje, Usuario
+from models import Base, Documento, Conversacion, Mensaje, Usuario, ensure_indexes, ensure_columns
 from utils import extraer_texto_pdf
-from utils import registrar_consulta_no_resuelta
+from text_pipeline import split_text
+from utils import registrar_consulta_no_resuelta, iniciar_registro_no_resueltas, detener_registro_no_resueltas
 
 # LangChain / RAG
-from vectorstore_langchain import build_faiss, INDEX_DIR
+from vectorstore_langchain import (
+    build_faiss, has_index, shard_dirs, slug_coleccion, index_version, version_dir, current_index_dir,
+    read_manifest, documentos_indexados, INDEX_DIR, DEFAULT_COLLECTION
+)
 from rag_chain import build_rag, INSUFF_MSG
 
 from auth import crear_token, verificar_contraseña, verificar_token, hashear_contraseña
+from ttl_cache import TTLCache
+from knowledge_graph import recargar_grafo
+from llm_routing import router
+from chat_writer import mensajes_writer
+from pipeline_profiles import PERFILES
+from deadline import Deadline, tiempos
+from profiler import sampling_profiler
+from componentes import componentes
+import clusters_no_resueltas
 
 app = FastAPI()
 
@@ -30,27 +47,86 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Siguiente-Cursor"],
 )
 
 # ---------- Mensajes ----------
 NO_INDEX_MSG = "No hay documentos indexados."
 
-def _no_index_answer(_q: str, history=None):
+def _no_index_answer(_q: str, history=None, **_):
     return NO_INDEX_MSG, []
 
 # valor por defecto seguro si aún no existe el índice
 answer = _no_index_answer
-
-# Crear tablas si no existen
+_answer_version: str | None = None  # versión publicada del índice que sirve `answer`
+
+# ---------- Recarga del índice entre workers ----------
+# Cada worker compara (a lo sumo cada INDEX_POLL_SEC) indices/CURRENT con la versión
+# que sirve; si otro proceso publicó una nueva, la carga en segundo plano y recién
+# entonces reemplaza `answer` (sin cortar el servicio).
+INDEX_POLL_SEC = float(os.getenv("INDEX_POLL_SEC", "2"))
+_reload_lock = threading.Lock()
+_last_poll = 0.0
+_ultima_carga_s: float | None = None  # lectura de FAISS/BM25/léxico de la última versión (los modelos se reusan)
+
+def _cargar_answer(version: str | None = None) -> bool:
+    global answer, _answer_version, _ultima_carga_s
+    version = version if version is not None else index_version(INDEX_DIR)
+    t0 = time.perf_counter()
+    if not shard_dirs(version_dir(version, INDEX_DIR)):
+        # versión publicada sin shards (se borraron todos los documentos): no hay nada que servir
+        answer, _answer_version = _no_index_answer, version
+        return False
+    try:
+        fn = build_rag(index_dir=version_dir(version, INDEX_DIR))
+    except Exception as e:
+        # se sigue sirviendo lo anterior y `_answer_version` no avanza: el próximo poll reintenta
+        print(f"[WARN] build_rag ({version}): {type(e).__name__}: {e}; se sigue sirviendo {_answer_version}")
+        return False
+    _ultima_carga_s = round(time.perf_counter() - t0, 3)
+    answer, _answer_version = fn, version
+    return True
+
+def _recargar() -> bool:
+    """Recarga síncrona de la versión publicada (tras un build en este worker)."""
+    with _reload_lock:
+        return _cargar_answer()
+
+def _recargar_en_fondo(version: str | None) -> None:
+    try:
+        _cargar_answer(version)
+    finally:
+        _reload_lock.release()
+
+def _answer_actual():
+    global _last_poll
+    now = time.monotonic()
+    if now - _last_poll >= INDEX_POLL_SEC:
+        _last_poll = now
+        v = index_version(INDEX_DIR)
+        if v != _answer_version and _reload_lock.acquire(blocking=False):
+            threading.Thread(target=_recargar_en_fondo, args=(v,), name="index-reload", daemon=True).start()
+    return answer if callable(answer) else _no_index_answer
+
+# Crear tablas si no existen (+ índices compuestos nuevos en tablas existentes)
 Base.metadata.create_all(bind=engine)
+ensure_columns(engine)
+ensure_indexes(engine)
 
 # Inicializar RAG si hay índice en disco
 os.makedirs(INDEX_DIR, exist_ok=True)
-if os.path.exists(os.path.join(INDEX_DIR, "index.faiss")):
-    try:
-        answer = build_rag()  # devuelve (question, history=None) -> (texto, fuentes)
-    except Exception:
-        answer = _no_index_answer
+if has_index(INDEX_DIR):
+    _recargar()  # answer: (question, history=None) -> (texto, fuentes)
+
+@app.on_event("startup")
+def _startup():
+    iniciar_registro_no_resueltas()
+    mensajes_writer.start()
+
+@app.on_event("shutdown")
+def _shutdown():
+    detener_registro_no_resueltas()
+    mensajes_writer.stop()
 
 # ========= DB dependency =========
 def get_db():
@@ -97,15 +173,64 @@ def sugerir_titulo_con_keywords(texto: str, max_len: int = 60) -> str:
         titulo = titulo[:max_len].rstrip() + "…"
     return titulo
 
+# ===== paginación keyset =====
+def _encode_cursor(fecha: datetime, id_: int) -> str:
+    raw = f"{fecha.isoformat()}|{id_}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        fecha, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(fecha), int(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _keyset_page(q, fecha_col, id_col, limite: int, cursor: str | None):
+    """
+    Página de `limite` filas en orden (fecha, id) descendente a partir de `cursor`.
+    Devuelve (filas, siguiente_cursor | None).
+    """
+    if cursor:
+        fecha_c, id_c = _decode_cursor(cursor)
+        q = q.filter(or_(fecha_col < fecha_c, and_(fecha_col == fecha_c, id_col < id_c)))
+    # uno de más para saber si quedan páginas
+    filas = q.order_by(fecha_col.desc(), id_col.desc()).limit(limite + 1).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    ultima = filas[-1] if filas else None
+    fecha_u = getattr(ultima, fecha_col.key, None) if ultima is not None else None
+    siguiente = _encode_cursor(fecha_u, ultima.id) if (hay_mas and fecha_u is not None) else None
+    return filas, siguiente
+
+# Usuarios activos por id: evita el SELECT por PK en cada request autenticado.
+# Los endpoints de admin invalidan al instante; el TTL acota lo que vean otros workers.
+_user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX", "4096")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Usuario:
     payload = verificar_token(token)
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
-    user = db.get(Usuario, int(payload["sub"]))  # SQLAlchemy 2.0
+    user_id = int(payload["sub"])
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+    user = db.get(Usuario, user_id)  # SQLAlchemy 2.0
     if not user or not user.activo:
         raise HTTPException(status_code=401, detail="Usuario no válido")
+    # se cachea desacoplado de la sesión del request (sólo se leen columnas)
+    db.expunge(user)
+    _user_cache.set(user_id, user)
     return user
 
+def _colecciones_de(user: Usuario) -> list[str] | None:
+    """Colecciones que el usuario puede consultar (None = sin restricción; "" = ninguna)."""
+    if user.colecciones is None:
+        return None
+    return [slug_coleccion(c) for c in user.colecciones.split(",") if c.strip()]
+
 def require_admin(user: Usuario = Depends(get_current_user)) -> Usuario:
     if not user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo admins")
@@ -263,6 +388,7 @@ class UserCreateIn(BaseModel):
     nombre: str | None = None
     is_admin: bool = False
     activo: bool = True
+    colecciones: list[str] | None = None
 
 class UserCreatedOut(BaseModel):
     id: int
@@ -270,6 +396,22 @@ class UserCreatedOut(BaseModel):
     nombre: str | None = None
     is_admin: bool
     activo: bool
+    colecciones: list[str] | None = None
+
+class ColeccionesIn(BaseModel):
+    colecciones: list[str] | None = None  # None = todas
+
+def _user_out(u: Usuario) -> UserCreatedOut:
+    return UserCreatedOut(
+        id=u.id, username=u.username, nombre=u.nombre,
+        is_admin=bool(u.is_admin), activo=bool(u.activo),
+        colecciones=_colecciones_de(u),
+    )
+
+def _colecciones_csv(colecciones: list[str] | None) -> str | None:
+    if colecciones is None:
+        return None
+    return ",".join(dict.fromkeys(slug_coleccion(c) for c in colecciones))
 
 @app.post("/admin/users", response_model=UserCreatedOut)
 def crear_usuario(body: UserCreateIn, db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
@@ -279,6 +421,7 @@ def crear_usuario(body: UserCreateIn, db: Session = Depends(get_db), _: Usuario
         password_hash=hashear_contraseña(body.password),
         is_admin=bool(body.is_admin),
         activo=bool(body.activo),
+        colecciones=_colecciones_csv(body.colecciones),
     )
     db.add(nuevo)
     try:
@@ -287,20 +430,12 @@ def crear_usuario(body: UserCreateIn, db: Session = Depends(get_db), _: Usuario
         db.rollback()
         raise HTTPException(status_code=409, detail="El usuario ya existe")
     db.refresh(nuevo)
-    return UserCreatedOut(
-        id=nuevo.id, username=nuevo.username, nombre=nuevo.nombre,
-        is_admin=bool(nuevo.is_admin), activo=bool(nuevo.activo)
-    )
+    return _user_out(nuevo)
 
 @app.get("/admin/users", response_model=list[UserCreatedOut])
 def listar_usuarios(db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
     users = db.query(Usuario).order_by(Usuario.id).all()
-    return [
-        UserCreatedOut(
-            id=u.id, username=u.username, nombre=u.nombre,
-            is_admin=bool(u.is_admin), activo=bool(u.activo)
-        ) for u in users
-    ]
+    return [_user_out(u) for u in users]
 
 @app.patch("/admin/users/{user_id}/estado", response_model=UserCreatedOut)
 def cambiar_estado_usuario(user_id: int, activo: bool, db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
@@ -310,10 +445,19 @@ def cambiar_estado_usuario(user_id: int, activo: bool, db: Session = Depends(get
     u.activo = bool(activo)
     db.commit()
     db.refresh(u)
-    return UserCreatedOut(
-        id=u.id, username=u.username, nombre=u.nombre,
-        is_admin=bool(u.is_admin), activo=bool(u.activo)
-    )
+    _user_cache.invalidate(user_id)
+    return _user_out(u)
+
+@app.patch("/admin/users/{user_id}/colecciones", response_model=UserCreatedOut)
+def cambiar_colecciones_usuario(user_id: int, body: ColeccionesIn, db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
+    u = db.get(Usuario, user_id)
+    if not u:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    u.colecciones = _colecciones_csv(body.colecciones)
+    db.commit()
+    db.refresh(u)
+    _user_cache.invalidate(user_id)
+    return _user_out(u)
 
 @app.delete("/admin/users/{user_id}", status_code=204)
 def borrar_usuario(user_id: int, db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
@@ -322,14 +466,78 @@ def borrar_usuario(user_id: int, db: Session = Depends(get_db), _: Usuario = Dep
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     db.delete(u)
     db.commit()
+    _user_cache.invalidate(user_id)
     return
 
+@app.get("/admin/cache/usuarios")
+def stats_cache_usuarios(_: Usuario = Depends(require_admin)):
+    return _user_cache.stats()
+
+@app.get("/admin/llm/metricas")
+def metricas_llm(_: Usuario = Depends(require_admin)):
+    """Consultas en vuelo, nivel de degradación, latencia y camino tomado por ruta del LLM."""
+    return {**router.metricas(), "deadline": tiempos.resumen()}
+
+@app.get("/admin/no-resueltas/clusters")
+def clusters_no_resueltas_reporte(top: int = Query(50, ge=1, le=1000), _: Usuario = Depends(require_admin)):
+    """Último reporte de temas de las consultas no resueltas (el job lo recalcula con POST)."""
+    reporte = clusters_no_resueltas.leer_reporte()
+    if reporte is None:
+        raise HTTPException(status_code=404, detail="Todavía no hay reporte: lanzalo con POST")
+    return {**reporte, "clusters": reporte["clusters"][:top], "en_curso": clusters_no_resueltas.job_en_curso()}
+
+@app.post("/admin/no-resueltas/clusters", status_code=202)
+def clusters_no_resueltas_recalcular(k: int = Query(0, ge=0, description="0 = automático"),
+                                     desde: datetime | None = Query(None),
+                                     _: Usuario = Depends(require_admin)):
+    """Embebe lo nuevo (el resto sale del cache) y reagrupa en segundo plano."""
+    if clusters_no_resueltas.job_en_curso():
+        raise HTTPException(status_code=409, detail="Ya hay un agrupamiento en curso")
+
+    def _job():
+        try:
+            clusters_no_resueltas.correr_job(k=k or None, desde=desde)
+        except Exception:
+            pass  # ya quedó en el log del job
+
+    threading.Thread(target=_job, name="clusters-no-resueltas", daemon=True).start()
+    return {"estado": "en_curso"}
+
+@app.post("/admin/profiler/iniciar")
+def iniciar_profiler(
+    fraccion: float = Query(0.1, gt=0, le=1, description="fracción de consultas muestreadas"),
+    intervalo_ms: float = Query(10.0, ge=1),
+    duracion_s: float = Query(60.0, gt=0),
+    _: Usuario = Depends(require_admin),
+):
+    """Muestrea la pila de una fracción de /buscar y /conversaciones/{id}/mensaje (sólo en este worker)."""
+    return sampling_profiler.iniciar(fraccion, intervalo_ms, duracion_s)
+
+@app.post("/admin/profiler/detener")
+def detener_profiler(_: Usuario = Depends(require_admin)):
+    return sampling_profiler.detener()
+
+@app.get("/admin/profiler/reporte")
+def reporte_profiler(formato: str = Query("collapsed", pattern="^(collapsed|json)$"),
+                     _: Usuario = Depends(require_admin)):
+    """`collapsed`: texto para flamegraph.pl / speedscope. `json`: funciones con más muestras."""
+    if formato == "json":
+        return sampling_profiler.resumen()
+    return Response(content=sampling_profiler.collapsed(), media_type="text/plain; charset=utf-8")
+
+@app.post("/admin/grafo/recargar")
+def recargar_grafo_conocimiento(_: Usuario = Depends(require_admin)):
+    """Recompila el índice de entidades sin esperar al sondeo por mtime."""
+    idx = recargar_grafo()
+    return {"nodos": idx.n_nodos, "entidades": len(idx)}
+
 # ========= Admin: Datasets (solo admin) =========
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @app.post("/upload")
-async def upload_pdf(archivo: UploadFile = File(...), db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
+async def upload_pdf(archivo: UploadFile = File(...), coleccion: str = Form(DEFAULT_COLLECTION),
+                     db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
     # Permitir content-type variable, validar por extensión
     if not archivo.filename.lower().endswith(".pdf"):
         return {"error": "Solo se permiten archivos PDF"}
@@ -348,29 +556,137 @@ async def upload_pdf(archivo: UploadFile = File(...), db: Session = Depends(get_
     if not texto_concatenado.strip():
         raise HTTPException(status_code=400, detail="No se pudo extraer texto del PDF")
 
+    coleccion = slug_coleccion(coleccion)
     doc = Documento(
         nombre_archivo=archivo.filename,
         fecha_subida=datetime.utcnow(),
-        texto_limpio=texto_concatenado
+        texto_limpio=texto_concatenado,
+        coleccion=coleccion,
     )
     db.add(doc)
     db.commit()
     db.refresh(doc)
 
-    # Reindex con LangChain
-    build_faiss(INDEX_DIR)
-    global answer
-    try:
-        answer = build_rag()
-    except Exception:
-        answer = _no_index_answer
+    # Reindex con LangChain (sólo el shard de la colección)
+    build_faiss(INDEX_DIR, colecciones=[coleccion])
+    _recargar()
 
     return {"message": "PDF subido exitosamente", "id": doc.id}
 
+def _reindexar(colecciones: list[str] | None = None) -> bool:
+    """Reconstruye shards (todos si None) + función de respuesta. False si no quedó índice utilizable."""
+    try:
+        build_faiss(INDEX_DIR, colecciones=colecciones)
+    except Exception as e:
+        # se sigue sirviendo lo publicado (vacío si era RuntimeError por falta de documentos)
+        print(f"[WARN] build_faiss: {type(e).__name__}: {e}")
+    return _recargar()
+
+@app.post("/upload-masivo")
+def upload_masivo(archivos: list[UploadFile] = File(...), coleccion: str = Form(DEFAULT_COLLECTION),
+                  db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
+    """
+    Ingesta de muchos PDFs (sueltos y/o dentro de ZIPs): guarda en uploads/, crea
+    todos los Documento en una sola transacción y reindexa UNA vez al final.
+    Devuelve un reporte por archivo (páginas, chunks, errores).
+    """
+    coleccion = slug_coleccion(coleccion)
+    existentes = {n for (n,) in db.query(Documento.nombre_archivo).all()}
+    reporte: list[dict] = []
+    nuevos: list[Documento] = []
+    escritos: list[str] = []
+
+    def ingestar(nombre: str, origen) -> None:
+        nombre = os.path.basename(nombre)
+        if nombre in existentes:
+            reporte.append({"archivo": nombre, "estado": "duplicado"})
+            return
+        file_path = os.path.join(UPLOAD_DIR, nombre)
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(origen, buffer)
+        paginas = extraer_texto_pdf(file_path)
+        texto = "\n".join(t for _, t in paginas)
+        if not texto.strip():
+            os.remove(file_path)
+            reporte.append({"archivo": nombre, "estado": "error", "detalle": "No se pudo extraer texto del PDF"})
+            return
+        chunks = sum(len(split_text(t, meta={})) for _, t in paginas)
+        existentes.add(nombre)
+        escritos.append(file_path)
+        nuevos.append(Documento(nombre_archivo=nombre, fecha_subida=datetime.utcnow(),
+                                texto_limpio=texto, coleccion=coleccion))
+        reporte.append({"archivo": nombre, "estado": "ok", "paginas": len(paginas), "chunks": chunks})
+
+    for archivo in archivos:
+        nombre = archivo.filename or ""
+        try:
+            if nombre.lower().endswith(".pdf"):
+                ingestar(nombre, archivo.file)
+            elif nombre.lower().endswith(".zip"):
+                with zipfile.ZipFile(archivo.file) as zf:
+                    for info in zf.infolist():
+                        if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                            continue
+                        with zf.open(info) as src:
+                            ingestar(info.filename, src)
+            else:
+                reporte.append({"archivo": nombre, "estado": "error", "detalle": "Solo se permiten archivos PDF o ZIP"})
+        except zipfile.BadZipFile:
+            reporte.append({"archivo": nombre, "estado": "error", "detalle": "ZIP inválido"})
+
+    if nuevos:
+        db.add_all(nuevos)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            for path in escritos:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise HTTPException(status_code=500, detail="Error al registrar los documentos")
+
+    reindexado = _reindexar([coleccion]) if nuevos else False
+    return {
+        "procesados": len(nuevos),
+        "fallidos": sum(1 for r in reporte if r["estado"] == "error"),
+        "reindexado": reindexado,
+        "archivos": reporte,
+    }
+
+def _rss_actual_mb() -> float | None:
+    """RSS actual del worker (Linux); None donde /proc no existe."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+@app.get("/admin/indice/stats")
+def stats_indice(detalle: bool = Query(False), _: Usuario = Depends(require_admin)):
+    """Stats de la versión publicada (del manifest) + estado de este worker.
+    `detalle=true` agrega los chunks por documento."""
+    manifest = read_manifest(INDEX_DIR)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail=NO_INDEX_MSG)
+    out = {
+        "version": manifest.get("version"),
+        "creado": manifest.get("creado"),
+        "reconstruidas": manifest.get("reconstruidas", []),
+        **manifest.get("stats", {}),
+        "worker": {"version_servida": _answer_version, "rss_mb": _rss_actual_mb(),
+                   "ultima_carga_s": _ultima_carga_s, "componentes": componentes.resumen()},
+    }
+    if detalle:
+        out["por_documento"] = documentos_indexados(current_index_dir(INDEX_DIR))
+    return out
+
 @app.get("/listar-datasets")
 def listar_datasets(db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
     documentos = db.query(Documento).all()
-    return [{"id": d.id, "nombre": d.nombre_archivo} for d in documentos]
+    return [{"id": d.id, "nombre": d.nombre_archivo, "coleccion": d.coleccion} for d in documentos]
 
 @app.delete("/eliminar-dataset/{id}")
 def eliminar_dataset(id: int, db: Session = Depends(get_db), _: Usuario = Depends(require_admin)):
@@ -385,16 +701,12 @@ def eliminar_dataset(id: int, db: Session = Depends(get_db), _: Usuario = Depend
         except PermissionError:
             pass  # Windows a veces bloquea el archivo si está abierto
 
+    coleccion = documento.coleccion
     db.delete(documento)
     db.commit()
 
-    # Reindexar para limpiar índices y refrescar función de respuesta
-    global answer
-    try:
-        build_faiss(INDEX_DIR)
-        answer = build_rag()
-    except Exception:
-        answer = _no_index_answer
+    # Reindexar el shard para limpiar índices y refrescar función de respuesta
+    _reindexar([coleccion])
 
     return {"mensaje": "Documento eliminado y reindexado correctamente"}
 
@@ -409,29 +721,37 @@ def eliminar_documento(id: int, _: Usuario = Depends(require_admin)):
 
 @app.post("/actualizar-documentos")
 def actualizar_documentos(_: Usuario = Depends(require_admin)):
-    global answer
     try:
         build_faiss(INDEX_DIR)
-        answer = build_rag()
-        return {"mensaje": "Documentos reindexados correctamente"}
     except RuntimeError:
-        answer = _no_index_answer
+        _recargar()
         return {"mensaje": NO_INDEX_MSG}
     except Exception:
-        answer = _no_index_answer
+        _recargar()
         raise HTTPException(status_code=500, detail="Error al reindexar")
+    if not _recargar():
+        raise HTTPException(status_code=500, detail="Error al reindexar")
+    return {"mensaje": "Documentos reindexados correctamente"}
 
 @app.get("/buscar")
-def buscar_respuesta(pregunta: str):
-    fn = answer if callable(answer) else _no_index_answer
-    texto, fuentes = fn(pregunta)
+@sampling_profiler.perfilable("buscar")
+def buscar_respuesta(pregunta: str, perfil: str | None = Query(None, description="fast | balanced | accurate"),
+                     current_user: Usuario = Depends(get_current_user)):
+    """Consulta sin conversación; sólo busca en las colecciones que el usuario puede ver."""
+    deadline = Deadline()
+    if perfil is not None and perfil.lower() not in PERFILES:
+        raise HTTPException(status_code=400, detail=f"Perfil inválido (opciones: {', '.join(PERFILES)})")
+    fn = _answer_actual()
+    meta = {}
+    texto, fuentes = fn(pregunta, colecciones=_colecciones_de(current_user), perfil=perfil,
+                        deadline=deadline, meta=meta)
 
     if not texto or texto.strip() == "":
-        return {"respuesta": INSUFF_MSG, "fuentes": []}
+        return {"respuesta": INSUFF_MSG, "fuentes": [], "meta": meta}
 
     txt = clean_text_remove_quote_lines(texto)
     if txt in (INSUFF_MSG, NO_INDEX_MSG):
-        return {"respuesta": txt, "fuentes": []}
+        return {"respuesta": txt, "fuentes": [], "meta": meta}
 
     order, docs_pages = normalize_sources(fuentes)
     fuentes_fmt = format_sources_list(order, docs_pages)
@@ -443,7 +763,7 @@ def buscar_respuesta(pregunta: str):
     if fuentes_fmt:
         respuesta_txt = f"{txt}\n\nBasado en: {'; '.join(fuentes_fmt)}"
 
-    return {"respuesta": respuesta_txt, "fuentes": fuentes_fmt}
+    return {"respuesta": respuesta_txt, "fuentes": fuentes_fmt, "meta": meta}
 
 
 # ========= Conversaciones (asociadas a usuario) =========
@@ -483,43 +803,68 @@ def crear_conversacion(
     db.refresh(conv)
     return conv
 
+CONV_PAGE_SIZE = int(os.getenv("CONV_PAGE_SIZE", "50"))
+
 @app.get("/conversaciones", response_model=list[ConversacionOut])
 def listar_conversaciones(
+    response: Response,
+    limite: int = Query(CONV_PAGE_SIZE, ge=1, le=200),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user),
 ):
-    convs = db.query(Conversacion).filter(Conversacion.user_id == current_user.id) \
-                                  .order_by(Conversacion.fecha_creacion.desc()).all()
+    """Más recientes primero; si hay más, el cursor de la próxima página va en `X-Siguiente-Cursor`."""
+    q = db.query(Conversacion).filter(Conversacion.user_id == current_user.id)
+    convs, siguiente = _keyset_page(q, Conversacion.fecha_creacion, Conversacion.id, limite, cursor)
+    if siguiente:
+        response.headers["X-Siguiente-Cursor"] = siguiente
     return convs
 
+MSG_PAGE_SIZE = int(os.getenv("MSG_PAGE_SIZE", "50"))
+
 @app.get("/conversaciones/{conv_id}")
 def obtener_conversacion(
     conv_id: int,
+    limite: int = Query(MSG_PAGE_SIZE, ge=1, le=200),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user),
 ):
+    """
+    Devuelve los `limite` mensajes más recientes (en orden cronológico). Para
+    cargar los anteriores se pasa `cursor=siguiente_cursor` de la respuesta previa.
+    """
     conv = db.query(Conversacion).filter(
         Conversacion.id == conv_id,
         Conversacion.user_id == current_user.id
     ).first()
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
+
+    # la última respuesta puede estar todavía en el write-behind
+    if mensajes_writer.sincronizar(conv.id):
+        db.commit()  # cierra el snapshot de lectura para ver lo recién escrito
+    q = db.query(Mensaje).filter(Mensaje.conversacion_id == conv.id)
+    pagina, siguiente = _keyset_page(q, Mensaje.fecha, Mensaje.id, limite, cursor)
     return {
         "id": conv.id,
         "titulo": conv.titulo,
         "mensajes": [
             {"rol": m.rol, "contenido": m.contenido, "fecha": m.fecha.isoformat() if m.fecha else None}
-            for m in conv.mensajes
+            for m in reversed(pagina)
         ],
+        "siguiente_cursor": siguiente,
     }
 
 @app.post("/conversaciones/{conv_id}/mensaje", response_model=dict, status_code=201)
+@sampling_profiler.perfilable("mensaje")
 def agregar_mensaje(
     conv_id: int,
     mensaje: MensajeInput,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user),
 ):
+    deadline = Deadline()  # el SLA corre desde que llega el mensaje, DB incluida
     conv = db.query(Conversacion).filter(
         Conversacion.id == conv_id,
         Conversacion.user_id == current_user.id
@@ -527,29 +872,37 @@ def agregar_mensaje(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
-    # Título automático en el 1er mensaje del usuario
-    hay_mensajes = db.query(Mensaje.id).filter(Mensaje.conversacion_id == conv.id).first() is not None
-    if not hay_mensajes and mensaje.rol.lower() == "user":
+    # La respuesta anterior puede seguir en el write-behind: se escribe antes que este
+    # turno (no-op casi siempre). Después, una sola transacción: historial, título y mensaje.
+    if mensajes_writer.sincronizar(conv.id):
+        db.commit()  # cierra el snapshot de lectura: el historial tiene que ver esa respuesta
+
+    # 1) historial previo (últimos N turnos); vacío = 1er mensaje de la conversación
+    N = int(os.getenv("HISTORY_TURNS", "6"))
+    ultimos = (db.query(Mensaje.rol, Mensaje.contenido)
+                 .filter(Mensaje.conversacion_id == conv.id)
+                 .order_by(Mensaje.fecha.desc(), Mensaje.id.desc())
+                 .limit(max(N, 1))
+                 .all())
+    es_user = mensaje.rol.lower() == "user"
+    if not ultimos and es_user:
         conv.titulo = sugerir_titulo_con_keywords(mensaje.contenido)
 
-    # 1) guardo el mensaje entrante
+    # 2) guardo el mensaje entrante
     db.add(Mensaje(conversacion_id=conv.id, rol=mensaje.rol, contenido=mensaje.contenido))
     db.commit()
 
-    if mensaje.rol.lower() != "user":
+    if not es_user:
         return {"mensaje": "Mensaje agregado"}
 
-    # 2) armo historial (últimos N turnos)
-    N = int(os.getenv("HISTORY_TURNS", "6"))
-    mensajes = (db.query(Mensaje)
-                  .filter(Mensaje.conversacion_id == conv.id)
-                  .order_by(Mensaje.fecha.asc())
-                  .all())
-    history = [{"role": m.rol, "content": m.contenido} for m in mensajes][-N:]
+    history = [{"role": rol, "content": contenido} for rol, contenido in reversed(ultimos)]
+    history = (history + [{"role": mensaje.rol, "content": mensaje.contenido}])[-N:] if N > 0 else []
 
     # 3) respondo con RAG + historial
-    fn = answer if callable(answer) else _no_index_answer
-    texto, fuentes = fn(mensaje.contenido, history=history)
+    fn = _answer_actual()
+    meta = {}
+    texto, fuentes = fn(mensaje.contenido, history=history, colecciones=_colecciones_de(current_user),
+                       conversacion_id=conv.id, deadline=deadline, meta=meta)
 
     # 4) formateo “Basado en: …” con la misma lógica que /buscar
     order, docs_pages = normalize_sources(fuentes)
@@ -563,10 +916,10 @@ def agregar_mensaje(
     if fuentes_fmt:
         respuesta_txt = f"{texto}\n\nBasado en: {'; '.join(fuentes_fmt)}"
 
-    db.add(Mensaje(conversacion_id=conv.id, rol="assistant", contenido=respuesta_txt))
-    db.commit()
+    # write-behind (con un solo worker): la latencia de la DB no se suma a la respuesta
+    mensajes_writer.encolar(conv.id, "assistant", respuesta_txt)
 
-    return {"respuesta": respuesta_txt, "fuentes": fuentes_fmt}
+    return {"respuesta": respuesta_txt, "fuentes": fuentes_fmt, "meta": meta}
 
 @app.delete("/conversaciones/{conv_id}", status_code=204)
 def borrar_conversacion(
@@ -580,6 +933,7 @@ def borrar_conversacion(
     ).first()
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
+    mensajes_writer.descartar(conv.id)
     db.delete(conv)
     db.commit()
     return
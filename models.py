@@ -1,8 +1,9 @@
 from sqlalchemy import (
     Column, Integer, String, Text, Boolean, TIMESTAMP, DateTime,
-    ForeignKey, text
+    ForeignKey, Index, text, inspect
 )
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.dialects.mysql import BIGINT as MySQLBigInt
 from database import Base
 from datetime import datetime
@@ -17,6 +18,8 @@ class Usuario(Base):
     is_admin = Column(Boolean, nullable=False, server_default=text("0"))
     activo = Column(Boolean, nullable=False, server_default=text("1"))
     creado_en = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+    # colecciones visibles separadas por coma; NULL = todas
+    colecciones = Column(String(500), nullable=True)
 
     # Relación con conversaciones del usuario
     conversaciones = relationship(
@@ -31,9 +34,13 @@ class Documento(Base):
     nombre_archivo = Column(String(255), nullable=False)
     fecha_subida = Column(DateTime, default=datetime.utcnow)
     texto_limpio = Column(Text)
+    # shard del índice (indices/<coleccion>/), p.ej. por departamento
+    coleccion = Column(String(100), nullable=False, server_default=text("'general'"), index=True)
 
 class Conversacion(Base):
     __tablename__ = "conversaciones"
+    # listado paginado del sidebar (más recientes primero)
+    __table_args__ = (Index("ix_conversaciones_user_fecha", "user_id", "fecha_creacion"),)
     id = Column(Integer, primary_key=True, index=True)
     titulo = Column(String)
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
@@ -50,6 +57,8 @@ class Conversacion(Base):
 
 class Mensaje(Base):
     __tablename__ = "mensajes"
+    # historial y paginación por conversación en orden cronológico
+    __table_args__ = (Index("ix_mensajes_conv_fecha", "conversacion_id", "fecha"),)
     id = Column(Integer, primary_key=True, index=True)
     contenido = Column(Text)
     rol = Column(String)  # "user" | "assistant"
@@ -57,3 +66,35 @@ class Mensaje(Base):
 
     conversacion_id = Column(Integer, ForeignKey("conversaciones.id"))
     conversacion = relationship("Conversacion", back_populates="mensajes")
+
+def ensure_indexes(bind) -> None:
+    """
+    create_all no agrega índices a tablas que ya existen: crea los compuestos
+    (declarados en __table_args__) que falten. Los de una sola columna quedan como están.
+    """
+    insp = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existentes = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for ix in table.indexes:
+            if len(ix.columns) > 1 and ix.name not in existentes:
+                ix.create(bind=bind)
+
+def ensure_columns(bind) -> None:
+    """create_all tampoco agrega columnas nuevas a tablas existentes: ALTER TABLE ADD de las que falten."""
+    insp = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existentes = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existentes:
+                continue
+            ddl = CreateColumn(col).compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            if col.index:
+                for ix in table.indexes:
+                    if list(ix.columns) == [col]:
+                        ix.create(bind=bind)
@@ -0,0 +1,52 @@
+# pipeline_profiles.py
+"""
+Perfiles del pipeline RAG: qué etapas corren y con qué tamaños.
+
+  fast      una sola recuperación híbrida (sin MultiQuery, sin PRF, sin rerank),
+            pocos candidatos y sin el gate semántico de OOD
+  balanced  sin MultiQuery (no llama al LLM para recuperar); PRF y rerank normales
+  accurate  todas las etapas (el comportamiento de siempre)
+
+Se elige por despliegue con PIPELINE_PROFILE y por consulta (p.ej. `/buscar?perfil=fast`).
+Un valor None deja el de las variables de entorno (PRF_TERMS, RERANK_TOP_N, HYBRID_*).
+"""
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from hybrid_search import HybridParams
+
+
+@dataclass(frozen=True)
+class PerfilPipeline:
+    nombre: str
+    multiquery: bool = True
+    expansion: bool = True                 # léxico del corpus + grafo de conocimiento
+    prf_terms: Optional[int] = None        # 0 = sin PRF (una sola recuperación)
+    rerank_top_n: Optional[int] = None     # 0 = sin rerank
+    k_dense: Optional[int] = None
+    k_sparse: Optional[int] = None
+    top_k: Optional[int] = None            # candidatos que salen del híbrido
+    gate_ood: bool = True                  # gate semántico (embebe pregunta y contexto)
+
+    def hibrido(self, base: HybridParams) -> HybridParams:
+        cambios = {k: getattr(self, k) for k in ("k_dense", "k_sparse", "top_k") if getattr(self, k) is not None}
+        return replace(base, **cambios) if cambios else base
+
+
+PERFILES: Dict[str, PerfilPipeline] = {
+    "fast": PerfilPipeline("fast", multiquery=False, prf_terms=0, rerank_top_n=0,
+                           k_dense=8, k_sparse=4, top_k=6, gate_ood=False),
+    "balanced": PerfilPipeline("balanced", multiquery=False),
+    "accurate": PerfilPipeline("accurate"),
+}
+
+PIPELINE_PROFILE = os.getenv("PIPELINE_PROFILE", "accurate").lower()
+
+
+def resolver_perfil(nombre: Optional[str] = None) -> PerfilPipeline:
+    """Perfil pedido o, si no se pide ninguno, el del despliegue. ValueError si no existe."""
+    nombre = (nombre or PIPELINE_PROFILE).lower()
+    if nombre not in PERFILES:
+        raise ValueError(f"Perfil inválido: {nombre!r} (opciones: {', '.join(PERFILES)})")
+    return PERFILES[nombre]
@@ -0,0 +1,178 @@
+# profiler.py
+"""
+Profiler por muestreo para el proceso en producción (lo activa un admin).
+
+Mientras hay una sesión abierta, una fracción de las consultas de los endpoints
+decorados con `@perfilable` queda marcada; un hilo lee cada `intervalo_ms` la pila
+de esos hilos (`sys._current_frames`) y cuenta pilas iguales. No hay instrumentación
+por llamada: fuera de sesión el costo es un `if`.
+
+El reporte sale en formato "collapsed" (una línea `raiz;f1;f2 N` por pila), que
+entienden flamegraph.pl, speedscope e inferno, o como JSON con las funciones que
+más muestras acumulan (tokenización, torch, FAISS, rank_bm25, rapidfuzz...).
+"""
+import os, sys, time, random, threading
+from collections import Counter
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+PROFILER_INTERVALO_MS = float(os.getenv("PROFILER_INTERVALO_MS", "10"))
+PROFILER_MAX_S = float(os.getenv("PROFILER_MAX_S", "600"))  # tope de duración de una sesión
+_MAX_PROFUNDIDAD = 128
+
+
+def _ejecutar(fn: Callable, args, kwargs):
+    # marca de corte: la pila muestreada empieza debajo de este frame
+    return fn(*args, **kwargs)
+
+
+_CORTE = _ejecutar.__code__
+
+
+def _etiqueta(frame) -> str:
+    modulo = frame.f_globals.get("__name__") or os.path.basename(frame.f_code.co_filename)
+    return f"{modulo}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hilos: Dict[int, str] = {}  # ident -> raíz (endpoint) de lo que está corriendo
+        self._pilas: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.fraccion = 0.0
+        self.intervalo_s = PROFILER_INTERVALO_MS / 1000.0
+        self.inicio: Optional[float] = None
+        self.fin: Optional[float] = None
+        self.solicitudes: Counter = Counter()
+        self.muestras = 0
+
+    @property
+    def activo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---------- sesión ----------
+    def iniciar(self, fraccion: float = 0.1, intervalo_ms: float = PROFILER_INTERVALO_MS,
+                duracion_s: float = 60.0) -> dict:
+        """Abre una sesión nueva (descarta el reporte anterior). ValueError si los parámetros no tienen sentido."""
+        if not 0.0 < fraccion <= 1.0:
+            raise ValueError("fraccion debe estar en (0, 1]")
+        if intervalo_ms < 1.0:
+            raise ValueError("intervalo_ms debe ser >= 1")
+        self.detener()
+        with self._lock:
+            self._pilas.clear()
+            self.solicitudes.clear()
+            self.muestras = 0
+            self.fraccion = fraccion
+            self.intervalo_s = intervalo_ms / 1000.0
+            self.inicio = time.time()
+            self.fin = self.inicio + min(max(duracion_s, 1.0), PROFILER_MAX_S)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self.estado()
+
+    def detener(self) -> dict:
+        self._stop.set()
+        t = self._thread
+        if t and t.is_alive() and t is not threading.current_thread():
+            t.join(5)
+        return self.estado()
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "fraccion": self.fraccion,
+                "intervalo_ms": round(self.intervalo_s * 1000, 2),
+                "inicio": self.inicio,
+                "fin": self.fin,
+                "solicitudes": dict(self.solicitudes),
+                "muestras": self.muestras,
+            }
+
+    # ---------- marcado de hilos ----------
+    def perfilable(self, raiz: str):
+        """Decorador de endpoints (sync): muestrea `fraccion` de sus llamadas mientras haya sesión."""
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.activo or random.random() >= self.fraccion:
+                    return fn(*args, **kwargs)
+                with self._lock:
+                    self.solicitudes[raiz] += 1
+                return self._marcado(raiz, fn, args, kwargs)
+            return wrapper
+        return deco
+
+    def heredar(self, fn: Callable) -> Callable:
+        """Envuelve trabajo que se manda a un pool: si quien lo manda está muestreado, el hilo del pool también."""
+        raiz = self._hilos.get(threading.get_ident())
+        if raiz is None:
+            return fn
+        return lambda *args, **kwargs: self._marcado(raiz, fn, args, kwargs)
+
+    def _marcado(self, raiz: str, fn: Callable, args, kwargs):
+        ident = threading.get_ident()
+        previo = self._hilos.get(ident)
+        self._hilos[ident] = raiz
+        try:
+            return _ejecutar(fn, args, kwargs)
+        finally:
+            if previo is None:
+                self._hilos.pop(ident, None)
+            else:
+                self._hilos[ident] = previo
+
+    # ---------- muestreo ----------
+    def _run(self) -> None:
+        while not self._stop.wait(self.intervalo_s):
+            if time.time() >= self.fin:
+                break
+            hilos = dict(self._hilos)
+            if not hilos:
+                continue
+            frames = sys._current_frames()
+            pilas = []
+            for ident, raiz in hilos.items():
+                f = frames.get(ident)
+                pila = []
+                while f is not None and f.f_code is not _CORTE and len(pila) < _MAX_PROFUNDIDAD:
+                    pila.append(_etiqueta(f))
+                    f = f.f_back
+                if pila:
+                    pilas.append(";".join([raiz, *reversed(pila)]))
+            del frames
+            with self._lock:
+                self._pilas.update(pilas)
+                self.muestras += len(pilas)
+
+    # ---------- reporte ----------
+    def collapsed(self) -> str:
+        with self._lock:
+            return "".join(f"{pila} {n}\n" for pila, n in self._pilas.most_common())
+
+    def resumen(self, top: int = 30) -> dict:
+        """Muestras por función: `propias` (la función estaba arriba de la pila) y `total` (estaba en la pila)."""
+        propias, total = Counter(), Counter()
+        with self._lock:
+            for pila, n in self._pilas.items():
+                frames = pila.split(";")[1:]
+                if frames:
+                    propias[frames[-1]] += n
+                for fr in set(frames):
+                    total[fr] += n
+            muestras = self.muestras
+        return {
+            **self.estado(),
+            "propias": [{"funcion": f, "muestras": n, "pct": round(100 * n / muestras, 1)}
+                        for f, n in propias.most_common(top)] if muestras else [],
+            "total": [{"funcion": f, "muestras": n, "pct": round(100 * n / muestras, 1)}
+                      for f, n in total.most_common(top)] if muestras else [],
+        }
+
+
+# uno por proceso (con varios workers, cada uno muestrea lo suyo)
+sampling_profiler = SamplingProfiler()
@@ -1,13 +1,23 @@
 # rag_chain.py
-from typing import List, Tuple, Dict, Optional
-import os, re, unicodedata, json
+from typing import Callable, List, Tuple, Dict, Optional
+import os, re, time, unicodedata, json
+from collections import Counter
 import numpy as np
 from rapidfuzz import process, fuzz
 from langchain_openai import ChatOpenAI
 from langchain_core.documents import Document
 from retrievers import build_pro_retriever
+from vectorstore_langchain import INDEX_DIR, LEXICON_FILE, shard_dirs, current_index_dir, slug_coleccion
+from lexical_features import ChunkFeatures, load_chunk_features
+from knowledge_graph import expandir_con_grafo
 from embeddings_setup import dense
 from utils import registrar_consulta_no_resuelta
+from ttl_cache import TTLCache
+from dedup import origenes
+from llm_routing import router, es_timeout, LLM_TIMEOUT_GEN, LLM_TIMEOUT_AUX
+from pipeline_profiles import PerfilPipeline, PERFILES, resolver_perfil
+from deadline import Deadline, tiempos, tokens_para
+from componentes import componentes
 
 # ------------------------ Mensajes base ------------------------
 INSUFF_MSG = "No tengo información suficiente para responder a eso. Tu consulta será guardada y enviada al Help Desk. Gracias!"
@@ -32,11 +42,25 @@ def _make_llm(model_name: Optional[str] = None) -> ChatOpenAI:
     _ensure_openrouter_env()
     model = model_name or os.getenv("LLM_MODEL", "mistralai/mixtral-8x7b-instruct")
     max_toks = int(os.getenv("GEN_MAX_TOKENS", "800"))
-    return ChatOpenAI(model=model, temperature=0, max_tokens=max_toks)
+    # sin reintentos ocultos: el router mide cada intento y tras un timeout cae al modelo liviano
+    return ChatOpenAI(model=model, temperature=0, max_tokens=max_toks, timeout=LLM_TIMEOUT_GEN,
+                      max_retries=int(os.getenv("LLM_GEN_RETRIES", "0")))
 
-def _make_light_llm() -> ChatOpenAI:
+def _make_light_llm(max_tokens: int = 200, timeout: float = LLM_TIMEOUT_AUX) -> ChatOpenAI:
+    """Modelo liviano: MultiQuery, follow-ups y generación degradada bajo carga."""
+    _ensure_openrouter_env()
     model = os.getenv("LLM_QCONDENSE", os.getenv("LLM_MODEL", "mistralai/mixtral-8x7b-instruct"))
-    return ChatOpenAI(model=model, temperature=0, max_tokens=200)
+    return ChatOpenAI(model=model, temperature=0, max_tokens=max_tokens, timeout=timeout,
+                      max_retries=int(os.getenv("LLM_AUX_RETRIES", "1")))
+
+def _llm_compartido(fabrica, *args, **kwargs) -> ChatOpenAI:
+    """
+    Cliente del registro del proceso (sobrevive a los reindexados). La clave lleva la
+    fábrica, sus argumentos y las variables que lee, así un cambio de config crea otro.
+    """
+    cfg = tuple(os.getenv(k) for k in ("LLM_MODEL", "LLM_QCONDENSE", "GEN_MAX_TOKENS", "LLM_GEN_RETRIES", "LLM_AUX_RETRIES"))
+    clave = (fabrica, args, tuple(sorted(kwargs.items())), cfg)
+    return componentes.obtener("llm", clave, lambda: fabrica(*args, **kwargs))
 
 def _strip_insuff_appendix(text: str) -> str:
     t = (text or "").strip()
@@ -66,11 +90,15 @@ def _norm(s: str) -> str:
     s = s.lower().strip()
     return ''.join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
 
-def _has_anchor_terms(question: str, docs: List[Document]) -> bool:
+def _has_anchor_terms(question: str, docs: List[Document], feats: Optional[ChunkFeatures] = None) -> bool:
     toks = [t for t in _WORD.findall(_norm(question))]
     if not toks:
         return True
-    ctxn = _norm(" ".join(d.page_content for d in docs[:5]))
+    top = docs[:5]
+    if feats is not None and feats.has(top):
+        return feats.has_anchor_terms(toks, top)
+    # índice sin features (construido antes de chunk_id): normalizamos en caliente
+    ctxn = _norm(" ".join(d.page_content for d in top))
     return any(t in ctxn for t in toks)
 
 def _semantic_ood(question: str, docs: List[Document]) -> bool:
@@ -89,7 +117,8 @@ def _semantic_similarity(q: str, chunk: str) -> float:
     return _cosine(qv, cv)
 
 # ====== Léxico del corpus + expansión agnóstica (typos/jergas) ======
-def _load_vocab(path=os.path.join("indices", "lexicon.json")) -> list[str]:
+def _load_vocab(path: Optional[str] = None) -> list[str]:
+    path = path or os.path.join(current_index_dir(INDEX_DIR), LEXICON_FILE)
     try:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -125,9 +154,26 @@ _STOP = {
     "the","a","an","and","or","of","to","in","for","on","by","is","are","be","this","that","these","those"
 }
 
-def _prf_terms_from_docs(docs: list[Document], base_query: str, max_terms: int = 6) -> list[str]:
+def _formas_en_docs(terms: list[str], docs: list[Document]) -> list[str]:
+    """
+    Término normalizado (sin tildes) -> su forma más frecuente en el texto de `docs`
+    ("contrasena" -> "contraseña"): BM25 indexa las palabras tal como aparecen.
+    """
+    formas: dict[str, Counter] = {t: Counter() for t in terms}
+    for d in docs:
+        for w in _WORD.findall(d.page_content):
+            n = _norm(w)
+            if n in formas:
+                formas[n][w] += 1
+    return [formas[t].most_common(1)[0][0] if formas[t] else t for t in terms]
+
+def _prf_terms_from_docs(docs: list[Document], base_query: str, max_terms: int = 6,
+                         feats: Optional[ChunkFeatures] = None) -> list[str]:
     if not docs:
         return []
+    if feats is not None and feats.has(docs[:6]):
+        q_norm = set(_WORD.findall(_norm(base_query)))
+        return _formas_en_docs(feats.prf_terms(docs[:6], exclude=q_norm, max_terms=max_terms), docs[:6])
     q_toks = set(_tokens(base_query))
     counts: dict[str, int] = {}
     for d in docs[:6]:
@@ -136,7 +182,7 @@ def _prf_terms_from_docs(docs: list[Document], base_query: str, max_terms: int =
                 continue
             counts[t] = counts.get(t, 0) + 1
     ranked = sorted(counts.items(), key=lambda x: x[1], reverse=True)
-    terms = [w for w,_ in ranked if (not _VOCAB or w in _VOCAB)][:max_terms]
+    terms = [w for w,_ in ranked if (not _VOCAB or _norm(w) in _VOCAB)][:max_terms]  # léxico sin tildes
     return terms
 
 # ------------------------ Follow-ups genéricos ------------------------
@@ -239,14 +285,19 @@ def _choose_span(base: str, q: str) -> str:
     thresh = float(os.getenv("FOLLOWUP_MIN_SIM", "0.12"))
     return best if best and best_sim >= thresh else base
 
-def _answer_from_history(question: str, history: list[dict], model_name: Optional[str] = None) -> Tuple[str, list[dict]]:
+def _answer_from_history(question: str, history: list[dict], model_name: Optional[str] = None,
+                         llm: Optional[ChatOpenAI] = None) -> Tuple[str, list[dict]]:
+    """
+    Follow-up respondido sólo con la última respuesta; usa el modelo liviano (con
+    GEN_MAX_TOKENS, no el tope de las paráfrasis) salvo que se pase `llm`.
+    """
     base_full = _last_assistant_text(history)
     if not base_full:
         return INSUFF_MSG, []
     span = _choose_span(base_full, question)
     if not span:
         return INSUFF_MSG, []
-    llm = _make_llm(model_name)
+    llm = llm or _make_light_llm(max_tokens=int(os.getenv("GEN_MAX_TOKENS", "800")), timeout=LLM_TIMEOUT_GEN)
     msgs = [
         ("system",
          "Responde EXCLUSIVAMENTE en español. Usa SOLO el texto base provisto a continuación como fuente. "
@@ -256,65 +307,161 @@ def _answer_from_history(question: str, history: list[dict], model_name: Optiona
          f"Consulta del usuario:\n{question}\n\n"
          "Responde claro y, si corresponde, con pasos.")
     ]
-    out = (llm.invoke(msgs).content or "").strip()
+    try:
+        resp = router.invocar("historial", "light", llm.invoke, msgs)
+    except Exception as e:
+        if not es_timeout(e):
+            raise
+        return INSUFF_MSG, []
+    out = (resp.content or "").strip()
     if not out or _mentions_docs(out) or out == INSUFF_MSG:
         return INSUFF_MSG, []
     return out, []
 
-# ------------------------ Builder principal ------------------------
-def build_rag(model_name: Optional[str] = None):
-    llm = _make_llm(model_name)
-    retriever = build_pro_retriever(model_name=model_name or os.getenv("LLM_MODEL", "mistralai/mixtral-8x7b-instruct"))
-
-    def answer_fn(question: str, history: Optional[List[Dict]] = None) -> Tuple[str, List[Dict]]:
-        q = (question or "").strip()
-        if len(q) < 3:
-            registrar_consulta_no_resuelta(q)
-            return INSUFF_MSG, []
+# ------------------------ Contexto recuperado por conversación ------------------------
+# chunk_ids usados en la última respuesta de cada conversación: un follow-up los
+# re-puntúa antes de pagar expansión + dos recuperaciones + rerank.
+_CTX_CACHE = TTLCache(
+    maxsize=int(os.getenv("CTX_CACHE_MAX", "2048")),
+    ttl=float(os.getenv("CTX_CACHE_TTL", "900")),
+)
 
-        # 0) Si es follow-up genérico, probamos SOLO con historial
-        if _is_generic_followup(q):
-            out_hist, src_hist = _answer_from_history(q, history or [], model_name)
-            if out_hist != INSUFF_MSG:
-                return out_hist, src_hist
+def _previous_user_text(history: Optional[List[Dict]], q: str) -> str:
+    """Pregunta del turno anterior (el historial ya trae la actual al final)."""
+    users = [(m.get("content") or "").strip() for m in history or [] if m.get("role") == "user"]
+    if users and users[-1] == q:
+        users = users[:-1]
+    return users[-1] if users else ""
 
-        # ---- Reescritura agnóstica de la query ----
+def _cached_context(conversacion_id: Optional[int], retriever, colecciones: Optional[List[str]]) -> List[Document]:
+    if conversacion_id is None:
+        return []
+    permitidas = None if colecciones is None else {slug_coleccion(c) for c in colecciones}
+    docs = []
+    for cid in _CTX_CACHE.get(conversacion_id) or ():
+        d = retriever.documento(cid)  # None si el chunk ya no está en el índice vigente
+        if d is not None and (permitidas is None or d.metadata.get("coleccion") in permitidas):
+            docs.append(d)
+    return docs
+
+def _rescore_cached(q: str, docs: List[Document], retriever, ref: str = "") -> Tuple[List[Document], float]:
+    """
+    Ordena los chunks cacheados por coseno con el follow-up (+ la pregunta que los recuperó).
+    Los vectores de los chunks salen de FAISS: sólo se embebe la consulta.
+    """
+    qv = np.array(dense.embed_query(f"{ref} {q}".strip()))
+    sims = [_cosine(qv, cv) for cv in retriever.vectores([d.metadata["chunk_id"] for d in docs])]
+    order = sorted(range(len(docs)), key=lambda i: sims[i], reverse=True)
+    return [docs[i] for i in order], sims[order[0]]
+
+# ------------------------ Recuperación + gates ------------------------
+def recuperar_contexto(q: str, recuperar: Callable[[str], List[Document]],
+                       feats: Optional[ChunkFeatures] = None,
+                       perfil: Optional[PerfilPipeline] = None,
+                       deadline: Optional[Deadline] = None) -> Tuple[List[Document], Optional[str]]:
+    """
+    Expansión (léxico + grafo) -> recuperación -> PRF -> recuperación definitiva -> gates.
+    `recuperar(query)` hace cada búsqueda. Devuelve (docs, None) si hay contexto para
+    generar, o (docs, motivo) si un gate corta: "sin_contexto" | "ood" | "sim_baja".
+    Los umbrales (PRF_TERMS, CHUNK_MIN_SIM, OOD_MIN_SIM...) se leen en cada llamada.
+    `perfil`: etapas que corren (por defecto, todas).
+    `deadline`: el PRF se omite si otra recuperación como la primera no entra en lo que queda.
+    """
+    perfil = perfil or PERFILES["accurate"]
+    # ---- Reescritura agnóstica de la query ----
+    q_expanded = q
+    if perfil.expansion:
         # 1) Expansión tolerante a typos guiada por el LÉXICO del corpus (dominio-agnóstica)
         q_expanded = expand_query_corpus_aware(q)
-
-        # 2) Primera pasada de recuperación
-        docs_first = retriever.invoke(q_expanded)
-
+        # 1b) Entidades del grafo de conocimiento: suma sus `relaciones` a la query
+        graph_terms = expandir_con_grafo(q, max_terms=int(os.getenv("GRAPH_TERMS", "4")))
+        if graph_terms:
+            q_expanded = q_expanded + " " + " ".join(graph_terms)
+
+    # 2) Primera pasada de recuperación
+    t0 = time.perf_counter()
+    docs = recuperar(q_expanded)
+    dur_primera = time.perf_counter() - t0
+
+    max_prf = perfil.prf_terms if perfil.prf_terms is not None else int(os.getenv("PRF_TERMS", "6"))
+    if max_prf > 0 and deadline is not None and not deadline.alcanza(dur_primera):
+        deadline.omitir("prf")
+    elif max_prf > 0:
         # 3) PRF/RM3: extrae términos característicos de esos docs y re-busca
-        prf_terms = _prf_terms_from_docs(
-            docs_first, base_query=q, max_terms=int(os.getenv("PRF_TERMS", "6"))
-        )
-        q_final = q_expanded if not prf_terms else (q_expanded + " " + " ".join(prf_terms))
+        prf_terms = _prf_terms_from_docs(docs, base_query=q, max_terms=max_prf, feats=feats)
+        # 4) Recuperación definitiva con query expandida + PRF (sin términos, vale la primera)
+        if prf_terms:
+            docs = recuperar(q_expanded + " " + " ".join(prf_terms))
 
-        # 4) Recuperación definitiva con query expandida + PRF
-        docs = retriever.invoke(q_final)
+    # Gates de seguridad previos a la generación
+    total_len = sum(len(d.page_content) for d in docs)
+    min_chars = int(os.getenv("MIN_CONTEXT_CHARS", "10"))
+    if (len(docs) < 1) or (total_len < min_chars):
+        return docs, "sin_contexto"
 
-        # Gates de seguridad previos a la generación
-        total_len = sum(len(d.page_content) for d in docs)
-        min_chars = int(os.getenv("MIN_CONTEXT_CHARS", "10"))
-        if (len(docs) < 1) or (total_len < min_chars):
-            out_hist, src_hist = _answer_from_history(q, history or [], model_name)
-            if out_hist == INSUFF_MSG: registrar_consulta_no_resuelta(q)
-            return out_hist, src_hist
+    if (perfil.gate_ood and _semantic_ood(q, docs)) or not _has_anchor_terms(q, docs, feats):
+        return docs, "ood"
 
-        if _semantic_ood(q, docs) or not _has_anchor_terms(q, docs):
-            out_hist, src_hist = _answer_from_history(q, history or [], model_name)
-            if out_hist == INSUFF_MSG: registrar_consulta_no_resuelta(q)
-            return out_hist, src_hist
+    # similitud mínima por chunk (corte ANTES del LLM); el híbrido ya trae el coseno con `q`
+    sims = [d.metadata.get("sim") for d in docs]
+    if None in sims:
+        sims = [_semantic_similarity(q, d.page_content) for d in docs]
+    if max(sims, default=0.0) < float(os.getenv("CHUNK_MIN_SIM", "0.35")):
+        return docs, "sim_baja"
 
-        # similitud mínima por chunk (corte ANTES del LLM)
-        min_sim = float(os.getenv("CHUNK_MIN_SIM", "0.35"))
-        best_sim = max((_semantic_similarity(q, d.page_content) for d in docs), default=0.0)
-        if best_sim < min_sim:
-            out_hist, src_hist = _answer_from_history(q, history or [], model_name)
-            if out_hist == INSUFF_MSG: registrar_consulta_no_resuelta(q)
-            return out_hist, src_hist
+    return docs, None
 
+# ------------------------ Builder principal ------------------------
+def build_rag(model_name: Optional[str] = None, index_dir: Optional[str] = None):
+    """
+    `index_dir`: versión concreta del índice a servir (por defecto, la publicada).
+    Todo (shards, léxico, features) se lee de ese mismo directorio.
+    """
+    global _VOCAB
+    index_dir = index_dir or current_index_dir(INDEX_DIR)
+    _VOCAB = _load_vocab(os.path.join(index_dir, LEXICON_FILE))  # el léxico cambia en cada reindexado
+    feats = load_chunk_features(list(shard_dirs(index_dir).values()), stopwords=_STOP)
+    # clientes del LLM y modelos: del registro del proceso; lo único nuevo por versión son los datos
+    llm = _llm_compartido(_make_llm, model_name)
+    # modelo liviano: paráfrasis de MultiQuery con tope corto (llm_aux); follow-ups y, bajo
+    # carga severa, la generación con los tokens y el timeout de la generación (llm_light)
+    llm_aux = _llm_compartido(_make_light_llm)
+    gen_max_tokens = int(os.getenv("GEN_MAX_TOKENS", "800"))
+    llm_light = _llm_compartido(_make_light_llm, max_tokens=gen_max_tokens, timeout=LLM_TIMEOUT_GEN)
+    retriever = build_pro_retriever(
+        model_name=model_name or os.getenv("LLM_MODEL", "mistralai/mixtral-8x7b-instruct"),
+        faiss_dir=index_dir,
+        llm=llm_aux,
+    )
+
+    def _recuperar(q: str, colecciones: Optional[List[str]], nivel: int, referencia: str,
+                   perfil: PerfilPipeline, deadline: Deadline) -> List[Document]:
+        """
+        Recuperación con MultiQuery salvo sobrecarga, perfil sin MultiQuery o falta de
+        tiempo; si el LLM falla, sin paráfrasis. Cada chunk vuelve con `metadata["sim"]`:
+        coseno con `referencia` (la pregunta original).
+        """
+        kw = dict(colecciones=colecciones, referencia=referencia,
+                  params=perfil.hibrido(retriever.params), rerank_top_n=perfil.rerank_top_n,
+                  deadline=deadline)
+        if not perfil.multiquery:
+            router.registrar("multiquery", f"perfil_{perfil.nombre}")
+            return retriever.invoke(q, multiquery=False, **kw)
+        if nivel >= 1:
+            router.registrar("multiquery", "omitida")
+            return retriever.invoke(q, multiquery=False, **kw)
+        if not deadline.alcanza(tiempos.estimar("multiquery")):
+            router.registrar("multiquery", "deadline")
+            deadline.omitir("multiquery")
+            return retriever.invoke(q, multiquery=False, **kw)
+        return retriever.invoke(q, **kw)  # el router mide sólo la llamada de paráfrasis
+
+    def _historial(q: str, history: Optional[List[Dict]]) -> Tuple[str, List[Dict]]:
+        # respuesta que ve el usuario: modelo liviano pero con los tokens de la generación
+        return _answer_from_history(q, history or [], model_name, llm=llm_light)
+
+    def _generar(q: str, docs: List[Document], nivel: int = 0,
+                 deadline: Optional[Deadline] = None) -> Tuple[str, List[Dict]]:
         # 3) Generación
         limit = int(os.getenv("CTX_CHAR_LIMIT", "8000"))
         context = "\n\n".join(d.page_content for d in docs)[:limit]
@@ -325,7 +472,22 @@ def build_rag(model_name: Optional[str] = None):
              f"Información relevante:\n{context}\n\n"
              f"Recuerda: si no hay datos suficientes, responde exactamente: \"{INSUFF_MSG}\".")
         ]
-        out = (llm.invoke(msgs).content or "").strip()
+        liviano = nivel >= 2
+        # con poco tiempo, menos tokens de salida (la generación es lo único que no se omite)
+        kw = {}
+        max_toks = tokens_para(deadline, gen_max_tokens)
+        if max_toks < gen_max_tokens:
+            kw["max_tokens"] = max_toks
+            deadline.degradar("generacion", f"max_tokens={max_toks}")
+        try:
+            with tiempos.medir("generacion"):
+                resp = router.invocar("generacion", "light" if liviano else "full",
+                                      (llm_light if liviano else llm).invoke, msgs, **kw)
+        except Exception as e:
+            if liviano or not es_timeout(e):
+                raise
+            resp = router.invocar("generacion", "light_tras_timeout", llm_light.invoke, msgs, **kw)
+        out = (resp.content or "").strip()
         out = _strip_insuff_appendix(out)
 
         # 4) Post-chequeo
@@ -334,10 +496,11 @@ def build_rag(model_name: Optional[str] = None):
             return INSUFF_MSG, []
 
         # 5) Fuentes únicas
+        # (un chunk deduplicado al indexar cita todos sus orígenes)
         seen, uniq = set(), []
-        for d in docs:
-            src = d.metadata.get("source", "desconocido")
-            page = d.metadata.get("page")
+        for o in (o for d in docs for o in origenes(d)):
+            src = o.get("source") or "desconocido"
+            page = o.get("page")
             key = (src, page)
             if key not in seen:
                 seen.add(key)
@@ -345,4 +508,68 @@ def build_rag(model_name: Optional[str] = None):
 
         return out, uniq
 
+    def _responder(q: str, docs: List[Document], conversacion_id: Optional[int], nivel: int,
+                   deadline: Deadline) -> Tuple[str, List[Dict]]:
+        out, fuentes = _generar(q, docs, nivel, deadline)
+        if conversacion_id is not None and out != INSUFF_MSG:
+            ids = list(dict.fromkeys(d.metadata["chunk_id"] for d in docs if d.metadata.get("chunk_id")))
+            if ids:
+                _CTX_CACHE.set(conversacion_id, ids)
+        return out, fuentes
+
+    def answer_fn(question: str, history: Optional[List[Dict]] = None,
+                  colecciones: Optional[List[str]] = None,
+                  conversacion_id: Optional[int] = None,
+                  perfil: Optional[str] = None,
+                  deadline: Optional[Deadline] = None,
+                  meta: Optional[Dict] = None) -> Tuple[str, List[Dict]]:
+        """
+        `colecciones`: si se indica, sólo se buscan esos shards (None = todos).
+        `conversacion_id`: habilita reusar los chunks de la respuesta anterior en follow-ups.
+        `perfil`: fast | balanced | accurate (None = PIPELINE_PROFILE). ValueError si no existe.
+        `deadline`: presupuesto de la consulta (por defecto, RAG_SLA_S desde ahora; sin SLA si es 0).
+        `meta`: si se pasa un dict, se completa con las etapas omitidas o degradadas.
+        """
+        p = resolver_perfil(perfil)
+        deadline = deadline or Deadline()
+        try:
+            with router.solicitud() as nivel:
+                return _answer(question, history, colecciones, conversacion_id, nivel, p, deadline)
+        finally:
+            if meta is not None:
+                meta.update(deadline.meta())
+
+    def _answer(question: str, history: Optional[List[Dict]], colecciones: Optional[List[str]],
+                conversacion_id: Optional[int], nivel: int, perfil: PerfilPipeline,
+                deadline: Deadline) -> Tuple[str, List[Dict]]:
+        q = (question or "").strip()
+        if len(q) < 3:
+            registrar_consulta_no_resuelta(q)
+            return INSUFF_MSG, []
+
+        min_sim = float(os.getenv("CHUNK_MIN_SIM", "0.35"))
+
+        # 0) Si es follow-up genérico, probamos SOLO con historial
+        if _is_generic_followup(q):
+            out_hist, src_hist = _historial(q, history)
+            if out_hist != INSUFF_MSG:
+                return out_hist, src_hist
+            # 0b) ...y después con los chunks del turno anterior, re-puntuados
+            cached = _cached_context(conversacion_id, retriever, colecciones)
+            if cached:
+                ranked, best = _rescore_cached(q, cached, retriever, ref=_previous_user_text(history, q))
+                if best >= min_sim:
+                    return _responder(q, ranked, conversacion_id, nivel, deadline)
+
+        docs, motivo = recuperar_contexto(
+            q, lambda consulta: _recuperar(consulta, colecciones, nivel, q, perfil, deadline), feats, perfil,
+            deadline,
+        )
+        if motivo is not None:
+            out_hist, src_hist = _historial(q, history)
+            if out_hist == INSUFF_MSG: registrar_consulta_no_resuelta(q)
+            return out_hist, src_hist
+
+        return _responder(q, docs, conversacion_id, nivel, deadline)
+
     return answer_fn
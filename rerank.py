@@ -1,16 +1,38 @@
-from typing import List
+import os
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
 from sentence_transformers import CrossEncoder
 
+from componentes import componentes
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+
+def _cross_encoder(model_name: str):
+    """El del servicio de inferencia si está configurado y sirve ese modelo; si no, local."""
+    if INFERENCE_SOCKET and model_name == RERANK_MODEL:
+        from inference_worker import RemoteCrossEncoder, cliente_compartido, ERRORES_CONEXION
+        try:
+            return RemoteCrossEncoder(cliente_compartido(INFERENCE_SOCKET))
+        except ERRORES_CONEXION as e:
+            print(f"[WARN] inference_worker no disponible en {INFERENCE_SOCKET} ({e}); se carga el reranker local.")
+    return CrossEncoder(model_name)
+
 class CrossEncoderReranker:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", top_n: int = 8):
-        self.model = CrossEncoder(model_name)
+    def __init__(self, model_name: str = RERANK_MODEL, top_n: int = 8):
+        # el modelo se carga una vez por proceso; cada reindexado sólo crea este envoltorio
+        self.model = componentes.obtener("cross_encoder", (model_name, INFERENCE_SOCKET),
+                                         lambda: _cross_encoder(model_name))
         self.top_n = top_n
 
-    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+    def puntuar(self, query: str, docs: List[Document], top_n: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """Top-n (por defecto, el del reranker) como (Document, score del cross-encoder), de mayor a menor."""
         if not docs:
-            return docs
+            return []
         pairs = [(query, d.page_content) for d in docs]
         scores = self.model.predict(pairs).tolist()
         ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-        return [d for d, _ in ranked[: self.top_n]]
+        return ranked[: self.top_n if top_n is None else top_n]
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        return [d for d, _ in self.puntuar(query, docs)]
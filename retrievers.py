@@ -1,46 +1,194 @@
 # retrievers.py
 import os
-# retrievers.py
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Iterable, Sequence, Tuple
+
+import numpy as np
+from pydantic import Field
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 from langchain_openai import ChatOpenAI
-from langchain.retrievers.multi_query import MultiQueryRetriever  
+from langchain.retrievers.multi_query import MultiQueryRetriever
 
-from vectorstore_langchain import load_faiss, build_faiss, build_bm25, INDEX_DIR
+from vectorstore_langchain import (
+    load_faiss, load_bm25, build_faiss, build_bm25, shard_dirs, current_index_dir, slug_coleccion, INDEX_DIR
+)
+from hybrid_search import HybridShard, HybridParams, normalizar
+from deadline import Deadline, tiempos
+from llm_routing import router
+from profiler import sampling_profiler
+from componentes import componentes
 from rerank import CrossEncoderReranker  # si no querés rerank, comentá esta import
 
-def ensure_faiss(dir_path: str | None = None) -> FAISS:
-    dir_path = dir_path or INDEX_DIR
+# búsquedas por shard en paralelo (FAISS libera el GIL)
+_SHARD_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("SHARD_WORKERS", "4")), thread_name_prefix="shard")
+
+def ensure_index(dir_path: str | None = None) -> Dict[str, str]:
+    """Shards de `dir_path` (por defecto, la versión publicada); si no hay índice, lo construye."""
+    dirs = shard_dirs(dir_path or current_index_dir(INDEX_DIR))
+    if not dirs and dir_path is None:
+        build_faiss(INDEX_DIR)
+        dirs = shard_dirs(current_index_dir(INDEX_DIR))
+    return dirs
+
+def hybrid_shard(dir_path: str, faiss_vs=None) -> HybridShard:
+    """Híbrido dense+sparse de UN shard."""
+    faiss_vs = faiss_vs or load_faiss(dir_path)
     try:
-        return load_faiss(dir_path)
-    except Exception:
-        return build_faiss(dir_path)
+        bm25 = load_bm25(dir_path)
+    except RuntimeError:
+        bm25 = build_bm25()  # índice previo a los shards: sin bm25.pkl en disco
+    return HybridShard(faiss_vs, bm25)
+
+class ShardedRetriever(BaseRetriever):
+    """Busca todas las variantes de la consulta en los shards (uno por colección) y fusiona el top-k."""
+    shards: Dict[str, HybridShard]
+    embeddings: Any
+    params: HybridParams = Field(default_factory=HybridParams)
+    por_chunk: Dict[str, Document] = {}  # chunk_id -> Document de los docstores FAISS
+
+    def documento(self, chunk_id: str) -> Optional[Document]:
+        return self.por_chunk.get(chunk_id)
+
+    def vectores(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        """Embeddings normalizados de los chunks, leídos de FAISS (sin volver a pasar el texto por el modelo)."""
+        filas = []
+        for cid in chunk_ids:
+            v = next((v for s in self.shards.values() if (v := s.vector(cid)) is not None), None)
+            if v is None:
+                raise KeyError(cid)
+            filas.append(v)
+        return normalizar(np.asarray(filas, dtype=np.float32))
 
-def base_hybrid(dir_path: str | None = None) -> EnsembleRetriever:
-    faiss_vs = ensure_faiss(dir_path)
-    dense_ret = faiss_vs.as_retriever(search_type="similarity", search_kwargs={"k": 12})
-    sparse_ret: BM25Retriever = build_bm25()
-    return EnsembleRetriever(retrievers=[dense_ret, sparse_ret], weights=[0.85, 0.5])
+    def restringir(self, colecciones: Optional[Iterable[str]]) -> "ShardedRetriever":
+        if colecciones is None:
+            return self
+        wanted = {slug_coleccion(c) for c in colecciones}
+        return ShardedRetriever(
+            shards={c: r for c, r in self.shards.items() if c in wanted}, embeddings=self.embeddings,
+            params=self.params, por_chunk=self.por_chunk,
+        )
 
-def build_pro_retriever(model_name: str | None = None, faiss_dir: str | None = None):
+    def buscar(self, variantes: List[str], referencia: Optional[str] = None,
+               params: Optional[HybridParams] = None) -> List[Tuple[Document, float]]:
+        """
+        (Document, score) fusionando todas las `variantes`; `metadata["sim"]` es el coseno
+        de cada chunk con `referencia` (por defecto, la primera variante).
+        `params`: k/pesos/fusión de esta consulta (por defecto, los del retriever).
+        """
+        params = params or self.params
+        variantes = list(dict.fromkeys(v.strip() for v in variantes if v and v.strip()))
+        shards = list(self.shards.values())
+        if not shards or not variantes:
+            return []
+        referencia = (referencia or "").strip() or variantes[0]
+        textos = list(dict.fromkeys([*variantes, referencia]))
+        vecs = normalizar(np.asarray(self.embeddings.embed_documents(textos), dtype=np.float32))
+        q_vecs, ref_vec = vecs[:len(variantes)], vecs[textos.index(referencia)]
+        if len(shards) == 1:
+            return shards[0].buscar(variantes, q_vecs, ref_vec, params)
+        results = _SHARD_POOL.map(sampling_profiler.heredar(lambda s: s.buscar(variantes, q_vecs, ref_vec, params)),
+                                  shards)
+        pares = sorted((p for r in results for p in r), key=lambda p: p[1], reverse=True)
+        return pares[:params.top_k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [d for d, _ in self.buscar([query])]
+
+def build_sharded(dir_path: str | None = None, params: Optional[HybridParams] = None) -> ShardedRetriever:
+    dirs = ensure_index(dir_path)
+    if not dirs:
+        raise RuntimeError("No hay documentos indexados.")
+    stores = {c: load_faiss(d) for c, d in dirs.items()}
+    por_chunk = {
+        d.metadata["chunk_id"]: d
+        for vs in stores.values() for d in vs.docstore._dict.values() if d.metadata.get("chunk_id")
+    }
+    return ShardedRetriever(
+        shards={c: hybrid_shard(dirs[c], vs) for c, vs in stores.items()},
+        embeddings=next(iter(stores.values())).embeddings,
+        params=params or HybridParams(),
+        por_chunk=por_chunk,
+    )
+
+def build_pro_retriever(model_name: str | None = None, faiss_dir: str | None = None, llm=None,
+                        params: Optional[HybridParams] = None, rerank_top_n: Optional[int] = None):
+    """
+    `llm`: modelo para las paráfrasis de MultiQuery (por defecto, `model_name`).
+    `params`: k, pesos y fusión del híbrido (por defecto, de las variables HYBRID_*).
+    `rerank_top_n`: chunks que deja el cross-encoder (por defecto RERANK_TOP_N; 0 = sin rerank).
+    """
     model_name = model_name or os.getenv("LLM_MODEL", "mistralai/mixtral-8x7b-instruct")
-    llm = ChatOpenAI(model=model_name, temperature=0)
-    base = base_hybrid(faiss_dir)
-    mqr = MultiQueryRetriever.from_llm(retriever=base, llm=llm)
+    llm = llm or componentes.obtener("llm", (ChatOpenAI, model_name), lambda: ChatOpenAI(model=model_name, temperature=0))
+    sharded = build_sharded(faiss_dir, params)
+    # sólo usamos su cadena prompt -> LLM -> líneas: la búsqueda de las variantes es nuestra
+    paraphrase_chain = MultiQueryRetriever.from_llm(retriever=sharded, llm=llm).llm_chain
 
     # activá/desactivá rerank por env (RERANK=0 para desactivar)
     use_rerank = os.getenv("RERANK", "1") != "0"
-    reranker = CrossEncoderReranker(top_n=8) if use_rerank else None
+    if rerank_top_n is None:
+        rerank_top_n = int(os.getenv("RERANK_TOP_N", "8"))
+    reranker = CrossEncoderReranker(top_n=rerank_top_n) if use_rerank and rerank_top_n > 0 else None
 
     class FinalRetriever:
+        params = sharded.params  # base sobre la que cada consulta puede ajustar k/top_k
+
         # API nueva
-        def invoke(self, q: str):
-            docs = mqr.invoke(q)  # evita DeprecationWarning
-            if reranker:
-                return reranker.rerank(q, docs)
-            return docs
+        def buscar(self, q: str, colecciones: Optional[Iterable[str]] = None, multiquery: bool = True,
+                   referencia: Optional[str] = None, params: Optional[HybridParams] = None,
+                   rerank_top_n: Optional[int] = None,
+                   deadline: Optional[Deadline] = None) -> List[Tuple[Document, float]]:
+            """
+            (Document, score) ordenados: score del cross-encoder si hay rerank, si no el del híbrido.
+            `multiquery=False`: una sola búsqueda con `q` (sin llamar al LLM). Si el LLM de las
+            paráfrasis falla, también: se busca sólo con `q`.
+            `referencia`: texto contra el que se calcula `metadata["sim"]` (por defecto, `q`).
+            `params` / `rerank_top_n`: tamaños de esta consulta (`rerank_top_n=0`: sin rerank).
+            `deadline`: si el tiempo no alcanza, el rerank puntúa menos candidatos (o ninguno).
+            """
+            # sólo los shards que el usuario puede ver
+            sub = sharded.restringir(colecciones)
+            if not sub.shards:
+                return []
+            variantes = [q]
+            if multiquery:
+                # paráfrasis + la original, todas fusionadas en una sola pasada
+                try:
+                    with tiempos.medir("multiquery"):
+                        variantes = [*router.invocar("multiquery", "ok", paraphrase_chain.invoke, {"question": q}), q]
+                except Exception as e:
+                    print(f"[WARN] MultiQuery: {type(e).__name__}: {e}")
+            pares = sub.buscar(variantes, referencia=referencia or q, params=params)
+            if not (reranker and rerank_top_n != 0) or not pares:
+                return pares
+            top_n = reranker.top_n if rerank_top_n is None else rerank_top_n
+            pool = len(pares)
+            if deadline is not None and deadline.activo:
+                # candidatos (en orden del híbrido) que el cross-encoder alcanza a puntuar
+                pool = min(pool, int(deadline.disponible() / max(tiempos.estimar("rerank"), 1e-6)))
+                if pool < min(len(pares), top_n):
+                    deadline.omitir("rerank")
+                    return pares[:top_n]
+                if pool < len(pares):
+                    deadline.degradar("rerank", f"{pool}/{len(pares)} candidatos")
+            docs = [d for d, _ in pares[:pool]]
+            with tiempos.medir("rerank", len(docs)):
+                return reranker.puntuar(q, docs, top_n=rerank_top_n)
+
+        def invoke(self, q: str, colecciones: Optional[Iterable[str]] = None, multiquery: bool = True,
+                   referencia: Optional[str] = None, params: Optional[HybridParams] = None,
+                   rerank_top_n: Optional[int] = None, deadline: Optional[Deadline] = None) -> List[Document]:
+            return [d for d, _ in self.buscar(q, colecciones, multiquery, referencia, params, rerank_top_n,
+                                              deadline)]
+
+        def documento(self, chunk_id: str) -> Optional[Document]:
+            """Chunk indexado por su chunk_id (None si ya no está en esta versión del índice)."""
+            return sharded.documento(chunk_id)
+
+        def vectores(self, chunk_ids: Sequence[str]) -> np.ndarray:
+            return sharded.vectores(chunk_ids)
 
         # Compat con código viejo
         def get_relevant_documents(self, q: str):
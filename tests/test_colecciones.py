@@ -0,0 +1,49 @@
+# tests/test_colecciones.py
+"""
+Restricción de colecciones por usuario: `null` = todas, `[]` = ninguna.
+Corre sobre el workspace descartable de los benchmarks (SQLite + corpus sintético + LLM local).
+"""
+import pytest
+
+from benchmarks.harness import preparar_workspace, generar_corpus, registrar_documentos, instalar_fake_llm
+
+PREGUNTA = {"pregunta": "¿Cómo puedo conectarse a la VPN corporativa?"}
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    preparar_workspace(str(tmp_path_factory.mktemp("ws")))
+    registrar_documentos(generar_corpus("uploads", n_docs=2, paginas=2))
+    import vectorstore_langchain
+    vectorstore_langchain.build_faiss(vectorstore_langchain.INDEX_DIR)
+    instalar_fake_llm()
+
+    import database, main
+    from auth import crear_token
+    from fastapi.testclient import TestClient
+    from models import Usuario
+
+    with database.SessionLocal() as db:
+        # id explícito: en SQLite el BIGINT del modelo no es autoincremental
+        db.add(Usuario(id=1, username="admin", password_hash="-", activo=True, is_admin=True))
+        db.add(Usuario(id=2, username="usuario", password_hash="-", activo=True))
+        db.commit()
+    headers = lambda uid: {"Authorization": f"Bearer {crear_token(sub=str(uid))}"}
+    return TestClient(main.app), headers(1), headers(2)
+
+
+def test_lista_vacia_no_ve_ninguna_coleccion(api):
+    client, admin, usuario = api
+    assert client.get("/buscar", params=PREGUNTA, headers=usuario).json()["fuentes"]
+
+    r = client.patch("/admin/users/2/colecciones", json={"colecciones": []}, headers=admin)
+    assert r.status_code == 200
+    assert r.json()["colecciones"] == []
+    assert client.get("/buscar", params=PREGUNTA, headers=usuario).json()["fuentes"] == []
+
+
+def test_null_vuelve_a_todas(api):
+    client, admin, usuario = api
+    r = client.patch("/admin/users/2/colecciones", json={"colecciones": None}, headers=admin)
+    assert r.json()["colecciones"] is None
+    assert client.get("/buscar", params=PREGUNTA, headers=usuario).json()["fuentes"]
@@ -1,9 +1,12 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+# un único splitter por proceso (no guarda estado entre llamadas)
+_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=900, chunk_overlap=120,
+    separators=["\n\n", "\n", ". ", " ", ""]
+)
+
 def split_text(text: str, meta: dict) -> list[Document]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=900, chunk_overlap=120,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
-    return [Document(page_content=c, metadata=meta) for c in splitter.split_text(text)]
+    # cada chunk lleva su propia copia de metadata (luego se le agrega chunk_id)
+    return [Document(page_content=c, metadata=dict(meta)) for c in _SPLITTER.split_text(text)]
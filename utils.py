@@ -1,20 +1,39 @@
+import os, time, queue, atexit, threading
+from datetime import datetime
+from typing import Iterator
 import fitz  # PyMuPDF
 from sqlalchemy import text
 from database import engine
 
-def extraer_texto_pdf(file_path: str) -> list[tuple[int, str]]:
-    paginas = []
+def iterar_paginas_pdf(file_path: str) -> Iterator[tuple[int, str]]:
+    """Igual que extraer_texto_pdf, pero de a una página (no retiene el PDF entero)."""
     try:
         with fitz.open(file_path) as doc:
             for i, page in enumerate(doc):
                 texto = (page.get_text() or "").strip()
                 if texto:
-                    paginas.append((i + 1, texto))  # Página 1-indexada
+                    yield i + 1, texto  # Página 1-indexada
     except Exception as e:
         print(f"[WARN] PyMuPDF: {type(e).__name__}: {e}")
-    return paginas
+
+def extraer_texto_pdf(file_path: str) -> list[tuple[int, str]]:
+    return list(iterar_paginas_pdf(file_path))
+
+def contar_paginas_pdf(file_path: str) -> int:
+    try:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
 
 # --- Preguntas no resueltas ---------------------------------------------------
+# Write-behind: el request sólo encola; un hilo de fondo inserta en lotes
+# multi-fila (por tamaño o por intervalo) y vacía la cola al apagar.
+UNRESOLVED_BATCH = int(os.getenv("UNRESOLVED_BATCH", "50"))
+UNRESOLVED_FLUSH_SEC = float(os.getenv("UNRESOLVED_FLUSH_SEC", "2"))
+UNRESOLVED_QUEUE_MAX = int(os.getenv("UNRESOLVED_QUEUE_MAX", "10000"))
+UNRESOLVED_RETRIES = int(os.getenv("UNRESOLVED_RETRIES", "3"))
+
 def _ensure_unresolved_table() -> None:
     """Crea la tabla si no existe (id, pregunta, fecha)."""
     with engine.begin() as conn:
@@ -26,17 +45,125 @@ def _ensure_unresolved_table() -> None:
             ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
         """))
 
-def registrar_consulta_no_resuelta(pregunta: str) -> None:
-    """Inserta la pregunta en consultas_no_resueltas (ignora strings vacíos)."""
-    try:
-        p = (pregunta or "").strip()
-        if not p:
+def _insert_unresolved_batch(batch: list[tuple[str, datetime]]) -> None:
+    rows, params = [], {}
+    for i, (p, f) in enumerate(batch):
+        rows.append(f"(:p{i}, :f{i})")
+        params[f"p{i}"], params[f"f{i}"] = p, f
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO consultas_no_resueltas (pregunta, fecha) VALUES " + ", ".join(rows)),
+            params
+        )
+
+class _UnresolvedWriter:
+    _STOP = object()
+
+    def __init__(self, batch_size: int, flush_sec: float, maxsize: int):
+        self.batch_size = max(1, batch_size)
+        self.flush_sec = flush_sec
+        self.q: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.table_ready = False
+        self.dropped = 0   # cola llena
+        self.perdidos = 0  # lotes que la DB no tomó tras UNRESOLVED_RETRIES intentos
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="unresolved-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, pregunta: str) -> None:
+        if not (self._thread and self._thread.is_alive()):
+            self.start()
+        try:
+            # hora local, igual que el DEFAULT CURRENT_TIMESTAMP que reemplaza
+            self.q.put_nowait((pregunta, datetime.now()))
+        except queue.Full:
+            self.dropped += 1
+            print(f"[WARN] cola de consultas no resueltas llena; descartadas: {self.dropped}")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        t = self._thread
+        if not (t and t.is_alive()):
+            return
+        self.q.put(self._STOP)
+        t.join(timeout)
+
+    def _flush(self, batch: list) -> None:
+        if not batch:
             return
+        # un corte transitorio de la DB no se lleva el lote entero: se reintenta antes de descartarlo
+        for intento in range(1, UNRESOLVED_RETRIES + 1):
+            try:
+                if not self.table_ready:
+                    _ensure_unresolved_table()
+                    self.table_ready = True
+                _insert_unresolved_batch(batch)
+                return
+            except Exception as e:
+                print(f"[ERROR] registrar_consulta_no_resuelta ({len(batch)} filas, intento {intento}): "
+                      f"{type(e).__name__}: {e}")
+                if intento < UNRESOLVED_RETRIES:
+                    time.sleep(0.2 * intento)
+        self.perdidos += len(batch)
+        print(f"[WARN] consultas no resueltas perdidas: {self.perdidos}")
+
+    def _run(self) -> None:
+        while True:
+            item = self.q.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_sec
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                # vaciar lo que haya quedado detrás del centinela
+                rest = []
+                while True:
+                    try:
+                        rest.append(self.q.get_nowait())
+                    except queue.Empty:
+                        break
+                self._flush([r for r in rest if r is not self._STOP])
+                return
+
+_unresolved_writer = _UnresolvedWriter(UNRESOLVED_BATCH, UNRESOLVED_FLUSH_SEC, UNRESOLVED_QUEUE_MAX)
+
+def iniciar_registro_no_resueltas() -> None:
+    """Al arrancar: asegura la tabla una sola vez y levanta el hilo escritor."""
+    try:
         _ensure_unresolved_table()
-        with engine.begin() as conn:
-            conn.execute(
-                text("INSERT INTO consultas_no_resueltas (pregunta) VALUES (:p)"),
-                {"p": p}
-            )
+        _unresolved_writer.table_ready = True
     except Exception as e:
-        print(f"[ERROR] registrar_consulta_no_resuelta: {type(e).__name__}: {e}")
+        print(f"[WARN] consultas_no_resueltas: {type(e).__name__}: {e}")
+    _unresolved_writer.start()
+
+def detener_registro_no_resueltas() -> None:
+    """Al apagar: inserta lo pendiente y detiene el hilo escritor."""
+    _unresolved_writer.stop()
+
+atexit.register(detener_registro_no_resueltas)
+
+def registrar_consulta_no_resuelta(pregunta: str) -> None:
+    """Encola la pregunta para consultas_no_resueltas (ignora strings vacíos). No toca la DB."""
+    p = (pregunta or "").strip()
+    if not p:
+        return
+    _unresolved_writer.put(p)
@@ -1,5 +1,7 @@
-import os, json, re
-from typing import List, Tuple
+import os, json, re, time, shutil, pickle, statistics
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator
 from collections import Counter
 
 from sqlalchemy import text
@@ -9,13 +11,30 @@ from langchain_core.documents import Document
 
 from database import SessionLocal
 from text_pipeline import split_text
-from utils import extraer_texto_pdf
+from utils import iterar_paginas_pdf, contar_paginas_pdf
+from lexical_features import AcumuladorFeatures, FEATURES_FILE
+from ingest_pipeline import ingestar
+from dedup import MinHashDeduper, origenes, DEDUP_ENABLED
 
-INDEX_DIR = "indices"   # índice único
+INDEX_DIR = "indices"   # raíz: indices/versions/<version>/<coleccion>/ + indices/CURRENT
 UPLOAD_DIR = "uploads"  # donde guardás los PDFs
+DEFAULT_COLLECTION = "general"
+
+BM25_FILE = "bm25.pkl"
+LEXICON_FILE = "lexicon.json"              # léxico global (expansión de consulta)
+LEXICON_COUNTS_FILE = "lexicon_counts.json"  # conteos por shard, para recombinar el global
+MANIFEST_FILE = "manifest.json"
+STATS_FILE = "stats.json"     # stats del shard (viaja con el shard cuando se enlaza)
+CURRENT_FILE = "CURRENT"      # puntero (atómico) a la versión publicada
+VERSIONS_DIR = "versions"
+LOCK_FILE = ".build.lock"
+KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+# documento "con pocos chunks": chunks/página por debajo de esta fracción de la mediana del corpus
+FEW_CHUNKS_RATIO = float(os.getenv("INDEX_FEW_CHUNKS_RATIO", "0.25"))
 
 # -------------------- Helpers --------------------
 _WORD = re.compile(r"[a-záéíóúüñ0-9]{3,}", re.IGNORECASE)
+_SLUG = re.compile(r"[^a-z0-9_-]+")
 
 def _norm(s: str) -> str:
     import unicodedata
@@ -27,53 +46,442 @@ def __get_embeddings():
     from embeddings_setup import dense
     return dense
 
+def slug_coleccion(nombre: Optional[str]) -> str:
+    """Nombre de colección apto para directorio ('Recursos Humanos' -> 'recursos_humanos')."""
+    s = _SLUG.sub("_", _norm((nombre or "").strip())).strip("_")
+    return s or DEFAULT_COLLECTION
+
+def shard_dir(coleccion: str, dir_path: str = INDEX_DIR) -> str:
+    return os.path.join(dir_path, slug_coleccion(coleccion))
+
+def list_collections(dir_path: str = INDEX_DIR) -> List[str]:
+    """Colecciones con shard construido (subdirectorios con index.faiss)."""
+    if not os.path.isdir(dir_path):
+        return []
+    return sorted(
+        c for c in os.listdir(dir_path)
+        if os.path.exists(os.path.join(dir_path, c, "index.faiss"))
+    )
+
+# -------------------- Versiones publicadas --------------------
+def index_version(dir_path: str = INDEX_DIR) -> Optional[str]:
+    """Versión publicada (contenido de indices/CURRENT) o None. Lectura barata para polling."""
+    try:
+        with open(os.path.join(dir_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_dir(version: Optional[str], dir_path: str = INDEX_DIR) -> str:
+    # sin versión publicada: layouts previos (shards o índice plano en la raíz)
+    return os.path.join(dir_path, VERSIONS_DIR, version) if version else dir_path
+
+def current_index_dir(dir_path: str = INDEX_DIR) -> str:
+    return version_dir(index_version(dir_path), dir_path)
+
+def has_index(dir_path: str = INDEX_DIR) -> bool:
+    return bool(shard_dirs(current_index_dir(dir_path)))
+
+def _publish(dir_path: str, version: str) -> None:
+    tmp = os.path.join(dir_path, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(dir_path, CURRENT_FILE))
+
+def _gc_versions(dir_path: str, keep: int = KEEP_VERSIONS) -> None:
+    """Borra versiones viejas; se conservan algunas para workers que todavía estén cargando."""
+    root = os.path.join(dir_path, VERSIONS_DIR)
+    current = index_version(dir_path)
+    versions = sorted(os.listdir(root)) if os.path.isdir(root) else []
+    for v in versions[:-max(1, keep)]:
+        if v != current:
+            shutil.rmtree(os.path.join(root, v), ignore_errors=True)
+
+@contextmanager
+def build_lock(dir_path: str = INDEX_DIR):
+    """Lock exclusivo entre procesos: un solo build a la vez sobre `dir_path`."""
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, LOCK_FILE), "a+") as fh:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.5)
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+def _link_tree(src: str, dst: str) -> None:
+    """Copia un shard sin cambios a la nueva versión (hardlinks si el FS lo permite)."""
+    def _link(a, b):
+        try:
+            os.link(a, b)
+        except OSError:
+            shutil.copy2(a, b)
+    shutil.copytree(src, dst, copy_function=_link)
+
+def shard_dirs(dir_path: str) -> Dict[str, str]:
+    """{coleccion: directorio} de los shards de una versión concreta (layout previo: un único shard en la raíz)."""
+    cols = list_collections(dir_path)
+    if cols:
+        return {c: os.path.join(dir_path, c) for c in cols}
+    if _has_legacy_index(dir_path):
+        return {DEFAULT_COLLECTION: dir_path}
+    return {}
+
+def _has_legacy_index(dir_path: str) -> bool:
+    # layout previo a los shards: indices/index.faiss directamente
+    return os.path.exists(os.path.join(dir_path, "index.faiss"))
+
+def _remove_legacy_index(dir_path: str) -> None:
+    for fn in ("index.faiss", "index.pkl", FEATURES_FILE):
+        p = os.path.join(dir_path, fn)
+        if os.path.exists(p):
+            os.remove(p)
+
 # -------------------- Lectura de documentos --------------------
-def get_all_documents() -> List[Tuple[int, str]]:
+def get_all_documents(colecciones: Optional[Iterable[str]] = None) -> List[Tuple[int, str, str]]:
     with SessionLocal() as db:
-        rows = db.execute(text("SELECT id, nombre_archivo FROM documentos")).fetchall()
-        return [(r[0], r[1]) for r in rows]
+        rows = db.execute(text("SELECT id, nombre_archivo, coleccion FROM documentos")).fetchall()
+    out = [(r[0], r[1], slug_coleccion(r[2])) for r in rows]
+    if colecciones is not None:
+        wanted = {slug_coleccion(c) for c in colecciones}
+        out = [r for r in out if r[2] in wanted]
+    return out
 
-def to_documents() -> List[Document]:
-    """Lee PDFs desde /uploads para conservar número de página en metadata."""
-    docs: List[Document] = []
-    for doc_id, nombre in get_all_documents():
+def iter_paginas(filas: Iterable[Tuple[int, str, str]]) -> Iterator[Tuple[dict, str]]:
+    """(metadata, texto) página a página, leyendo PDFs desde /uploads de a uno."""
+    for doc_id, nombre, coleccion in filas:
         pdf_path = os.path.join(UPLOAD_DIR, nombre)
         if not os.path.exists(pdf_path):
             # Si el archivo falta, salteamos (así preservamos pages correctas)
             continue
-        for page_num, page_text in extraer_texto_pdf(pdf_path):
-            meta = {"doc_id": doc_id, "source": nombre, "page": page_num}
-            docs.extend(split_text(page_text, meta=meta))
+        for page_num, page_text in iterar_paginas_pdf(pdf_path):
+            yield {"doc_id": doc_id, "source": nombre, "page": page_num, "coleccion": coleccion}, page_text
+
+def chunks_de_pagina(pagina: Tuple[dict, str]) -> List[Document]:
+    meta, page_text = pagina
+    docs = split_text(page_text, meta=meta)
+    for i, d in enumerate(docs):
+        # id estable del chunk: mismo valor en FAISS y en BM25
+        d.metadata["chunk_id"] = f"{meta['doc_id']}:{meta['page']}:{i}"
+    return docs
+
+def to_documents(colecciones: Optional[Iterable[str]] = None) -> List[Document]:
+    """Lee PDFs desde /uploads para conservar número de página en metadata."""
+    docs: List[Document] = []
+    for pagina in iter_paginas(get_all_documents(colecciones)):
+        docs.extend(chunks_de_pagina(pagina))
     return docs
 
 # -------------------- Construcción de índice + léxico --------------------
-def build_lexicon(docs: List[Document], out_path=os.path.join(INDEX_DIR, "lexicon.json"), max_terms: int = 8000):
+def _lexicon_counts(docs: List[Document]) -> Counter:
     cnt = Counter()
     for d in docs:
         for t in _WORD.findall(_norm(d.page_content)):
             cnt[t] += 1
-    vocab = [w for w, _ in cnt.most_common(max_terms)]
-    os.makedirs(INDEX_DIR, exist_ok=True)
+    return cnt
+
+def build_lexicon(docs: List[Document], out_path=os.path.join(INDEX_DIR, LEXICON_FILE), max_terms: int = 8000) -> List[str]:
+    vocab = [w for w, _ in _lexicon_counts(docs).most_common(max_terms)]
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(vocab, f, ensure_ascii=False)
+    return vocab
 
-def build_faiss(dir_path: str = INDEX_DIR) -> FAISS:
-    os.makedirs(dir_path, exist_ok=True)
-    docs = to_documents()
-    if not docs:
+def build_global_lexicon(dir_path: str = INDEX_DIR, max_terms: int = 8000) -> List[str]:
+    """Recombina los conteos de todos los shards en indices/lexicon.json."""
+    total = Counter()
+    for c in list_collections(dir_path):
+        try:
+            with open(os.path.join(dir_path, c, LEXICON_COUNTS_FILE), "r", encoding="utf-8") as f:
+                total.update(json.load(f))
+        except Exception:
+            continue
+    vocab = [w for w, _ in total.most_common(max_terms)]
+    with open(os.path.join(dir_path, LEXICON_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    return vocab
+
+def build_shard(coleccion: str, docs: List[Document], dir_path: str = INDEX_DIR, max_terms: int = 8000,
+                vs: Optional[FAISS] = None, filas: Optional[List[Tuple[int, str, str]]] = None,
+                t_inicio: Optional[float] = None, features: Optional[AcumuladorFeatures] = None) -> FAISS:
+    """FAISS + BM25 + léxico + features + stats de UNA colección en indices/<coleccion>/.
+    `vs`: FAISS ya armado con esos `docs` (ingesta en streaming); si falta, se embebe acá.
+    `filas`: documentos de la colección según la BD (para contar también los que no dieron chunks).
+    `features`: léxico + features acumulados lote a lote en la ingesta; si falta, se calculan de `docs`.
+    El BM25 sí necesita los tokens de TODOS los chunks en memoria a la vez (rank_bm25 calcula
+    el idf sobre el corpus entero y BM25Retriever guarda los Document): ese pico es del tamaño del shard."""
+    t_inicio = t_inicio or time.perf_counter()
+    out = shard_dir(coleccion, dir_path)
+    os.makedirs(out, exist_ok=True)
+    if vs is None:
+        vs = FAISS.from_documents(docs, embedding=__get_embeddings())
+    vs.save_local(out)
+    with open(os.path.join(out, BM25_FILE), "wb") as f:
+        pickle.dump(BM25Retriever.from_documents(docs), f)
+    if features is None:
+        features = AcumuladorFeatures()
+        features.agregar(docs)
+    cnt = features.conteos
+    with open(os.path.join(out, LEXICON_COUNTS_FILE), "w", encoding="utf-8") as f:
+        json.dump(dict(cnt.most_common(max_terms)), f, ensure_ascii=False)
+    vocab = [w for w, _ in cnt.most_common(max_terms)]
+    # Features léxicos por chunk (anclas + PRF sin procesar strings por consulta)
+    features.escribir(vocab, os.path.join(out, FEATURES_FILE))
+    stats = _shard_stats(vs, docs, filas, out, lexico_terminos=len(vocab))
+    stats["build_s"] = round(time.perf_counter() - t_inicio, 3)
+    with open(os.path.join(out, STATS_FILE), "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    return vs
+
+# -------------------- Estadísticas del índice --------------------
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _stats_documentos(docs: List[Document], filas: Optional[List[Tuple[int, str, str]]]) -> List[dict]:
+    """Chunks y páginas con texto por documento (incluye los que no produjeron ningún chunk).
+    Un chunk deduplicado cuenta para cada documento de sus `origenes`."""
+    chunks: Counter = Counter()
+    paginas: Dict[int, set] = {}
+    nombres: Dict[int, str] = {}
+    for d in docs:
+        for o in origenes(d):
+            chunks[o["doc_id"]] += 1
+            paginas.setdefault(o["doc_id"], set()).add(o["page"])
+            nombres.setdefault(o["doc_id"], o["source"])
+    filas = filas if filas is not None else [(i, n, None) for i, n in nombres.items()]
+    out = []
+    for doc_id, nombre, _ in filas:
+        pdf_path = os.path.join(UPLOAD_DIR, nombre)
+        out.append({
+            "doc_id": doc_id,
+            "archivo": nombre,
+            "paginas_pdf": contar_paginas_pdf(pdf_path) if os.path.exists(pdf_path) else 0,
+            "paginas_con_texto": len(paginas.get(doc_id, ())),
+            "chunks": chunks.get(doc_id, 0),
+        })
+    return out
+
+def _shard_stats(vs: FAISS, docs: List[Document], filas, out: str, lexico_terminos: int) -> dict:
+    ntotal, dim = int(vs.index.ntotal), int(vs.index.d)
+    archivos = {n: os.path.getsize(os.path.join(out, n)) for n in os.listdir(out)}
+    return {
+        "chunks": ntotal,
+        "dimension": dim,
+        "disco_bytes": archivos,
+        # estimaciones: FAISS plano = ntotal*dim float32; BM25 ~ su tamaño serializado
+        "memoria_estimada_bytes": {
+            "faiss_vectores": ntotal * dim * 4,
+            "docstore_texto": sum(len(d.page_content.encode("utf-8")) for d in docs),
+            "bm25": archivos.get(BM25_FILE, 0),
+        },
+        "lexico_terminos": lexico_terminos,
+        "chunks_fusionados": sum(1 for d in docs if len(origenes(d)) > 1),
+        "documentos": _stats_documentos(docs, filas),
+    }
+
+def _distribucion(valores: List[int]) -> dict:
+    if not valores:
+        return {}
+    v = sorted(valores)
+    return {
+        "min": v[0],
+        "p50": v[len(v) // 2],
+        "p90": v[min(len(v) - 1, int(len(v) * 0.9))],
+        "max": v[-1],
+        "media": round(sum(v) / len(v), 2),
+    }
+
+def _alertas(documentos: List[dict]) -> List[dict]:
+    """Documentos sin chunks o con muchos menos chunks por página que la mediana del corpus."""
+    cpp = [d["chunks"] / d["paginas_pdf"] for d in documentos if d["chunks"] and d["paginas_pdf"]]
+    mediana = statistics.median(cpp) if cpp else 0.0
+    alertas = []
+    for d in documentos:
+        if d["chunks"] == 0:
+            motivo = "sin_chunks"
+        elif d["paginas_pdf"] and mediana and d["chunks"] / d["paginas_pdf"] < FEW_CHUNKS_RATIO * mediana:
+            motivo = "pocos_chunks"
+        else:
+            continue
+        alertas.append(d | {"motivo": motivo, "paginas_sin_texto": max(d["paginas_pdf"] - d["paginas_con_texto"], 0)})
+    return alertas
+
+def documentos_indexados(dir_path: str) -> List[dict]:
+    """Distribución de chunks por documento de una versión (lee el stats.json de cada shard)."""
+    out = []
+    for c in list_collections(dir_path):
+        try:
+            with open(os.path.join(dir_path, c, STATS_FILE), "r", encoding="utf-8") as f:
+                out.extend(d | {"coleccion": c} for d in json.load(f).get("documentos", []))
+        except Exception:
+            continue  # shard construido antes de las stats
+    return out
+
+def _version_stats(out: str, sin_indice: List[dict], lexico_global: int, build_s: float) -> dict:
+    colecciones = {}
+    for c in list_collections(out):
+        try:
+            with open(os.path.join(out, c, STATS_FILE), "r", encoding="utf-8") as f:
+                st = json.load(f)
+        except Exception:
+            st = {}
+        st.pop("documentos", None)
+        st["disco_total_bytes"] = _dir_bytes(os.path.join(out, c))
+        colecciones[c] = st
+    documentos = documentos_indexados(out) + sin_indice
+    memoria = Counter()
+    for st in colecciones.values():
+        memoria.update(st.get("memoria_estimada_bytes", {}))
+    return {
+        "build_s": round(build_s, 3),
+        "chunks": sum(st.get("chunks", 0) for st in colecciones.values()),
+        "dimension": next((st["dimension"] for st in colecciones.values() if "dimension" in st), None),
+        "disco_bytes": _dir_bytes(out),
+        "memoria_estimada_bytes": dict(memoria),
+        "lexico_global_terminos": lexico_global,
+        "documentos": len(documentos),
+        "chunks_por_documento": _distribucion([d["chunks"] for d in documentos]),
+        "colecciones": colecciones,
+        "alertas": _alertas(documentos),
+    }
+
+def read_manifest(dir_path: str = INDEX_DIR) -> Optional[dict]:
+    """Manifest de la versión publicada (None si no hay o es un índice previo al versionado)."""
+    try:
+        with open(os.path.join(current_index_dir(dir_path), MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def build_faiss(dir_path: str = INDEX_DIR, colecciones: Optional[Iterable[str]] = None) -> Dict[str, FAISS]:
+    """
+    Construye una NUEVA versión del índice en indices/versions/<version>/ y la
+    publica de forma atómica en indices/CURRENT. Sólo se reconstruyen los shards
+    de `colecciones` (todos si es None); el resto se enlaza desde la versión vigente.
+    Un lock de archivo garantiza un único build a la vez entre procesos.
+    Devuelve {coleccion: FAISS} de los shards reconstruidos.
+    """
+    with build_lock(dir_path):
+        base_version = index_version(dir_path)
+        base = version_dir(base_version, dir_path)
+        if colecciones is not None and (base_version is None or _has_legacy_index(base)):
+            colecciones = None  # primera versión publicada: se migra todo
+        targets = None if colecciones is None else {slug_coleccion(c) for c in colecciones}
+
+        t0 = time.perf_counter()
+        version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        out = version_dir(version, dir_path)
+        os.makedirs(out)
+        try:
+            built, info = _build_version(out, base, targets)
+            stats = _version_stats(out, info["sin_indice"], info["lexico_terminos"], time.perf_counter() - t0)
+        except Exception:
+            shutil.rmtree(out, ignore_errors=True)  # nunca se publica una versión a medias
+            raise
+        with open(os.path.join(out, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": version,
+                "base": base_version,
+                "creado": datetime.utcnow().isoformat(),
+                "colecciones": list_collections(out),
+                "reconstruidas": sorted(built),
+                "ingesta": info["ingesta"],
+                "stats": stats,
+            }, f, ensure_ascii=False, indent=2)
+
+        # se publica aunque quede vacía: así los demás workers también sueltan el índice
+        _publish(dir_path, version)
+        if base_version is None:
+            # layouts previos en la raíz: ya migrados a la versión publicada
+            _remove_legacy_index(dir_path)
+            for c in list_collections(dir_path):
+                shutil.rmtree(os.path.join(dir_path, c), ignore_errors=True)
+        _gc_versions(dir_path)
+
+    if not list_collections(out):
         raise RuntimeError("No hay documentos para indexar.")
-    vs = FAISS.from_documents(docs, embedding=__get_embeddings())
-    vs.save_local(dir_path)
+    return built
+
+def _build_version(out: str, base: str, targets: Optional[set]) -> Tuple[Dict[str, FAISS], dict]:
+    """
+    Arma el contenido de una versión: shards reconstruidos + shards enlazados + léxico global.
+    Cada shard se ingiere en streaming (página -> chunk -> lote embebido -> FAISS.add).
+    Devuelve los shards construidos e info para el manifest: stats por etapa de la ingesta,
+    documentos de colecciones que no produjeron ningún chunk y tamaño del léxico global.
+    """
+    filas_por_coleccion: Dict[str, List[Tuple[int, str, str]]] = {}
+    for fila in get_all_documents(targets):
+        filas_por_coleccion.setdefault(fila[2], []).append(fila)
+
+    built: Dict[str, FAISS] = {}
+    ingesta: Dict[str, dict] = {}
+    sin_indice: List[dict] = []
+    if targets is not None:
+        for c in list_collections(base):
+            if c not in targets:
+                _link_tree(os.path.join(base, c), os.path.join(out, c))
+        # colecciones sin shard (ningún chunk) que no se tocan: siguen figurando en las stats
+        try:
+            with open(os.path.join(base, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                previas = json.load(f).get("stats", {}).get("alertas", [])
+        except Exception:
+            previas = []
+        sin_indice.extend(
+            {k: v for k, v in a.items() if k not in ("motivo", "paginas_sin_texto")}
+            for a in previas if a.get("coleccion") not in targets and not os.path.isdir(os.path.join(out, a.get("coleccion", "")))
+        )
+    for c, filas in filas_por_coleccion.items():
+        t_inicio = time.perf_counter()
+        dedup = MinHashDeduper() if DEDUP_ENABLED else None
+        features = AcumuladorFeatures()
+        vs, stats = ingestar(iter_paginas(filas), chunks_de_pagina, __get_embeddings(), dedup=dedup,
+                             por_lote=features.agregar)
+        if vs is None:
+            sin_indice.extend(d | {"coleccion": c} for d in _stats_documentos([], filas))
+            continue
+        docs = list(vs.docstore._dict.values())  # los mismos Document del docstore (para BM25 y stats)
+        built[c] = build_shard(c, docs, out, vs=vs, filas=filas, t_inicio=t_inicio, features=features)
+        ingesta[c] = stats
     # Construye un léxico del corpus para expansión de consulta agnóstica
-    build_lexicon(docs)
-    return vs
+    vocab = build_global_lexicon(out)
+    return built, {"ingesta": ingesta, "sin_indice": sin_indice, "lexico_terminos": len(vocab)}
 
-def load_faiss(dir_path: str = INDEX_DIR) -> FAISS:
-    os.makedirs(dir_path, exist_ok=True)
+def load_faiss(dir_path: str) -> FAISS:
     return FAISS.load_local(dir_path, embeddings=__get_embeddings(), allow_dangerous_deserialization=True)
 
-def build_bm25() -> BM25Retriever:
-    docs = to_documents()
+def load_bm25(dir_path: str) -> BM25Retriever:
+    path = os.path.join(dir_path, BM25_FILE)
+    if not os.path.exists(path):
+        raise RuntimeError(f"No hay BM25 en {dir_path}.")
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def build_bm25(docs: Optional[List[Document]] = None) -> BM25Retriever:
+    docs = to_documents() if docs is None else docs
     if not docs:
         raise RuntimeError("No hay documentos para BM25.")
     return BM25Retriever.from_documents(docs)